@@ -7,4 +7,29 @@ DB_SERVER = os.getenv("DB_SERVER")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
-SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
\ No newline at end of file
+SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
+# Douglas-Peucker tolerance in pixels for returned contours. 0 disables it.
+CONTOUR_TOLERANCE = float(os.getenv("CONTOUR_TOLERANCE", "1.0"))
+# Replace wall contours with axis-aligned rectangles
+SNAP_WALLS = os.getenv("SNAP_WALLS", "false").lower() in ("1", "true", "yes")
+
+# Mock detection model: random seed, simulated inference time in seconds per
+# detect() call and an optional directory of recorded detections to replay
+MOCK_SEED = int(os.getenv("MOCK_SEED")) if os.getenv("MOCK_SEED") else None
+MOCK_LATENCY = float(os.getenv("MOCK_LATENCY", "0"))
+MOCK_REPLAY_DIR = os.getenv("MOCK_REPLAY_DIR")
+
+# Detection runtime: "keras" builds the model from the weights in ./coco,
+# "savedmodel" and "tflite" run a model exported with mrcnn/export.py.
+# "tflite" is for portability: its TF Select ops make it about 2x slower than
+# "keras" on CPU.
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "keras").lower()
+EXPORTED_MODEL_DIR = os.getenv("EXPORTED_MODEL_DIR", "./exported")
+DETECTION_THREADS = int(os.getenv("DETECTION_THREADS")) if os.getenv("DETECTION_THREADS") else None
+
+# 3D model generation: plan scale in meters per pixel and heights in meters
+MODEL_SCALE = float(os.getenv("MODEL_SCALE", "0.01"))
+WALL_HEIGHT = float(os.getenv("WALL_HEIGHT", "2.7"))
+DOOR_HEIGHT = float(os.getenv("DOOR_HEIGHT", "2.1"))
+WINDOW_SILL = float(os.getenv("WINDOW_SILL", "0.9"))
+WINDOW_TOP = float(os.getenv("WINDOW_TOP", "2.1"))
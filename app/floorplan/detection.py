@@ -9,7 +9,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 from mrcnn.config import Config
 from mrcnn.model import MaskRCNN
-from mrcnn import visualize
+from mrcnn.export import ExportedModel
+
+from app.config import DETECTION_BACKEND, EXPORTED_MODEL_DIR, DETECTION_THREADS
+
+from .postprocess import CLASS_NAMES, build_elements
+from .render import render_instances
+from .results import save_detections
 
 class FloorPlanConfig(Config):
     """
@@ -25,11 +31,28 @@ class FloorPlanConfig(Config):
     RPN_ANCHOR_SCALES = (32, 64, 128, 256, 512)  # Anchor sizes
     TRAIN_ROIS_PER_IMAGE = 200
     MAX_GT_INSTANCES = 100
+    INFERENCE_MASK_DTYPE = "uint8"  # Masks are only thresholded at 0.5
     
-def load_model():
+def load_model(backend=DETECTION_BACKEND, export_dir=EXPORTED_MODEL_DIR):
     """
     Load the pre-trained Mask R-CNN model with updated TensorFlow compatibility.
+
+    Args:
+        backend: "keras" to build the model and load its weights, or
+            "savedmodel" or "tflite" to run a model exported with
+            mrcnn/export.py. All return a model with the same detect().
+        export_dir: Directory of the exported model
+
+    Returns:
+        A MaskRCNN, or an ExportedModel for the exported backends
     """
+    if backend in ("savedmodel", "tflite"):
+        if not os.path.isdir(export_dir):
+            raise FileNotFoundError(f"Exported model not found: {export_dir}")
+        return ExportedModel(export_dir, runtime=backend, num_threads=DETECTION_THREADS)
+    if backend != "keras":
+        raise ValueError(f"Unknown detection backend: {backend}")
+
     config = FloorPlanConfig()
 
     # Create the Mask R-CNN model
@@ -43,7 +66,9 @@ def load_model():
     model.load_weights(weights_path, by_name=True, exclude=["mrcnn_class_logits", "mrcnn_bbox_fc", "mrcnn_bbox", "mrcnn_mask"])
     return model
 
-def detect_objects(image_path, output_path, model, return_json=False):
+def detect_objects(image_path, output_path, model, return_json=False,
+                   tolerance=None, snap_walls=None, render=True,
+                   detections_path=None):
     """
     Perform object detection on the preprocessed floorplan image.
     
@@ -52,6 +77,11 @@ def detect_objects(image_path, output_path, model, return_json=False):
         output_path: Path to save the output image with visualized detections
         model: Loaded Mask R-CNN model
         return_json: Whether to return JSON formatted results
+        tolerance: Contour simplification tolerance in pixels, see build_elements
+        snap_walls: Whether to snap wall contours to rectangles, see build_elements
+        render: Whether to render the output image now. If False, it can be
+            rendered later from detections_path with render_overlay
+        detections_path: Optional .npz path to store the compact detection result
         
     Returns:
         If return_json is True, returns a dictionary with detection results
@@ -63,18 +93,25 @@ def detect_objects(image_path, output_path, model, return_json=False):
         raise FileNotFoundError(f"Image not found: {image_path}")
     
     # Perform detection
-    results = model.detect([image], verbose=1)
+    results = model.detect([image], verbose=1, sparse_masks=True)
     r = results[0]
 
-    # Visualize and save the results
-    class_names = ['BG', 'Wall', 'Window', 'Door']
-    output_image = visualize.display_instances(
-        image, r['rois'], r['masks'], r['class_ids'], class_names, r['scores']
-    )
+    # Store the compact result so the output image can be rendered on demand
+    if detections_path:
+        save_detections(detections_path, r, os.path.abspath(image_path))
+
+    if render:
+        # Visualize and save the results
+        output_image = render_instances(
+            image, r['rois'], r['masks'], r['class_ids'], CLASS_NAMES, r['scores']
+        )
 
-    # Save the output image
-    output_file_path = os.path.abspath(output_path)
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    cv2.imwrite(output_file_path, output_image)
-    print(f"Output saved to: {output_file_path}")
+        # Save the output image
+        output_file_path = os.path.abspath(output_path)
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        cv2.imwrite(output_file_path, output_image)
+        print(f"Output saved to: {output_file_path}")
+    # Return JSON-formatted results if requested
+    if return_json:
+        return build_elements(r, CLASS_NAMES, tolerance=tolerance, snap_walls=snap_walls)
     return None
@@ -1,6 +1,40 @@
+import json
+import struct
+
 import cv2
 import numpy as np
 
+from app.config import MODEL_SCALE, WALL_HEIGHT, DOOR_HEIGHT, WINDOW_SILL, WINDOW_TOP
+from .postprocess import CLASS_NAMES
+from .results import replace_atomically
+from .vectorize import point_segment_distance
+
+# Unit cube faces in a right-handed (a, b, c) frame: 4 corners each, counter
+# clockwise seen from outside, and the face normal
+CUBE_CORNERS = np.array([
+    [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1],  # +a
+    [0, 0, 0], [0, 0, 1], [0, 1, 1], [0, 1, 0],  # -a
+    [0, 1, 0], [0, 1, 1], [1, 1, 1], [1, 1, 0],  # +b
+    [0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1],  # -b
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],  # +c
+    [0, 0, 0], [0, 1, 0], [1, 1, 0], [1, 0, 0],  # -c
+], dtype=np.float32)
+CUBE_NORMALS = np.repeat(np.array([
+    [1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]
+], dtype=np.float32), 4, axis=0)
+CUBE_TRIANGLES = (np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32) +
+                  4 * np.arange(6, dtype=np.uint32)[:, None]).ravel()
+
+# glTF constants
+GLB_MAGIC = 0x46546C67
+GLB_JSON = 0x4E4F534A
+GLB_BIN = 0x004E4942
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
 def generate_image(detected_image_path, output_path):
     """
     Generate a new image with distinct colors for walls, windows, and doors.
@@ -10,7 +44,7 @@ def generate_image(detected_image_path, output_path):
     """
     # Load detected image
     image = cv2.imread(detected_image_path)
-    
+
     # Define colors for walls, windows, and doors
     wall_color = [0, 255, 0]   # Green
     window_color = [255, 0, 0] # Blue
@@ -24,6 +58,247 @@ def generate_image(detected_image_path, output_path):
     # Save the final image
     cv2.imwrite(output_path, colored_image)
 
+
+def opening_intervals(segments, thickness, openings):
+    """
+    Assign each door and window to the wall segment it sits in.
+
+    Args:
+        segments: [S, (x1, y1, x2, y2)] wall centerlines in pixels
+        thickness: [S] wall thicknesses in pixels
+        openings: List of (type, [x1, y1, x2, y2]) with type "Door" or "Window"
+
+    Returns:
+        A list of (segment index, start, end, type) with start and end the
+        distance in pixels along the segment from its first point
+    """
+    if not len(segments) or not openings:
+        return []
+    boxes = np.array([bbox for _, bbox in openings], dtype=np.float64).reshape(-1, 4)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    distance, _ = point_segment_distance(centers, segments)
+    # An opening belongs to a wall if its center is within the wall, or
+    # within half its own smaller side, e.g. a door box that includes the
+    # door swing
+    reach = np.maximum(thickness[None] / 2,
+                       np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])[:, None] / 2)
+    distance = np.where(distance <= reach + 1, distance, np.inf)
+
+    d = segments[:, 2:] - segments[:, :2]
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    directions = d / np.maximum(lengths, 1e-6)[:, None]
+    intervals = []
+    for o in np.flatnonzero(np.isfinite(distance).any(axis=1)):
+        s = distance[o].argmin()
+        x1, y1, x2, y2 = boxes[o]
+        corners = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+        along = (corners - segments[s, :2]) @ directions[s]
+        start, end = max(along.min(), 0), min(along.max(), lengths[s])
+        if end > start:
+            intervals.append((int(s), start, end, openings[o][0]))
+    return intervals
+
+
+def wall_boxes(graph, openings=(), scale=MODEL_SCALE, wall_height=WALL_HEIGHT,
+               door_height=DOOR_HEIGHT, window_sill=WINDOW_SILL, window_top=WINDOW_TOP):
+    """
+    Split the walls of a wall graph into solid boxes around their openings.
+
+    Doors leave the wall above door_height, windows leave it below
+    window_sill and above window_top.
+
+    Args:
+        graph: Wall graph from vectorize_walls()
+        openings: List of (type, [x1, y1, x2, y2]) doors and windows in pixels
+        scale: Meters per pixel
+        wall_height, door_height, window_sill, window_top: Heights in meters
+
+    Returns:
+        [B, (x, z, ux, uz, start, end, bottom, top, half thickness)] float32
+        boxes in meters. (x, z) is the segment start on the floor, (ux, uz)
+        its unit direction, start and end are distances along it.
+    """
+    nodes = np.array(graph["nodes"], dtype=np.float64).reshape(-1, 2)
+    edges = np.array([s["nodes"] for s in graph["segments"]], dtype=np.int64).reshape(-1, 2)
+    thickness = np.array([s["thickness"] for s in graph["segments"]], dtype=np.float64)
+    if not len(edges):
+        return np.zeros((0, 9), dtype=np.float32)
+    segments = np.concatenate([nodes[edges[:, 0]], nodes[edges[:, 1]]], axis=1)
+    d = segments[:, 2:] - segments[:, :2]
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    directions = d / np.maximum(lengths, 1e-6)[:, None]
+
+    # Extend walls by half their thickness at junctions to close the corners
+    degree = np.bincount(edges.ravel(), minlength=len(nodes))
+    extend = (degree[edges] > 1) * thickness[:, None] / 2
+    starts, ends = -extend[:, 0], lengths + extend[:, 1]
+
+    # Height ranges cut out by each kind of opening
+    cuts = {"Door": (0.0, door_height), "Window": (window_sill, window_top)}
+    by_segment = {}
+    for s, start, end, kind in opening_intervals(segments, thickness, list(openings)):
+        by_segment.setdefault(s, []).append((start * scale, end * scale) + cuts[kind])
+
+    # Full height walls, [S, (start, end, bottom, top)]
+    spans = [np.stack([starts * scale, ends * scale,
+                       np.zeros(len(edges)), np.full(len(edges), wall_height)], axis=1)]
+    owners = [np.arange(len(edges))]
+    for s, cut in by_segment.items():
+        pieces = []
+        breaks = np.unique(np.clip([starts[s] * scale, ends[s] * scale] +
+                                   [c[0] for c in cut] + [c[1] for c in cut],
+                                   starts[s] * scale, ends[s] * scale))
+        for a, b in zip(breaks[:-1], breaks[1:]):
+            # Solid height ranges between the openings that cover [a, b]
+            holes = sorted((c[2], c[3]) for c in cut if c[0] < b and c[1] > a)
+            bottom = 0.0
+            for hole_bottom, hole_top in holes + [(wall_height, wall_height)]:
+                if hole_bottom > bottom:
+                    pieces.append((a, b, bottom, min(hole_bottom, wall_height)))
+                bottom = max(bottom, hole_top)
+        spans[0][s] = np.nan
+        spans.append(np.array(pieces, dtype=np.float64).reshape(-1, 4))
+        owners.append(np.full(len(pieces), s))
+    spans = np.concatenate(spans)
+    owners = np.concatenate(owners)
+    keep = ~np.isnan(spans).any(axis=1)
+    spans, owners = spans[keep], owners[keep]
+
+    return np.concatenate([
+        segments[owners, :2] * scale, directions[owners], spans,
+        thickness[owners, None] * scale / 2
+    ], axis=1).astype(np.float32)
+
+
+def box_mesh(boxes):
+    """
+    Triangulate oriented boxes, all at once.
+
+    Every box gets 24 vertices, 4 per face, so each face has flat normals.
+    The plan x axis is glTF's X, the plan y axis is Z and heights are Y.
+
+    Args:
+        boxes: [B, 9] boxes from wall_boxes()
+
+    Returns:
+        positions: [B * 24, 3] float32
+        normals: [B * 24, 3] float32
+        indices: [B * 36] uint32 triangle vertex indices
+    """
+    count = boxes.shape[0]
+    x, z, ux, uz, start, end, bottom, top, half = boxes.T
+    # Box frame: a along the wall, b up, c across the wall. (a, b, c) is
+    # right-handed with c = (-uz, ux) in the (x, z) plane.
+    u = np.stack([ux, np.zeros_like(ux), uz], axis=1)
+    up = np.broadcast_to(np.array([0, 1, 0], dtype=np.float32), (count, 3))
+    across = np.stack([-uz, np.zeros_like(ux), ux], axis=1)
+    origin = np.stack([x, np.zeros_like(x), z], axis=1)
+
+    a = start[:, None] + CUBE_CORNERS[None, :, 0] * (end - start)[:, None]
+    b = bottom[:, None] + CUBE_CORNERS[None, :, 1] * (top - bottom)[:, None]
+    c = -half[:, None] + CUBE_CORNERS[None, :, 2] * (2 * half)[:, None]
+    positions = (origin[:, None] + a[..., None] * u[:, None] + b[..., None] * up[:, None] +
+                 c[..., None] * across[:, None])
+    normals = (CUBE_NORMALS[None, :, 0, None] * u[:, None] +
+               CUBE_NORMALS[None, :, 1, None] * up[:, None] +
+               CUBE_NORMALS[None, :, 2, None] * across[:, None])
+    indices = (CUBE_TRIANGLES[None] + 24 * np.arange(count, dtype=np.uint32)[:, None]).ravel()
+    return (positions.reshape(-1, 3).astype(np.float32),
+            normals.reshape(-1, 3).astype(np.float32), indices)
+
+
+def write_glb(f, positions, normals, indices, color=(0.9, 0.9, 0.88, 1.0)):
+    """
+    Write a triangle mesh as binary glTF 2.0.
+
+    The buffers are written straight from the arrays after the JSON chunk,
+    without assembling the whole file in memory.
+
+    Args:
+        f: Binary file object
+        positions: [V, 3] float32 vertex positions
+        normals: [V, 3] float32 vertex normals
+        indices: [T * 3] uint32 triangle vertex indices
+        color: RGBA base color of the material
+    """
+    views = [positions, normals, indices]
+    offsets = np.cumsum([0] + [v.nbytes for v in views])
+    bin_length = int(offsets[-1])
+    bin_padding = -bin_length % 4
+    empty = not len(indices)
+    gltf = {
+        "asset": {"version": "2.0", "generator": "floorplan.generation"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "walls"}] if not empty else [{"name": "walls"}],
+        "materials": [{"name": "wall", "pbrMetallicRoughness": {
+            "baseColorFactor": list(color), "metallicFactor": 0.0, "roughnessFactor": 0.9}}],
+    }
+    if not empty:
+        gltf.update({
+            "meshes": [{"name": "walls", "primitives": [{
+                "attributes": {"POSITION": 0, "NORMAL": 1}, "indices": 2, "material": 0}]}],
+            "buffers": [{"byteLength": bin_length + bin_padding}],
+            "bufferViews": [
+                {"buffer": 0, "byteOffset": int(offsets[0]), "byteLength": positions.nbytes, "target": ARRAY_BUFFER},
+                {"buffer": 0, "byteOffset": int(offsets[1]), "byteLength": normals.nbytes, "target": ARRAY_BUFFER},
+                {"buffer": 0, "byteOffset": int(offsets[2]), "byteLength": indices.nbytes,
+                 "target": ELEMENT_ARRAY_BUFFER},
+            ],
+            "accessors": [
+                {"bufferView": 0, "componentType": FLOAT, "count": len(positions), "type": "VEC3",
+                 "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist()},
+                {"bufferView": 1, "componentType": FLOAT, "count": len(normals), "type": "VEC3"},
+                {"bufferView": 2, "componentType": UNSIGNED_INT, "count": len(indices), "type": "SCALAR"},
+            ],
+        })
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+
+    total = 12 + 8 + len(json_chunk) + (8 + bin_length + bin_padding if not empty else 0)
+    f.write(struct.pack("<III", GLB_MAGIC, 2, total))
+    f.write(struct.pack("<II", len(json_chunk), GLB_JSON))
+    f.write(json_chunk)
+    if not empty:
+        f.write(struct.pack("<II", bin_length + bin_padding, GLB_BIN))
+        for view in views:
+            f.write(np.ascontiguousarray(view, dtype=view.dtype.newbyteorder("<")).data)
+        f.write(b"\0" * bin_padding)
+
+
+def detection_openings(r, class_names=CLASS_NAMES):
+    """
+    List the doors and windows of a detection result.
+
+    Returns:
+        A list of (type, [x1, y1, x2, y2]) tuples
+    """
+    openings = []
+    for (y1, x1, y2, x2), class_id in zip(r['rois'], r['class_ids']):
+        if class_names[class_id] in ("Door", "Window"):
+            openings.append((class_names[class_id], [x1, y1, x2, y2]))
+    return openings
+
+
+def generate_model(graph, openings, output_path, **kwargs):
+    """
+    Extrude a wall graph to a 3D model with door and window openings and
+    save it as a .glb file.
+
+    Args:
+        graph: Wall graph from vectorize_walls()
+        openings: List of (type, [x1, y1, x2, y2]) doors and windows in pixels
+        output_path: Where to write the .glb file
+        kwargs: Scale and heights, see wall_boxes()
+    """
+    positions, normals, indices = box_mesh(wall_boxes(graph, openings, **kwargs))
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            write_glb(f, positions, normals, indices)
+    replace_atomically(output_path, ".glb", write)
+
+
 if __name__ == "__main__":
     input_path = "../../data/output/detected_output.jpg"
     output_path = "../../data/output/generated_image.jpg"
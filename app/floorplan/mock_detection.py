@@ -1,66 +1,138 @@
 import cv2
 import os
+import time
 import numpy as np
-import random
+
+from app.config import MOCK_SEED, MOCK_LATENCY, MOCK_REPLAY_DIR
+from .postprocess import CLASS_NAMES, build_elements
+from .render import render_instances
+from .results import load_detections, save_detections
+
+# Default number of instances per class id: (min, max), both inclusive
+INSTANCE_COUNTS = {
+    1: (3, 8),  # Wall
+    2: (2, 6),  # Window
+    3: (1, 4),  # Door
+}
+
+# Number of rectangular holes punched into each mock mask
+MASK_HOLES = 10
+
 
 class MockModel:
-    """A mock model class to simulate Mask R-CNN without TensorFlow dependency"""
-    def __init__(self):
+    """A mock model class to simulate Mask R-CNN without TensorFlow dependency.
+
+    Args:
+        seed: Seed of the random generator. The same seed gives the same
+            results for the same sequence of calls. None seeds from the OS.
+        instance_counts: Dict of class id to (min, max) number of instances
+        latency: Simulated inference time in seconds per detect() call
+        latency_jitter: Standard deviation of the simulated inference time
+        replay_dir: Optional directory of detection results stored with
+            results.save_detections(), e.g. the *_detections.npz files the
+            API writes when it runs the real model. If given, detect()
+            returns these results in turn instead of synthetic ones.
+    """
+    def __init__(self, seed=None, instance_counts=None, latency=0.0,
+                 latency_jitter=0.0, replay_dir=None):
         self.name = "MockMaskRCNN"
-    
-    def detect(self, images, verbose=0):
-        """Mock detection method that returns synthetic detection results"""
+        self.rng = np.random.default_rng(seed)
+        self.instance_counts = instance_counts or INSTANCE_COUNTS
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.recordings = []
+        if replay_dir:
+            self.recordings = sorted(
+                os.path.join(replay_dir, f) for f in os.listdir(replay_dir)
+                if f.endswith(".npz"))
+            if not self.recordings:
+                raise FileNotFoundError(f"No recorded detections in: {replay_dir}")
+        self.replay_index = 0
+
+    def simulate_latency(self):
+        """Sleep for the configured inference time"""
+        delay = self.latency
+        if self.latency_jitter:
+            delay += self.rng.normal(0, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def replay(self):
+        """Return the next recorded result, cycling through the recordings"""
+        r = load_detections(self.recordings[self.replay_index % len(self.recordings)])
+        self.replay_index += 1
+        del r['image_path']
+        return r
+
+    def synthesize(self, height, width):
+        """Generate a random result for an image of the given size, with
+        masks cropped to their rois"""
+        rng = self.rng
+        # Class IDs (1: Wall, 2: Window, 3: Door)
+        class_ids = np.concatenate([
+            np.full(rng.integers(low, high, endpoint=True), class_id)
+            for class_id, (low, high) in sorted(self.instance_counts.items())
+        ]).astype(np.int32)
+        N = class_ids.shape[0]
+
+        # Scores (confidence values between 0.7 and 0.98)
+        scores = rng.uniform(0.7, 0.98, N)
+
+        # Bounding boxes (y1, x1, y2, x2)
+        x1 = rng.integers(0, width - 100, N, endpoint=True)
+        y1 = rng.integers(0, height - 100, N, endpoint=True)
+        x2 = np.minimum(x1 + rng.integers(50, 200, N, endpoint=True), width)
+        y2 = np.minimum(y1 + rng.integers(50, 200, N, endpoint=True), height)
+        rois = np.stack([y1, x1, y2, x2], axis=1)
+        h = (y2 - y1)[:, None]
+        w = (x2 - x1)[:, None]
+
+        # Make some random rectangular holes inside each box for more
+        # realism. All holes are drawn in box coordinates at once.
+        def spans(size):
+            start = rng.integers(0, size - 10, (N, MASK_HOLES), endpoint=True)
+            end = start + 5 + rng.integers(0, size - start - 5, endpoint=True)
+            return start, end
+        hx1, hx2 = spans(w)
+        hy1, hy2 = spans(h)
+        ys = np.arange(h.max())
+        xs = np.arange(w.max())
+        in_rows = (ys >= hy1[..., None]) & (ys < hy2[..., None])
+        in_cols = (xs >= hx1[..., None]) & (xs < hx2[..., None])
+        # [N, rows, cols] count of holes that cover each pixel
+        holes = np.matmul(in_rows.transpose(0, 2, 1).astype(np.float32),
+                          in_cols.astype(np.float32))
+        masks = [holes[i, :h[i, 0], :w[i, 0]] == 0 for i in range(N)]
+
+        return {
+            'rois': rois,
+            'class_ids': class_ids,
+            'scores': scores,
+            'masks': masks
+        }
+
+    def detect(self, images, verbose=0, sparse_masks=False):
+        """Mock detection method that returns synthetic detection results.
+
+        If sparse_masks is True, masks are returned as a list of masks cropped
+        to their rois, like MaskRCNN.detect(sparse_masks=True).
+        """
+        self.simulate_latency()
         results = []
         for image in images:
             height, width = image.shape[:2]
-            
-            # Create mock detection results
-            num_walls = random.randint(3, 8)
-            num_windows = random.randint(2, 6)
-            num_doors = random.randint(1, 4)
-            
-            # Total detections
-            total_detections = num_walls + num_windows + num_doors
-            
-            # Class IDs (1: Wall, 2: Window, 3: Door)
-            class_ids = np.array([1] * num_walls + [2] * num_windows + [3] * num_doors)
-            
-            # Scores (confidence values between 0.7 and 0.98)
-            scores = np.array([random.uniform(0.7, 0.98) for _ in range(total_detections)])
-            
-            # Bounding boxes (y1, x1, y2, x2)
-            rois = []
-            for _ in range(total_detections):
-                x1 = random.randint(0, width - 100)
-                y1 = random.randint(0, height - 100)
-                x2 = min(x1 + random.randint(50, 200), width)
-                y2 = min(y1 + random.randint(50, 200), height)
-                rois.append([y1, x1, y2, x2])
-            rois = np.array(rois)
-            
+            if self.recordings:
+                result = self.replay()
+            else:
+                result = self.synthesize(height, width)
+
             # Masks (height, width, num_instances)
-            masks = np.zeros((height, width, total_detections), dtype=np.bool_)
-            for i, roi in enumerate(rois):
-                y1, x1, y2, x2 = roi
-                mask = np.zeros((height, width), dtype=np.bool_)
-                mask[y1:y2, x1:x2] = True
-                
-                # Make some random patterns inside the box for more realism
-                for _ in range(10):
-                    rx1 = random.randint(x1, x2-10)
-                    ry1 = random.randint(y1, y2-10)
-                    rx2 = random.randint(rx1+5, x2)
-                    ry2 = random.randint(ry1+5, y2)
-                    mask[ry1:ry2, rx1:rx2] = False
-                
-                masks[:, :, i] = mask
-            
-            result = {
-                'rois': rois,
-                'class_ids': class_ids,
-                'scores': scores,
-                'masks': masks
-            }
+            if not sparse_masks:
+                rois = result['rois']
+                full_masks = np.zeros((height, width, len(rois)), dtype=np.bool_)
+                for i, (y1, x1, y2, x2) in enumerate(rois):
+                    full_masks[y1:y2, x1:x2, i] = result['masks'][i]
+                result['masks'] = full_masks
             results.append(result)
         
         return results
@@ -68,9 +140,11 @@ class MockModel:
 def load_model():
     """Load a mock model that simulates Mask R-CNN"""
     print("Loading mock detection model for floorplan recognition...")
-    return MockModel()
+    return MockModel(seed=MOCK_SEED, latency=MOCK_LATENCY, replay_dir=MOCK_REPLAY_DIR)
 
-def detect_objects(image_path, output_path, model, return_json=False):
+def detect_objects(image_path, output_path, model, return_json=False,
+                   tolerance=None, snap_walls=None, render=True,
+                   detections_path=None):
     """
     Perform mock object detection on the preprocessed floorplan image.
     
@@ -79,6 +153,11 @@ def detect_objects(image_path, output_path, model, return_json=False):
         output_path: Path to save the output image with visualized detections
         model: Loaded mock model
         return_json: Whether to return JSON formatted results
+        tolerance: Contour simplification tolerance in pixels, see build_elements
+        snap_walls: Whether to snap wall contours to rectangles, see build_elements
+        render: Whether to render the output image now. If False, it can be
+            rendered later from detections_path with render_overlay
+        detections_path: Optional .npz path to store the compact detection result
         
     Returns:
         If return_json is True, returns a dictionary with detection results
@@ -90,69 +169,26 @@ def detect_objects(image_path, output_path, model, return_json=False):
         raise FileNotFoundError(f"Image not found: {image_path}")
     
     # Perform detection with the mock model
-    results = model.detect([image], verbose=1)
+    results = model.detect([image], verbose=1, sparse_masks=True)
     r = results[0]
     print(r)
-    # Create a simple visualization of the results
-    output_image = image.copy()
-    class_names = ['BG', 'Wall', 'Window', 'Door']
+    # Store the compact result so the output image can be rendered on demand
+    if detections_path:
+        save_detections(detections_path, r, os.path.abspath(image_path))
+
+    if render:
+        # Visualize the results
+        output_image = render_instances(
+            image, r['rois'], r['masks'], r['class_ids'], CLASS_NAMES, r['scores']
+        )
     
-    # Save the output image
-    output_file_path = os.path.abspath(output_path)
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    cv2.imwrite(output_file_path, output_image)
-    print(f"Output saved to: {output_file_path}")
+        # Save the output image
+        output_file_path = os.path.abspath(output_path)
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        cv2.imwrite(output_file_path, output_image)
+        print(f"Output saved to: {output_file_path}")
     # Return JSON-formatted results if requested
     if return_json:
-        detected_objects = []
-        for i, class_id in enumerate(r['class_ids']):
-            # Get the class name
-            class_name = class_names[class_id]
-            # Get the score
-            score = float(r['scores'][i])
-            # Get the bounding box
-            y1, x1, y2, x2 = r['rois'][i]
-            # Get the mask
-            mask = r['masks'][:, :, i]
-            
-            # Create a contour from the mask
-            mask_uint8 = (mask * 255).astype(np.uint8)
-            contours, _ = cv2.findContours(
-                mask_uint8, 
-                cv2.RETR_EXTERNAL, 
-                cv2.CHAIN_APPROX_SIMPLE
-            )
-            
-            # Convert contours to list of points for JSON serialization
-            contour_points = []
-            if contours:
-                # Use the largest contour
-                largest_contour = max(contours, key=cv2.contourArea)
-                contour_points = largest_contour.reshape(-1, 2).tolist()
-            
-            # Add object to list
-            detected_objects.append({
-                "type": class_name,
-                "confidence": score,
-                "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                "contour": contour_points
-            })
-        
-        # Group by object type
-        result = {
-            "walls": [],
-            "windows": [],
-            "doors": []
-        }
-        
-        for obj in detected_objects:
-            if obj["type"] == "Wall":
-                result["walls"].append(obj)
-            elif obj["type"] == "Window":
-                result["windows"].append(obj)
-            elif obj["type"] == "Door":
-                result["doors"].append(obj)
-        
-        return result
+        return build_elements(r, CLASS_NAMES, tolerance=tolerance, snap_walls=snap_walls)
     
     return None
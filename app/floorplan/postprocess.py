@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+from app.config import CONTOUR_TOLERANCE, SNAP_WALLS
+
+CLASS_NAMES = ['BG', 'Wall', 'Window', 'Door']
+
+# Keys of the grouped elements for each class name
+ELEMENT_GROUPS = {"Wall": "walls", "Window": "windows", "Door": "doors"}
+
+
+def instance_mask(masks, rois, i):
+    """
+    Return the mask of instance i cropped to its bounding box.
+
+    Args:
+        masks: Either a [H, W, N] array or a list of N box-cropped masks
+        rois: [N, (y1, x1, y2, x2)] bounding boxes
+        i: Instance index
+
+    Returns:
+        A [y2 - y1, x2 - x1] mask
+    """
+    if isinstance(masks, (list, tuple)):
+        return masks[i]
+    y1, x1, y2, x2 = rois[i]
+    return masks[y1:y2, x1:x2, i]
+
+
+def largest_contour(mask, offset=(0, 0)):
+    """
+    Find the outer contour with the largest area in a binary mask.
+
+    Args:
+        mask: Binary mask
+        offset: (x, y) added to every point, e.g. the corner of a cropped mask
+
+    Returns:
+        An [K, 2] int array of (x, y) points, empty if the mask is empty
+    """
+    contours, _ = cv2.findContours(
+        mask.astype(np.uint8),
+        cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=(int(offset[0]), int(offset[1]))
+    )
+    if not contours:
+        return np.zeros((0, 2), dtype=np.int32)
+    return max(contours, key=cv2.contourArea).reshape(-1, 2)
+
+
+def simplify_contour(contour, tolerance):
+    """
+    Simplify a contour with the Douglas-Peucker algorithm.
+
+    Args:
+        contour: [K, 2] array of (x, y) points
+        tolerance: Maximum distance in pixels between the original and the
+            simplified contour. 0 keeps the contour unchanged.
+
+    Returns:
+        An [M, 2] array with M <= K
+    """
+    if tolerance <= 0 or len(contour) < 4:
+        return contour
+    return cv2.approxPolyDP(contour.reshape(-1, 1, 2), tolerance, True).reshape(-1, 2)
+
+
+def snap_to_rectangle(contour):
+    """
+    Replace a contour with its axis-aligned bounding rectangle.
+
+    Args:
+        contour: [K, 2] array of (x, y) points
+
+    Returns:
+        A [4, 2] array with the rectangle corners, clockwise from the top left
+    """
+    if len(contour) == 0:
+        return contour
+    x1, y1 = contour.min(axis=0)
+    x2, y2 = contour.max(axis=0)
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=contour.dtype)
+
+
+def build_elements(r, class_names=CLASS_NAMES, tolerance=None, snap_walls=None):
+    """
+    Convert detection results into the JSON elements returned by the API.
+
+    Args:
+        r: Detection result dict with 'rois', 'class_ids', 'scores' and 'masks'.
+            Masks can be full size or cropped to their rois.
+        class_names: Class names indexed by class id
+        tolerance: Douglas-Peucker tolerance in pixels. Defaults to
+            CONTOUR_TOLERANCE; 0 returns contours unsimplified.
+        snap_walls: Whether to replace wall contours with axis-aligned
+            rectangles. Defaults to SNAP_WALLS.
+
+    Returns:
+        A dict with 'walls', 'windows' and 'doors' lists
+    """
+    tolerance = CONTOUR_TOLERANCE if tolerance is None else tolerance
+    snap_walls = SNAP_WALLS if snap_walls is None else snap_walls
+
+    result = {group: [] for group in ELEMENT_GROUPS.values()}
+    for i, class_id in enumerate(r['class_ids']):
+        class_name = class_names[class_id]
+        if class_name not in ELEMENT_GROUPS:
+            continue
+        y1, x1, y2, x2 = r['rois'][i]
+        mask = instance_mask(r['masks'], r['rois'], i)
+
+        # Contour in image coordinates
+        contour = largest_contour(mask, offset=(x1, y1))
+        if snap_walls and class_name == "Wall":
+            contour = snap_to_rectangle(contour)
+        else:
+            contour = simplify_contour(contour, tolerance)
+
+        result[ELEMENT_GROUPS[class_name]].append({
+            "type": class_name,
+            "confidence": float(r['scores'][i]),
+            "bbox": [int(x1), int(y1), int(x2), int(y2)],
+            "contour": contour.tolist()
+        })
+    return result
@@ -0,0 +1,143 @@
+import colorsys
+
+import cv2
+import numpy as np
+
+
+def instance_colors(count, bright=True):
+    """
+    Generate visually distinct colors, one per instance.
+
+    Same palette as mrcnn.visualize.random_colors but in a fixed order, so
+    the same result always renders the same way.
+
+    Args:
+        count: Number of colors
+        bright: Use full or 70% brightness
+
+    Returns:
+        A list of (r, g, b) tuples with values in [0, 1]
+    """
+    brightness = 1.0 if bright else 0.7
+    return [colorsys.hsv_to_rgb(i / count, 1, brightness) for i in range(count)]
+
+
+# Fixed (r, g, b) colors per class id: Wall green, Window blue, Door red
+CLASS_COLORS = {
+    1: (0.0, 1.0, 0.0),
+    2: (0.0, 0.0, 1.0),
+    3: (1.0, 0.0, 0.0),
+}
+
+
+def class_colors(class_ids):
+    """
+    Look up the fixed color of each instance's class.
+
+    Args:
+        class_ids: [N] class ids
+
+    Returns:
+        A list of N (r, g, b) tuples with values in [0, 1]. Unknown classes are gray.
+    """
+    return [CLASS_COLORS.get(int(class_id), (0.5, 0.5, 0.5)) for class_id in class_ids]
+
+
+def label_map(shape, boxes, masks):
+    """
+    Combine instance masks into one label image.
+
+    Args:
+        shape: (height, width) of the image
+        boxes: [N, (y1, x1, y2, x2)] bounding boxes
+        masks: Either a [H, W, N] array or a list of N box-cropped masks
+
+    Returns:
+        An int32 [H, W] array with i + 1 where instance i is on top, 0 elsewhere.
+        Later instances are drawn over earlier ones.
+    """
+    # Instance masks are zero outside their boxes, so only the box region of
+    # each mask is visited. The cost depends on instance areas, not image size.
+    sparse = isinstance(masks, (list, tuple))
+    labels = np.zeros(shape[:2], dtype=np.int32)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        mask = masks[i] if sparse else masks[y1:y2, x1:x2, i]
+        region = labels[y1:y2, x1:x2]
+        region[mask.astype(bool)] = i + 1
+    return labels
+
+
+def render_instances(image, boxes, masks, class_ids, class_names,
+                     scores=None, show_mask=True, show_bbox=True,
+                     show_caption=True, colors=None, captions=None,
+                     alpha=0.5):
+    """
+    Draw detection results on an image without matplotlib.
+
+    Headless replacement for mrcnn.visualize.display_instances with the same
+    visual options. All masks are blended in one pass through a label map and
+    a color lookup table; boxes, outlines and captions are drawn with OpenCV.
+
+    Args:
+        image: [H, W, 3] uint8 image in BGR order, as loaded by cv2.imread
+        boxes: [N, (y1, x1, y2, x2)] bounding boxes
+        masks: Either a [H, W, N] array or a list of N box-cropped masks
+        class_ids: [N] class ids
+        class_names: Class names indexed by class id
+        scores: Optional [N] confidence scores shown in the captions
+        show_mask, show_bbox, show_caption: What to draw
+        colors: Optional list of N (r, g, b) colors with values in [0, 1]
+        captions: Optional list of N strings to use instead of class and score
+        alpha: Opacity of the mask colors
+
+    Returns:
+        A new [H, W, 3] uint8 BGR image
+    """
+    output = image.copy()
+    boxes = np.asarray(boxes).astype(np.int32).reshape(-1, 4)
+    count = boxes.shape[0]
+    if not count:
+        return output
+    colors = instance_colors(count) if colors is None else colors
+    # Color lookup table in BGR, row 0 is the background
+    lut = np.zeros((count + 1, 3), dtype=np.float32)
+    lut[1:] = np.array(colors, dtype=np.float32)[:, ::-1] * 255
+    bgr = [tuple(int(c) for c in color) for color in lut[1:]]
+    sparse = isinstance(masks, (list, tuple))
+
+    if show_mask:
+        labels = label_map(output.shape, boxes, masks)
+        covered = labels > 0
+        blended = output[covered] * (1 - alpha) + lut[labels[covered]] * alpha
+        output[covered] = blended.astype(np.uint8)
+
+    for i in range(count):
+        if not np.any(boxes[i]):
+            # Skip this instance. Has no bbox. Likely lost in image cropping.
+            continue
+        y1, x1, y2, x2 = boxes[i]
+
+        # Mask outline
+        if show_mask:
+            mask = masks[i] if sparse else masks[y1:y2, x1:x2, i]
+            contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL,
+                                           cv2.CHAIN_APPROX_SIMPLE, offset=(int(x1), int(y1)))
+            cv2.drawContours(output, contours, -1, bgr[i], 1)
+
+        if show_bbox:
+            cv2.rectangle(output, (int(x1), int(y1)), (int(x2) - 1, int(y2) - 1), bgr[i], 2)
+
+        if show_caption:
+            if captions is not None:
+                caption = captions[i]
+            else:
+                label = class_names[class_ids[i]]
+                score = scores[i] if scores is not None else None
+                caption = "{} {:.3f}".format(label, score) if score else label
+            # White text with a dark outline stays readable on any background
+            origin = (int(x1), int(y1) + 12)
+            cv2.putText(output, caption, origin, cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(output, caption, origin, cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, (255, 255, 255), 1, cv2.LINE_AA)
+    return output
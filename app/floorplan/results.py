@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from .postprocess import CLASS_NAMES, instance_mask
+from .render import class_colors, render_instances
+
+# Overlay styles and what they draw: (show_mask, show_bbox, show_caption)
+RENDER_STYLES = {
+    "full": (True, True, True),
+    "masks": (True, False, False),
+    "boxes": (False, True, True),
+}
+
+# Overlay color schemes
+COLOR_SCHEMES = ("instance", "class")
+
+
+def replace_atomically(path, suffix, write):
+    """
+    Write a file next to path under a unique temporary name, then rename it
+    over path, so readers and concurrent writers never see a partial file.
+
+    Args:
+        path: Destination file
+        suffix: Extension of the temporary file, for writers that pick the
+            format from it
+        write: Callable that writes the file it gets the path of
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix=os.path.basename(path) + ".",
+                                    dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_detections(path, r, image_path):
+    """
+    Store a detection result in a compact form so it can be rendered later.
+
+    Masks are cropped to their boxes and bit-packed, so the file size depends
+    on the instance areas rather than on the image size.
+
+    Args:
+        path: Destination .npz file
+        r: Detection result dict with 'rois', 'class_ids', 'scores' and 'masks'
+        image_path: Path to the image the detections were made on
+    """
+    rois = np.asarray(r['rois'], dtype=np.int32).reshape(-1, 4)
+    crops = [instance_mask(r['masks'], rois, i).astype(bool).ravel()
+             for i in range(len(rois))]
+    mask_bits = np.packbits(np.concatenate(crops)) if crops else np.zeros(0, np.uint8)
+    replace_atomically(path, ".npz", lambda tmp_path: np.savez(
+        tmp_path, rois=rois,
+        class_ids=np.asarray(r['class_ids'], dtype=np.int32),
+        scores=np.asarray(r['scores'], dtype=np.float32),
+        mask_bits=mask_bits, image_path=np.array(image_path)))
+
+
+def load_detections(path):
+    """
+    Load a detection result stored with save_detections().
+
+    Returns:
+        A detection result dict with box-cropped 'masks' and the 'image_path'
+    """
+    with np.load(path) as data:
+        rois = data['rois']
+        areas = (rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1])
+        bits = np.unpackbits(data['mask_bits'], count=int(areas.sum())).astype(bool)
+        masks = [m.reshape(y2 - y1, x2 - x1) for m, (y1, x1, y2, x2)
+                 in zip(np.split(bits, np.cumsum(areas)[:-1]), rois)]
+        return {
+            'rois': rois,
+            'class_ids': data['class_ids'],
+            'scores': data['scores'],
+            'masks': masks,
+            'image_path': str(data['image_path']),
+        }
+
+
+def save_json(path, data):
+    """
+    Store JSON data, such as the elements returned by build_elements() or a
+    wall graph from vectorize_walls().
+
+    Args:
+        path: Destination .json file
+        data: JSON serializable data
+    """
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+    replace_atomically(path, ".json", write)
+
+
+def load_json(path):
+    """Load data stored with save_json()"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def overlay_filename(result_id, style="full", colors="instance"):
+    """
+    Name of the cached overlay image for a result and rendering variant.
+
+    The default variant keeps the historical "{id}_detected.jpg" name.
+    """
+    if style == "full" and colors == "instance":
+        return f"{result_id}_detected.jpg"
+    return f"{result_id}_detected_{style}_{colors}.jpg"
+
+
+def render_overlay(detections_path, output_path, style="full", colors="instance"):
+    """
+    Render and save the overlay image of a stored detection result.
+
+    Args:
+        detections_path: Result stored with save_detections()
+        output_path: Where to write the rendered image
+        style: One of RENDER_STYLES
+        colors: One of COLOR_SCHEMES. "instance" gives every instance its own
+            color, "class" uses one fixed color per class.
+    """
+    if style not in RENDER_STYLES:
+        raise ValueError(f"Unknown style: {style}")
+    if colors not in COLOR_SCHEMES:
+        raise ValueError(f"Unknown color scheme: {colors}")
+    r = load_detections(detections_path)
+    image = cv2.imread(r['image_path'])
+    if image is None:
+        raise FileNotFoundError(f"Image not found: {r['image_path']}")
+
+    show_mask, show_bbox, show_caption = RENDER_STYLES[style]
+    output_image = render_instances(
+        image, r['rois'], r['masks'], r['class_ids'], CLASS_NAMES, r['scores'],
+        show_mask=show_mask, show_bbox=show_bbox, show_caption=show_caption,
+        colors=class_colors(r['class_ids']) if colors == "class" else None
+    )
+
+    def write(tmp_path):
+        if not cv2.imwrite(tmp_path, output_image):
+            raise OSError(f"Could not write {output_path}")
+    replace_atomically(output_path, ".jpg", write)
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+from app.config import MODEL_SCALE
+from .postprocess import CLASS_NAMES, instance_mask, largest_contour, simplify_contour
+
+# Classes that block free space
+OCCUPYING_CLASSES = ("Wall", "Door", "Window")
+
+
+def occupancy_grid(r, class_names=CLASS_NAMES, shape=None):
+    """
+    Rasterize walls, doors and windows into one occupancy grid.
+
+    Args:
+        r: Detection result dict with 'rois', 'class_ids' and 'masks'.
+            Masks can be full size or cropped to their rois.
+        class_names: Class names indexed by class id
+        shape: (height, width) of the image. Defaults to the extent of the rois.
+
+    Returns:
+        A uint8 [H, W] image, 1 where any wall, door or window is
+    """
+    rois = np.asarray(r['rois'], dtype=np.int32).reshape(-1, 4)
+    if shape is None:
+        shape = (int(rois[:, 2].max(initial=0)), int(rois[:, 3].max(initial=0)))
+    grid = np.zeros(shape[:2], dtype=np.uint8)
+    for i, class_id in enumerate(r['class_ids']):
+        if class_names[class_id] not in OCCUPYING_CLASSES:
+            continue
+        y1, x1, y2, x2 = rois[i]
+        grid[y1:y2, x1:x2] |= instance_mask(r['masks'], rois, i).astype(np.uint8)
+    return grid
+
+
+def segment_rooms(r, class_names=CLASS_NAMES, shape=None, gap=15, min_area=400,
+                  tolerance=1.0, scale=MODEL_SCALE):
+    """
+    Find the rooms of a floorplan as the enclosed regions of free space.
+
+    Walls, doors and windows are rasterized into one occupancy grid, gaps up
+    to `gap` pixels, such as open doorways, are closed with a morphological
+    closing, and the free space is labeled with connected components. The
+    region connected to the image border is the outside.
+
+    Args:
+        r: Detection result dict with 'rois', 'class_ids' and 'masks'
+        class_names: Class names indexed by class id
+        shape: (height, width) of the image. Defaults to the extent of the rois.
+        gap: Largest gap in pixels between walls that still separates rooms
+        min_area: Smallest room area in pixels
+        tolerance: Douglas-Peucker tolerance in pixels for the room polygons
+        scale: Meters per pixel, for the areas in square meters
+
+    Returns:
+        A list of {"polygon", "area", "area_m2", "centroid", "bbox"} dicts,
+        largest room first. Coordinates are in pixels, bbox is [x1, y1, x2, y2].
+    """
+    grid = occupancy_grid(r, class_names, shape)
+    if gap > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (gap, gap))
+        grid = cv2.morphologyEx(grid, cv2.MORPH_CLOSE, kernel)
+    # A free border makes sure the outside is one region touching it
+    free = cv2.copyMakeBorder(1 - grid, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=1)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(free, connectivity=4)
+    # Label 0 is the occupied space, the padded corner is in the outside
+    outside = labels[0, 0]
+    labels = labels[1:-1, 1:-1]
+    stats[:, cv2.CC_STAT_LEFT] -= 1
+    stats[:, cv2.CC_STAT_TOP] -= 1
+    centroids -= 1
+    room_ids = np.flatnonzero(stats[:, cv2.CC_STAT_AREA] >= min_area)
+    room_ids = room_ids[(room_ids != 0) & (room_ids != outside)]
+    room_ids = room_ids[np.argsort(-stats[room_ids, cv2.CC_STAT_AREA], kind="stable")]
+
+    rooms = []
+    for room in room_ids:
+        x, y, w, h, area = stats[room]
+        contour = largest_contour(labels[y:y + h, x:x + w] == room, offset=(x, y))
+        rooms.append({
+            "polygon": simplify_contour(contour, tolerance).tolist(),
+            "area": int(area),
+            "area_m2": round(float(area) * scale * scale, 2),
+            "centroid": np.round(centroids[room], 1).tolist(),
+            "bbox": [int(x), int(y), int(x + w), int(y + h)],
+        })
+    return rooms
@@ -0,0 +1,237 @@
+import heapq
+import math
+
+import numpy as np
+
+from .postprocess import ELEMENT_GROUPS
+
+# Groups of the elements that are openings in a wall
+OPENING_GROUPS = ("windows", "doors")
+
+
+def box_distance(boxes, box):
+    """
+    Euclidean gap between each of boxes and one box, 0 if they touch or overlap.
+
+    Args:
+        boxes: [N, (x1, y1, x2, y2)]
+        box: (x1, y1, x2, y2). A point is a box with x1 == x2 and y1 == y2.
+
+    Returns:
+        [N] float distances
+    """
+    dx = np.maximum(np.maximum(boxes[:, 0] - box[2], box[0] - boxes[:, 2]), 0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - box[3], box[1] - boxes[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+
+def intersects(boxes, box):
+    """[N] bool, which of boxes intersect or touch box. Both in (x1, y1, x2, y2)"""
+    return ((boxes[:, 0] <= box[2]) & (boxes[:, 2] >= box[0]) &
+            (boxes[:, 1] <= box[3]) & (boxes[:, 3] >= box[1]))
+
+
+def str_order(boxes, node_size):
+    """
+    Sort-Tile-Recursive order of boxes: split them into vertical slices by
+    center x, then sort each slice by center y. Consecutive runs of node_size
+    boxes in this order make compact, little overlapping tree nodes.
+    """
+    count = boxes.shape[0]
+    cx = boxes[:, 0] + boxes[:, 2]
+    cy = boxes[:, 1] + boxes[:, 3]
+    slices = math.ceil(math.sqrt(math.ceil(count / node_size)))
+    slice_len = slices * node_size
+    by_x = np.argsort(cx, kind="stable")
+    return by_x[np.lexsort((cy[by_x], np.arange(count) // slice_len))]
+
+
+def ranges(starts, ends):
+    """Concatenation of np.arange(start, end) for all the given ranges"""
+    lengths = ends - starts
+    total = lengths.sum()
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(total) + offsets
+
+
+class RTree:
+    """
+    Static R-tree over axis-aligned boxes, bulk loaded with STR packing.
+
+    Every level is stored as arrays, so a window query is a few vectorized
+    operations per level rather than a walk over individual nodes.
+
+    Args:
+        boxes: [N, (x1, y1, x2, y2)] boxes. Queries return indices into it.
+        node_size: Maximum number of children per node
+    """
+    def __init__(self, boxes, node_size=32):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.size = boxes.shape[0]
+        self.order = str_order(boxes, node_size)
+        self.boxes = boxes[self.order]
+        # Levels from the root down. Each is (node boxes, first child,
+        # end of children), indexing the level below or self.boxes.
+        self.levels = []
+        level_boxes = self.boxes
+        while self.size and (level_boxes.shape[0] > 1 or not self.levels):
+            starts = np.arange(0, level_boxes.shape[0], node_size)
+            ends = np.minimum(starts + node_size, level_boxes.shape[0])
+            nodes = np.stack([
+                np.minimum.reduceat(level_boxes[:, 0], starts),
+                np.minimum.reduceat(level_boxes[:, 1], starts),
+                np.maximum.reduceat(level_boxes[:, 2], starts),
+                np.maximum.reduceat(level_boxes[:, 3], starts),
+            ], axis=1)
+            # Nodes are STR ordered too, so parents group nearby nodes
+            order = str_order(nodes, node_size)
+            level_boxes = nodes[order]
+            self.levels.insert(0, (level_boxes, starts[order], ends[order]))
+
+    def search(self, box):
+        """
+        Find the boxes that intersect or touch a window.
+
+        Args:
+            box: (x1, y1, x2, y2) query window
+
+        Returns:
+            Sorted indices of the matching boxes
+        """
+        if not self.size:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.arange(self.levels[0][0].shape[0])
+        for level_boxes, starts, ends in self.levels:
+            hit = nodes[intersects(level_boxes[nodes], box)]
+            if not hit.size:
+                return np.zeros(0, dtype=np.int64)
+            nodes = ranges(starts[hit], ends[hit])
+        hit = nodes[intersects(self.boxes[nodes], box)]
+        return np.sort(self.order[hit])
+
+    def nearest(self, point, k=1, accept=None):
+        """
+        Find the k boxes closest to a point, by best-first search.
+
+        Args:
+            point: (x, y)
+            k: Number of boxes to return
+            accept: Optional [N] bool array. Only boxes where it is True
+                are returned.
+
+        Returns:
+            A list of up to k (index, distance) tuples, closest first
+        """
+        x, y = point
+        query = (x, y, x, y)
+        depth = len(self.levels)
+        # Heap of (distance, level, index). Level == depth means a box.
+        heap = []
+        if self.size:
+            roots = self.levels[0][0]
+            for i, d in enumerate(box_distance(roots, query)):
+                heapq.heappush(heap, (d, 0, i))
+        found = []
+        while heap and len(found) < k:
+            d, level, i = heapq.heappop(heap)
+            if level == depth:
+                index = int(self.order[i])
+                if accept is None or accept[index]:
+                    found.append((index, float(d)))
+                continue
+            _, starts, ends = self.levels[level]
+            children = np.arange(starts[i], ends[i])
+            child_boxes = self.levels[level + 1][0] if level + 1 < depth else self.boxes
+            for c, cd in zip(children, box_distance(child_boxes[children], query)):
+                heapq.heappush(heap, (cd, level + 1, int(c)))
+        return found
+
+
+class ElementIndex:
+    """
+    Spatial index over the elements of one detection result.
+
+    Elements are referred to by their group and position in the group, as in
+    the 'elements' returned by the detect endpoint, e.g. ("doors", 2).
+
+    Args:
+        elements: Dict of group name to a list of elements with a
+            [x1, y1, x2, y2] 'bbox', as returned by build_elements()
+        node_size: Maximum number of children per R-tree node
+    """
+    def __init__(self, elements, node_size=32):
+        self.elements = elements
+        self.refs = [(group, i) for group in ELEMENT_GROUPS.values()
+                     for i in range(len(elements.get(group, [])))]
+        boxes = np.array([elements[group][i]["bbox"] for group, i in self.refs],
+                         dtype=np.float64).reshape(-1, 4)
+        self.groups = np.array([group for group, _ in self.refs], dtype=object)
+        self.tree = RTree(boxes, node_size)
+        self.wall_boxes = boxes[self.groups == "walls"]
+        self.walls = RTree(self.wall_boxes, node_size)
+
+    def element(self, ref, **extra):
+        """The element of a (group, index) reference, with its reference"""
+        group, i = ref
+        return dict(self.elements[group][i], group=group, index=i, **extra)
+
+    def query(self, box, groups=None):
+        """
+        Find the elements whose bounding boxes intersect a window.
+
+        Args:
+            box: (x1, y1, x2, y2) query window
+            groups: Optional list of group names to return
+
+        Returns:
+            A list of elements with their 'group' and 'index'
+        """
+        hits = [self.refs[i] for i in self.tree.search(box)]
+        return [self.element(ref) for ref in hits if not groups or ref[0] in groups]
+
+    def nearest(self, point, k=1, groups=None):
+        """
+        Find the k elements whose bounding boxes are closest to a point.
+
+        Returns:
+            A list of elements with their 'group', 'index' and 'distance',
+            closest first
+        """
+        accept = np.isin(self.groups, list(groups)) if groups else None
+        return [self.element(self.refs[i], distance=d)
+                for i, d in self.tree.nearest(point, k, accept)]
+
+    def adjacent_walls(self, box, max_distance=0.0):
+        """
+        Find the walls within max_distance of a bounding box.
+
+        Returns:
+            Sorted indices of the walls in the 'walls' group
+        """
+        x1, y1, x2, y2 = box
+        candidates = self.walls.search((x1 - max_distance, y1 - max_distance,
+                                        x2 + max_distance, y2 + max_distance))
+        close = box_distance(self.wall_boxes[candidates], box) <= max_distance
+        return candidates[close]
+
+    def adjacency(self, max_distance=0.0, wall=None):
+        """
+        Find the walls that each door and window touches.
+
+        Args:
+            max_distance: Largest gap in pixels between the bounding boxes of
+                an opening and a wall that still counts as touching
+            wall: Optional index of a wall. If given, only the openings that
+                touch this wall are returned.
+
+        Returns:
+            A list of {"group", "index", "walls"} dicts, one per opening, where
+            "walls" are indices into the 'walls' group
+        """
+        result = []
+        for group in OPENING_GROUPS:
+            for i, element in enumerate(self.elements.get(group, [])):
+                walls = self.adjacent_walls(element["bbox"], max_distance).tolist()
+                if wall is None or wall in walls:
+                    result.append({"group": group, "index": i, "walls": walls})
+        return result
@@ -0,0 +1,280 @@
+import cv2
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+from .postprocess import CLASS_NAMES, instance_mask
+
+
+def wall_union(r, class_names=CLASS_NAMES, shape=None):
+    """
+    Combine the masks of all walls into one binary image.
+
+    Args:
+        r: Detection result dict with 'rois', 'class_ids' and 'masks'.
+            Masks can be full size or cropped to their rois.
+        class_names: Class names indexed by class id
+        shape: (height, width) of the image. Defaults to the extent of the rois.
+
+    Returns:
+        A uint8 [H, W] image, 1 where any wall is
+    """
+    rois = np.asarray(r['rois'], dtype=np.int32).reshape(-1, 4)
+    if shape is None:
+        shape = (int(rois[:, 2].max(initial=0)), int(rois[:, 3].max(initial=0)))
+    union = np.zeros(shape[:2], dtype=np.uint8)
+    for i, class_id in enumerate(r['class_ids']):
+        if class_names[class_id] != "Wall":
+            continue
+        y1, x1, y2, x2 = rois[i]
+        union[y1:y2, x1:x2] |= instance_mask(r['masks'], rois, i).astype(np.uint8)
+    return union
+
+
+def medial_axis(mask, dist):
+    """
+    Approximate the skeleton of a mask by the ridge of its distance transform:
+    the pixels that are at least as far from the background as all their
+    neighbours. Much faster than iterative thinning, and the ridge of a wall
+    is at most two pixels wide, which line fitting tolerates.
+
+    Args:
+        mask: uint8 binary mask
+        dist: Distance transform of the mask
+
+    Returns:
+        A uint8 mask of the ridge pixels
+    """
+    local_max = cv2.dilate(dist, np.ones((3, 3), np.uint8))
+    return ((dist >= local_max) & (mask > 0)).astype(np.uint8)
+
+
+def merge_collinear(segments, angle_tolerance, offset_tolerance, max_gap):
+    """
+    Merge segments that lie on the same line and overlap or nearly touch.
+
+    Args:
+        segments: [N, (x1, y1, x2, y2)] float segments
+        angle_tolerance: Largest angle difference in radians between the
+            segments of one line
+        offset_tolerance: Largest distance in pixels of a segment's endpoints
+            from the line it is merged into
+        max_gap: Largest gap in pixels between merged segments along the line
+
+    Returns:
+        [M, (x1, y1, x2, y2)] merged segments, M <= N
+    """
+    if not len(segments):
+        return segments.reshape(0, 4)
+    d = segments[:, 2:] - segments[:, :2]
+    lengths = np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-6)
+    directions = d / lengths[:, None]
+    # Longest segments first, so they define the direction of their line.
+    # Each segment is compared with all lines found so far at once.
+    order = np.argsort(-lengths, kind="stable")
+    origins = np.zeros((len(segments), 2))
+    line_directions = np.zeros((len(segments), 2))
+    line_of = np.zeros(len(segments), dtype=np.int64)
+    count = 0
+    min_cos = np.cos(angle_tolerance)
+    for i in order:
+        if count:
+            normals = line_directions[:count, ::-1] * (-1, 1)
+            fits = ((np.abs((segments[i, :2] - origins[:count]) * normals).sum(axis=1) <= offset_tolerance) &
+                    (np.abs((segments[i, 2:] - origins[:count]) * normals).sum(axis=1) <= offset_tolerance) &
+                    (np.abs(line_directions[:count] @ directions[i]) >= min_cos))
+            match = np.flatnonzero(fits)
+            if match.size:
+                line_of[i] = match[0]
+                continue
+        origins[count] = segments[i, :2]
+        line_directions[count] = directions[i]
+        line_of[i] = count
+        count += 1
+
+    # Positions of the segment ends along their line
+    origin, direction = origins[line_of], line_directions[line_of]
+    t1 = ((segments[:, :2] - origin) * direction).sum(axis=1)
+    t2 = ((segments[:, 2:] - origin) * direction).sum(axis=1)
+    starts, ends = np.minimum(t1, t2), np.maximum(t1, t2)
+
+    merged = []
+    for line in range(count):
+        members = np.flatnonzero(line_of == line)
+        members = members[np.argsort(starts[members])]
+        start, end = starts[members[0]], ends[members[0]]
+        for s, e in zip(np.append(starts[members[1:]], np.inf), np.append(ends[members[1:]], np.inf)):
+            if s <= end + max_gap:
+                end = max(end, e)
+                continue
+            merged.append(np.concatenate([origins[line] + start * line_directions[line],
+                                          origins[line] + end * line_directions[line]]))
+            start, end = s, e
+    return np.array(merged, dtype=np.float64).reshape(-1, 4)
+
+
+def point_segment_distance(points, segments):
+    """
+    Distance from each point to each segment and the position of the closest
+    point along the segment, 0 at (x1, y1) and 1 at (x2, y2).
+
+    Args:
+        points: [K, (x, y)]
+        segments: [M, (x1, y1, x2, y2)]
+
+    Returns:
+        [K, M] distances and [K, M] positions
+    """
+    a = segments[:, :2]
+    d = segments[:, 2:] - a
+    length2 = np.maximum((d * d).sum(axis=1), 1e-12)
+    offset = points[:, None] - a[None]
+    t = np.clip((offset * d).sum(axis=2) / length2, 0, 1)
+    gap = offset - t[..., None] * d
+    return np.hypot(gap[..., 0], gap[..., 1]), t
+
+
+def junction_graph(segments, snap_distance):
+    """
+    Snap segment endpoints into shared junction nodes.
+
+    Endpoints closer than snap_distance become one node. A node closer than
+    snap_distance to the inside of another segment is moved onto it and
+    splits it, which turns T-junctions into shared nodes.
+
+    Args:
+        segments: [N, (x1, y1, x2, y2)] segments
+        snap_distance: Snap distance in pixels
+
+    Returns:
+        nodes: [K, (x, y)] node coordinates
+        edges: [M, (i, j)] node indices of each segment, deduplicated
+    """
+    endpoints = segments.reshape(-1, 2)
+    # Cluster the endpoints by connected components of the "close" relation
+    offsets = endpoints[:, None] - endpoints[None]
+    close = np.hypot(offsets[..., 0], offsets[..., 1]) <= snap_distance
+    count, labels = connected_components(close, directed=False)
+    nodes = np.zeros((count, 2), dtype=np.float64)
+    np.add.at(nodes, labels, endpoints)
+    nodes /= np.bincount(labels, minlength=count)[:, None]
+    edges = labels.reshape(-1, 2)
+
+    # Where segments of different directions meet, put the node at the
+    # least squares intersection of their lines rather than at the mean of
+    # their endpoints, which the medial axis pulls away from corners
+    d = segments[:, 2:] - segments[:, :2]
+    normals = np.stack([-d[:, 1], d[:, 0]], axis=1) / np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-6)[:, None]
+    normals = np.repeat(normals, 2, axis=0)
+    outer = normals[:, :, None] * normals[:, None, :]
+    A = np.zeros((count, 2, 2))
+    b = np.zeros((count, 2))
+    np.add.at(A, labels, outer)
+    np.add.at(b, labels, (outer @ endpoints[:, :, None])[..., 0])
+    # Lines that are nearly parallel don't define an intersection
+    corner = np.linalg.det(A) > 0.1
+    nodes[corner] = np.linalg.solve(A[corner], b[corner][..., None])[..., 0]
+
+    # T-junctions: every node that ends on the inside of a segment splits
+    # the closest such segment
+    distance, t = point_segment_distance(
+        nodes, np.concatenate([nodes[edges[:, 0]], nodes[edges[:, 1]]], axis=1))
+    inside = ((distance <= snap_distance) & (t > 0) & (t < 1) &
+              (edges[None, :, 0] != np.arange(count)[:, None]) &
+              (edges[None, :, 1] != np.arange(count)[:, None]))
+    distance = np.where(inside, distance, np.inf)
+    split_nodes = np.flatnonzero(inside.any(axis=1))
+    split_edges = distance[split_nodes].argmin(axis=1)
+    split_t = t[split_nodes, split_edges]
+    a, b = nodes[edges[split_edges, 0]], nodes[edges[split_edges, 1]]
+    nodes[split_nodes] = a + split_t[:, None] * (b - a)
+
+    chains = [edges[np.setdiff1d(np.arange(len(edges)), split_edges)]]
+    for k in np.unique(split_edges):
+        on_edge = split_t[split_edges == k].argsort()
+        chain = np.concatenate([[edges[k, 0]], split_nodes[split_edges == k][on_edge], [edges[k, 1]]])
+        chains.append(np.stack([chain[:-1], chain[1:]], axis=1))
+
+    edges = np.sort(np.concatenate(chains).astype(np.int64), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return nodes, np.unique(edges, axis=0)
+
+
+def segment_thickness(dist, nodes, edges):
+    """
+    Estimate the thickness of each wall segment from the distance transform
+    of the wall mask, sampled once per pixel along the segment.
+
+    Returns:
+        [M] thicknesses in pixels
+    """
+    if not len(edges):
+        return np.zeros(0)
+    height, width = dist.shape
+    # The ridge of the distance transform is half the wall thickness away
+    # from both edges. Taking the local maximum makes the estimate robust to
+    # centerlines that are off by a pixel or two.
+    ridge = cv2.dilate(dist, np.ones((5, 5), np.uint8))
+    a, b = nodes[edges[:, 0]], nodes[edges[:, 1]]
+    steps = np.ceil(np.hypot(*(b - a).T)).astype(np.int64) + 1
+    edge = np.repeat(np.arange(len(edges)), steps)
+    # Position of every sample along its segment, from 0 to 1
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / \
+        np.maximum(np.repeat(steps - 1, steps), 1)
+    points = (a[edge] + t[:, None] * (b - a)[edge]).round().astype(np.int64)
+    values = ridge[np.clip(points[:, 1], 0, height - 1), np.clip(points[:, 0], 0, width - 1)]
+    thickness = np.zeros(len(edges), dtype=np.float64)
+    for k in range(len(edges)):
+        samples = values[edge == k]
+        samples = samples[samples > 0]
+        thickness[k] = 2 * np.median(samples) if samples.size else 0
+    return thickness
+
+
+def vectorize_walls(r, class_names=CLASS_NAMES, shape=None, min_length=10,
+                    max_gap=5, angle_tolerance=np.deg2rad(5), offset_tolerance=3,
+                    snap_distance=None):
+    """
+    Convert the wall masks of a detection result into a graph of wall
+    centerline segments.
+
+    The union of the wall masks is reduced to its medial axis, line segments
+    are fitted to it with the probabilistic Hough transform, collinear
+    segments are merged and their endpoints are snapped into shared junction
+    nodes.
+
+    Args:
+        r: Detection result dict with 'rois', 'class_ids' and 'masks'.
+            Masks can be full size or cropped to their rois.
+        class_names: Class names indexed by class id
+        shape: (height, width) of the image. Defaults to the extent of the rois.
+        min_length: Shortest segment in pixels fitted to the medial axis
+        max_gap: Largest gap in pixels bridged within one segment
+        angle_tolerance: Largest angle in radians between merged segments
+        offset_tolerance: Largest sideways offset in pixels between merged segments
+        snap_distance: Distance in pixels within which endpoints are joined.
+            Defaults to the median wall thickness.
+
+    Returns:
+        A dict with 'nodes', a list of [x, y] junctions and endpoints, and
+        'segments', a list of {"nodes": [i, j], "thickness": t} wall segments
+    """
+    union = wall_union(r, class_names, shape)
+    graph = {"nodes": [], "segments": []}
+    if not union.any():
+        return graph
+    dist = cv2.distanceTransform(union, cv2.DIST_L2, 3)
+    axis = medial_axis(union, dist)
+    lines = cv2.HoughLinesP(axis, 1, np.pi / 180, threshold=min_length,
+                            minLineLength=min_length, maxLineGap=max_gap)
+    if lines is None:
+        return graph
+    segments = merge_collinear(lines.reshape(-1, 4).astype(np.float64),
+                               angle_tolerance, offset_tolerance, max_gap)
+    if snap_distance is None:
+        snap_distance = max(2 * float(np.median(dist[axis > 0])), max_gap)
+    nodes, edges = junction_graph(segments, snap_distance)
+    thickness = segment_thickness(dist, nodes, edges)
+    graph["nodes"] = np.round(nodes, 1).tolist()
+    graph["segments"] = [{"nodes": [int(i), int(j)], "thickness": round(float(t), 1)}
+                         for (i, j), t in zip(edges, thickness)]
+    return graph
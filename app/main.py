@@ -2,7 +2,8 @@ import requests
 import os
 import shutil
 import uuid
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Literal, Optional
 import sys
 from app.config import DB_SERVER, DB_NAME, DB_USER, DB_PASSWORD, SHOPIFY_ACCESS_TOKEN
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -11,7 +12,6 @@ from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Body, Form
 from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -125,6 +125,14 @@ class FloorplanElement(BaseModel):
 from floorplan.preprocess import preprocess_image
 # Use detection factory to automatically switch between real and mock implementations
 from floorplan.mock_detection import load_model, detect_objects
+from floorplan.results import (
+    RENDER_STYLES, COLOR_SCHEMES, load_detections, load_json, overlay_filename, render_overlay,
+    save_json
+)
+from floorplan.spatial import ElementIndex
+from floorplan.vectorize import vectorize_walls
+from floorplan.generation import detection_openings, generate_model
+from floorplan.rooms import segment_rooms
 
 # Load the Mask R-CNN model once at startup
 model = None
@@ -141,13 +149,81 @@ def get_model():
     return model
 
 
-def process_floorplan_image(file_path):
+def get_detections_path(result_id):
+    """Path of the stored detection result for a result id"""
+    return os.path.join(OUTPUT_DIR, f"{result_id}_detections.npz")
+
+
+def get_elements_path(result_id):
+    """Path of the stored elements for a result id"""
+    return os.path.join(OUTPUT_DIR, f"{result_id}_elements.json")
+
+
+@lru_cache(maxsize=64)
+def get_element_index(result_id):
+    """Return the spatial index of a result's elements, built on first use.
+    Results never change once stored, so indexes are cached by id."""
+    elements_path = get_elements_path(os.path.basename(result_id))
+    if not os.path.exists(elements_path):
+        raise HTTPException(status_code=404, detail="Result not found")
+    return ElementIndex(load_json(elements_path))
+
+
+def get_wall_graph(result_id):
+    """Return the wall centerline graph of a result, vectorizing and caching
+    it on first request"""
+    graph_path = os.path.join(OUTPUT_DIR, f"{result_id}_walls.json")
+    if not os.path.exists(graph_path):
+        detections_path = get_detections_path(result_id)
+        if not os.path.exists(detections_path):
+            raise HTTPException(status_code=404, detail="Result not found")
+        save_json(graph_path, vectorize_walls(load_detections(detections_path)))
+    return load_json(graph_path)
+
+
+def get_rooms(result_id):
+    """Return the rooms of a result, segmenting and caching them on first
+    request"""
+    rooms_path = os.path.join(OUTPUT_DIR, f"{result_id}_rooms.json")
+    if not os.path.exists(rooms_path):
+        detections_path = get_detections_path(result_id)
+        if not os.path.exists(detections_path):
+            raise HTTPException(status_code=404, detail="Result not found")
+        save_json(rooms_path, {"rooms": segment_rooms(load_detections(detections_path))})
+    return load_json(rooms_path)
+
+
+def get_3d_model(result_id):
+    """Return the path of a result's 3D model, generating and caching it on
+    first request"""
+    model_path = os.path.join(OUTPUT_DIR, f"{result_id}_model.glb")
+    if not os.path.exists(model_path):
+        graph = get_wall_graph(result_id)
+        r = load_detections(get_detections_path(result_id))
+        generate_model(graph, detection_openings(r), model_path)
+    return model_path
+
+
+def get_overlay(result_id, style="full", colors="instance"):
+    """Return the path of a result's overlay image, rendering and caching it
+    on first request"""
+    output_path = os.path.join(OUTPUT_DIR, overlay_filename(result_id, style, colors))
+    if not os.path.exists(output_path):
+        detections_path = get_detections_path(result_id)
+        if not os.path.exists(detections_path):
+            raise HTTPException(status_code=404, detail="Result not found")
+        render_overlay(detections_path, output_path, style=style, colors=colors)
+    return output_path
+
+
+def process_floorplan_image(file_path, tolerance=None, snap_walls=None):
     """Process a floorplan image and return detection results"""
     try:
         # Generate unique IDs for processed files
         file_id = str(uuid.uuid4())
         processed_path = os.path.join(PROCESSED_DIR, f"{file_id}_preprocessed.png")
-        output_path = os.path.join(OUTPUT_DIR, f"{file_id}_detected.jpg")
+        output_path = os.path.join(OUTPUT_DIR, overlay_filename(file_id))
+        detections_path = get_detections_path(file_id)
         
         # Step 1: Preprocess the image
         preprocess_image(file_path, processed_path)
@@ -155,15 +231,18 @@ def process_floorplan_image(file_path):
         # Step 2: Load model and perform detection
         model = get_model()
         
-        # Step 3: Detect objects
-        results = detect_objects(processed_path, output_path, model, return_json=True)
+        # Step 3: Detect objects. The output image is rendered on first request.
+        results = detect_objects(processed_path, output_path, model, return_json=True,
+                                 tolerance=tolerance, snap_walls=snap_walls,
+                                 render=False, detections_path=detections_path)
+        save_json(get_elements_path(file_id), results)
         
         # Return results
         return {
             "id": file_id,
             "filename": os.path.basename(file_path),
             "elements": results,
-            "image_url": f"/api/floorplan/images/{file_id}_detected.jpg"
+            "image_url": f"/api/floorplan/images/{overlay_filename(file_id)}"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing floorplan: {str(e)}")
@@ -178,8 +257,11 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Mount static files directory for serving images
-app.mount("/api/floorplan/images", StaticFiles(directory=OUTPUT_DIR), name="floorplan_images")
+# Overlay rendering options shared by the image endpoints
+STYLE_PATTERN = "^(" + "|".join(RENDER_STYLES) + ")$"
+COLORS_PATTERN = "^(" + "|".join(COLOR_SCHEMES) + ")$"
+# Element groups accepted by the spatial query endpoints
+ElementGroup = Literal["walls", "windows", "doors"]
 
 
 @app.get("/health")
@@ -188,7 +270,11 @@ def health():
 
 
 @app.post("/api/floorplan/detect", response_model=DetectionResult)
-async def detect_floorplan(file: UploadFile = File(...)):
+async def detect_floorplan(
+    file: UploadFile = File(...),
+    tolerance: Optional[float] = Query(None, ge=0, description="Contour simplification tolerance in pixels"),
+    snap_walls: Optional[bool] = Query(None, description="Snap wall contours to axis-aligned rectangles"),
+):
     """Upload and process a floorplan image"""
     # Validate file type
     if not file.content_type.startswith('image/'):
@@ -205,7 +291,7 @@ async def detect_floorplan(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, buffer)
         
         # Process the floorplan image
-        result = process_floorplan_image(temp_file_path)
+        result = process_floorplan_image(temp_file_path, tolerance=tolerance, snap_walls=snap_walls)
         
         return result
     
@@ -216,12 +302,89 @@ async def detect_floorplan(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing the floorplan: {str(e)}")
 
 
+@app.get("/api/floorplan/images/{filename}")
+def get_floorplan_image(
+    filename: str,
+    style: str = Query("full", pattern=STYLE_PATTERN),
+    colors: str = Query("instance", pattern=COLORS_PATTERN),
+):
+    """Serve an output image. Overlay images are rendered on first request"""
+    filename = os.path.basename(filename)
+    if filename.endswith("_detected.jpg"):
+        result_id = filename[:-len("_detected.jpg")]
+        return FileResponse(get_overlay(result_id, style, colors))
+
+    output_file = os.path.join(OUTPUT_DIR, filename)
+    if not os.path.isfile(output_file):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(output_file)
+
+
 @app.get("/api/floorplan/results/{result_id}")
-def get_floorplan_result(result_id: str):
+def get_floorplan_result(
+    result_id: str,
+    style: str = Query("full", pattern=STYLE_PATTERN),
+    colors: str = Query("instance", pattern=COLORS_PATTERN),
+):
     """Get the results of a specific floorplan detection"""
-    output_file = os.path.join(OUTPUT_DIR, f"{result_id}_detected.jpg")
-    
-    if not os.path.exists(output_file):
-        raise HTTPException(status_code=404, detail="Result not found")
-    
-    return FileResponse(output_file)
+    return FileResponse(get_overlay(os.path.basename(result_id), style, colors))
+
+
+@app.get("/api/floorplan/results/{result_id}/walls")
+def get_floorplan_walls(result_id: str):
+    """Get the walls as a graph of centerline segments with their thickness"""
+    return get_wall_graph(os.path.basename(result_id))
+
+
+@app.get("/api/floorplan/results/{result_id}/rooms")
+def get_floorplan_rooms(result_id: str):
+    """Get the rooms as polygons with their areas and centroids"""
+    return get_rooms(os.path.basename(result_id))
+
+
+@app.get("/api/floorplan/results/{result_id}/model.glb")
+def get_floorplan_model(result_id: str):
+    """Get the walls extruded to a 3D model with door and window openings,
+    as binary glTF"""
+    return FileResponse(get_3d_model(os.path.basename(result_id)),
+                        media_type="model/gltf-binary")
+
+
+@app.get("/api/floorplan/results/{result_id}/elements")
+def query_floorplan_elements(
+    result_id: str,
+    x1: float = Query(..., description="Left edge of the query window in pixels"),
+    y1: float = Query(..., description="Top edge of the query window in pixels"),
+    x2: float = Query(..., description="Right edge of the query window in pixels"),
+    y2: float = Query(..., description="Bottom edge of the query window in pixels"),
+    group: Optional[List[ElementGroup]] = Query(None),
+):
+    """Get the elements whose bounding boxes intersect a window"""
+    if x2 < x1 or y2 < y1:
+        raise HTTPException(status_code=400, detail="Empty query window")
+    index = get_element_index(result_id)
+    return {"elements": index.query((x1, y1, x2, y2), groups=group)}
+
+
+@app.get("/api/floorplan/results/{result_id}/nearest")
+def nearest_floorplan_elements(
+    result_id: str,
+    x: float = Query(..., description="X coordinate of the query point in pixels"),
+    y: float = Query(..., description="Y coordinate of the query point in pixels"),
+    k: int = Query(1, ge=1, le=1000, description="Number of elements to return"),
+    group: Optional[List[ElementGroup]] = Query(None),
+):
+    """Get the k elements closest to a point, closest first"""
+    index = get_element_index(result_id)
+    return {"elements": index.nearest((x, y), k, groups=group)}
+
+
+@app.get("/api/floorplan/results/{result_id}/adjacency")
+def floorplan_adjacency(
+    result_id: str,
+    max_distance: float = Query(0, ge=0, description="Largest gap in pixels that counts as touching"),
+    wall: Optional[int] = Query(None, ge=0, description="Only return openings touching this wall"),
+):
+    """Get the walls that each door and window touches"""
+    index = get_element_index(result_id)
+    return {"openings": index.adjacency(max_distance, wall=wall)}
@@ -0,0 +1,76 @@
+"""
+Evaluate the floorplan model on a dataset split.
+
+Runs the model on the images of the split that aren't in the prediction
+cache yet, then reports COCO-style AP and AR for each class, averaged over
+IoU thresholds 0.5 to 0.95. Predictions are cached per weights file, and
+are predicted again when the weights or config change. Without --weights
+only the cache is evaluated, so the evaluation can be re-run, e.g. at
+other thresholds, without inference.
+
+Usage:
+    python aroomy_prediction.py --weights mrcnn/best_weights.h5 --subset val
+    python aroomy_prediction.py --cache predictions/best_weights/val --iou-thresholds 0.5 0.75
+"""
+import os
+import argparse
+
+from mrcnn import evaluate
+from mrcnn import model as modellib
+from aroomy_train import FloorplanConfig, FloorplanDataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the floorplan model")
+    parser.add_argument("--weights", help="Path to the trained .h5 weights. "
+                                          "Without them, only cached predictions are evaluated.")
+    parser.add_argument("--dataset", default="dataset", help="Dataset directory")
+    parser.add_argument("--subset", default="val", help="Dataset split to evaluate")
+    parser.add_argument("--cache", default=None,
+                        help="Prediction cache directory. Defaults to "
+                             "predictions/<weights file name>/<subset>.")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Evaluate on the first images only")
+    parser.add_argument("--iou-thresholds", type=float, nargs="+",
+                        default=list(evaluate.IOU_THRESHOLDS))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes that match images. Defaults to the CPU count.")
+    args = parser.parse_args()
+    if not args.weights and not args.cache:
+        parser.error("Pass --weights to predict, or --cache to evaluate cached predictions.")
+
+    dataset = FloorplanDataset()
+    dataset.load_floorplan(args.dataset, args.subset)
+    dataset.prepare()
+    image_ids = dataset.image_ids[:args.limit]
+
+    if args.weights:
+        class InferenceConfig(FloorplanConfig):
+            GPU_COUNT = 1
+            IMAGES_PER_GPU = 1
+
+        config = InferenceConfig()
+        weights_name = os.path.splitext(os.path.basename(args.weights))[0]
+        # Predictions of other weights or configs in the cache are replaced
+        cache = evaluate.PredictionCache(
+            args.cache or os.path.join("predictions", weights_name, args.subset),
+            evaluate.model_fingerprint(args.weights, config))
+        model = modellib.MaskRCNN(mode="inference", config=config,
+                                  model_dir=os.path.dirname(os.path.abspath(args.weights)))
+        model.load_weights(args.weights, by_name=True)
+        evaluate.predict_dataset(model, dataset, cache, image_ids)
+    else:
+        cache = evaluate.PredictionCache(args.cache)
+        missing = [i for i in image_ids if evaluate.cache_key(dataset, i) not in cache]
+        if missing:
+            parser.error("{} images have no cached predictions in {}. Pass --weights."
+                         .format(len(missing), cache.directory))
+
+    results = evaluate.evaluate_dataset(dataset, cache, image_ids, args.iou_thresholds,
+                                        workers=args.workers)
+    print("{} {} images".format(len(image_ids), args.subset))
+    print(evaluate.format_report(results))
+
+
+if __name__ == "__main__":
+    main()
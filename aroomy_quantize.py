@@ -0,0 +1,110 @@
+"""
+Calibrate and evaluate quantized floorplan models.
+
+Exports the trained model to TFLite once in float and once per requested
+quantization, calibrating the int8 layer groups on a sample of the train
+split, and reports the mAP of each on the val split next to its size and
+latency, so a quantized model is only deployed when it is worth it.
+
+Usage:
+    python aroomy_quantize.py --weights mrcnn/aroomy_mask_rcnn_trained.h5 \\
+        --quantize backbone=int8,fpn=int8,heads=dynamic backbone=dynamic,fpn=dynamic
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+from mrcnn import export, utils
+from mrcnn import model as modellib
+from aroomy_train import FloorplanConfig, FloorplanDataset
+
+
+def evaluate(model, dataset, image_ids, iou_threshold=0.5):
+    """Runs a model on images of a dataset and scores the detections.
+
+    Returns:
+        mAP: Mean of the utils.compute_ap() of each image
+        seconds: Mean detection time per image
+    """
+    APs = []
+    images = (dataset.load_image(image_id) for image_id in image_ids)
+    start = time.perf_counter()
+    for image_id, r in zip(image_ids, model.detect_many(images, sparse_masks=True)):
+        gt_masks, gt_class_ids = dataset.load_mask(image_id)
+        gt_boxes = utils.extract_bboxes(gt_masks)
+        AP, _, _, _ = utils.compute_ap(gt_boxes, gt_class_ids, gt_masks,
+                                       r['rois'], r['class_ids'], r['scores'], r['masks'],
+                                       iou_threshold=iou_threshold)
+        APs.append(AP)
+    seconds = (time.perf_counter() - start) / max(len(image_ids), 1)
+    return float(np.mean(APs)) if APs else 0.0, seconds
+
+
+def model_size(path):
+    """Total size in bytes of the TFLite models in an export directory"""
+    return sum(os.path.getsize(os.path.join(path, f))
+               for f in os.listdir(path) if f.endswith(".tflite"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize and evaluate the floorplan model")
+    parser.add_argument("--weights", required=True, help="Path to the trained .h5 weights")
+    parser.add_argument("--dataset", default="dataset", help="Dataset directory")
+    parser.add_argument("--output", default="quantized", help="Directory to export to")
+    parser.add_argument("--quantize", nargs="+", default=["backbone=int8,fpn=int8,heads=dynamic"],
+                        help="Quantizations to evaluate, each as group=mode,group=mode. "
+                             "Groups: backbone, fpn, heads. Modes: float, dynamic, int8.")
+    parser.add_argument("--calibration-size", type=int, default=32,
+                        help="Number of train images to calibrate int8 groups on")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Evaluate on the first val images only")
+    parser.add_argument("--iou-threshold", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    candidates = [export.parse_quantization(spec) for spec in args.quantize]
+
+    class InferenceConfig(FloorplanConfig):
+        GPU_COUNT = 1
+        IMAGES_PER_GPU = 1
+        INFERENCE_MASK_DTYPE = "uint8"
+
+    dataset_train = FloorplanDataset()
+    dataset_train.load_floorplan(args.dataset, "train")
+    dataset_train.prepare()
+    dataset_val = FloorplanDataset()
+    dataset_val.load_floorplan(args.dataset, "val")
+    dataset_val.prepare()
+    val_ids = dataset_val.image_ids[:args.limit]
+
+    model = modellib.MaskRCNN(mode="inference", config=InferenceConfig(),
+                              model_dir=os.path.dirname(os.path.abspath(args.weights)))
+    model.load_weights(args.weights, by_name=True)
+
+    rng = np.random.RandomState(0)
+    calibration_ids = rng.choice(dataset_train.image_ids,
+                                 min(args.calibration_size, len(dataset_train.image_ids)),
+                                 replace=False)
+    calibration_images = [dataset_train.load_image(i) for i in calibration_ids]
+
+    rows = [("keras",) + evaluate(model, dataset_val, val_ids, args.iou_threshold) + (None,)]
+    for name, quantization in [("float", {})] + [(spec, q) for spec, q in zip(args.quantize, candidates)]:
+        path = os.path.join(args.output, name.replace(",", "_").replace("=", "-"))
+        print("Exporting {} to {}".format(name, path))
+        export.export_tflite(model, path, quantization=quantization,
+                             calibration_images=calibration_images)
+        exported = export.ExportedModel(path, runtime="tflite", num_threads=args.threads)
+        rows.append((name,) + evaluate(exported, dataset_val, val_ids, args.iou_threshold) +
+                    (model_size(path),))
+
+    print("\n{} val images, mAP at IoU {}".format(len(val_ids), args.iou_threshold))
+    print("{:45} {:>8} {:>8} {:>10} {:>9}".format("model", "mAP", "change", "ms/image", "MB"))
+    baseline = rows[0][1]
+    for name, mAP, seconds, size in rows:
+        print("{:45} {:8.4f} {:+8.4f} {:10.1f} {:>9}".format(
+            name, mAP, mAP - baseline, seconds * 1000,
+            "" if size is None else "{:.1f}".format(size / 2 ** 20)))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,6 @@ from mrcnn.config import Config
 from mrcnn import visualize
 from mrcnn.model import log
 import cv2
-import imgaug
-import imgaug.augmenters as iaa
 
 # Disable eager execution for TensorFlow 2.x compatibility
 tf.compat.v1.disable_eager_execution()
@@ -30,7 +28,15 @@ class FloorplanConfig(Config):
 # Dataset preparation class
 class FloorplanDataset(utils.Dataset):
     def load_floorplan(self, dataset_dir, subset):
-        """Load a subset of the Aroomy dataset."""
+        """Load a subset of the Aroomy dataset.
+
+        Annotations are grouped by image once, and each image only keeps
+        its own polygons, as NumPy arrays:
+        class_ids: [instances] class IDs
+        points: [points, (x, y)] the points of all polygons
+        polygon_offsets: [polygons + 1] where each polygon starts in points
+        polygon_instances: [polygons] the instance each polygon belongs to
+        """
         # Add classes
         self.add_class("aroomy", 1, "door")
         self.add_class("aroomy", 2, "wall")
@@ -45,104 +51,126 @@ class FloorplanDataset(utils.Dataset):
         assert "images" in annotations, "Missing 'images' key in annotations JSON."
         assert "annotations" in annotations, "Missing 'annotations' key in annotations JSON."
 
+        # Group the annotations by image
+        image_annotations = {}
+        for annotation in annotations["annotations"]:
+            image_annotations.setdefault(annotation["image_id"], []).append(annotation)
+
         # Add images
-        for annotation in annotations["images"]:
-            image_id = annotation["id"]
-            image_path = os.path.join(dataset_dir, subset, "images", annotation["file_name"])
-            height, width = annotation["height"], annotation["width"]
-            self.add_image("aroomy", image_id=image_id, path=image_path, width=width, height=height, annotations=annotations)
+        for image in annotations["images"]:
+            image_id = image["id"]
+            image_path = os.path.join(dataset_dir, subset, "images", image["file_name"])
+            height, width = image["height"], image["width"]
+            instances = image_annotations.get(image_id, [])
+            polygons = [np.array(polygon, dtype=np.int32).reshape((-1, 2))
+                        for annotation in instances for polygon in annotation["segmentation"]]
+            sizes = [len(polygon) for polygon in polygons]
+            self.add_image(
+                "aroomy", image_id=image_id, path=image_path, width=width, height=height,
+                class_ids=np.array([a["category_id"] + 1 for a in instances], dtype=np.int32),
+                points=np.concatenate([np.zeros((0, 2), np.int32)] + polygons),
+                polygon_offsets=np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]),
+                polygon_instances=np.repeat(np.arange(len(instances), dtype=np.int32),
+                                            [len(a["segmentation"]) for a in instances]))
 
     def load_mask(self, image_id):
-        """Generate instance masks for an image."""
-        image_info = self.image_info[image_id]
-        annotations = image_info["annotations"]
-        masks = []
-        class_ids = []
+        """Generate instance masks for an image.
 
-        for annotation in annotations["annotations"]:
-            if annotation["image_id"] == image_info["id"]:
-                class_id = annotation["category_id"] + 1
-                segmentation = annotation["segmentation"]
-                mask = np.zeros([image_info["height"], image_info["width"]], dtype=np.uint8)
-                for polygon in segmentation:
-                    poly = np.array(polygon, dtype=np.int32).reshape((-1, 2))
-                    cv2.fillPoly(mask, [poly], 1)
-                masks.append(mask)
-                class_ids.append(class_id)
-
-        if not masks:
-            masks = np.zeros([image_info["height"], image_info["width"], 0], dtype=np.uint8)
-            class_ids = np.array([], dtype=np.int32)
-        else:
-            masks = np.stack(masks, axis=-1)
-
-        class_ids = np.array(class_ids, dtype=np.int32)
-        return masks, class_ids
-
-# Paths and configuration
-print("Setting path configuration...")
-ROOT_DIR = os.path.abspath(".")  # Ensure absolute path
-MODEL_DIR = os.path.abspath("mrcnn")
-os.makedirs(MODEL_DIR, exist_ok=True)
-
-# COCO_WEIGHTS_PATH = os.path.join(ROOT_DIR, "coco/mask_rcnn_aroomy_0025.h5")
-COCO_WEIGHTS_PATH = os.path.join(ROOT_DIR, "coco/best_initial_weight.h5")
-DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
-print("Set path configuration...")
-
-# Prepare datasets
-print("Preparing dataset...")
-config = FloorplanConfig()
-dataset_train = FloorplanDataset()
-dataset_train.load_floorplan(DATASET_DIR, "train")
-dataset_train.prepare()
-
-dataset_val = FloorplanDataset()
-dataset_val.load_floorplan(DATASET_DIR, "val")
-dataset_val.prepare()
-print("Prepared dataset")
-
-# Dynamically update STEPS_PER_EPOCH after dataset preparation
-config.STEPS_PER_EPOCH = len(dataset_train.image_ids)
-print(f"STEPS_PER_EPOCH set to: {config.STEPS_PER_EPOCH}")
-
-# Validate dataset
-print("Validating dataset...")
-for image_id in dataset_train.image_ids[:5]:  # Print only first 5 for efficiency
-    image = dataset_train.load_image(image_id)
-    masks, class_ids = dataset_train.load_mask(image_id)
-    print(f"Image {image_id}: Shape={image.shape}, Masks={masks.shape}, Classes={class_ids}")
-
-# Create model
-print("Creating model...")
-model = modellib.MaskRCNN(mode="training", config=config, model_dir=MODEL_DIR)
-print("Created model...")
-
-# Load pretrained weights
-if not os.path.exists(COCO_WEIGHTS_PATH):
-    utils.download_trained_weights(COCO_WEIGHTS_PATH)
-
-print("Loading weights...")
-model.load_weights(COCO_WEIGHTS_PATH, by_name=True, exclude=["mrcnn_class_logits", "mrcnn_bbox_fc", "mrcnn_mask"])
-print("Loaded weights")
-
-# Data Augmentation to Reduce Overfitting
-# augmentation = iaa.Sequential([
-#     iaa.Fliplr(0.5),  # Flip horizontally with 50% probability
-#     #iaa.Affine(rotate=(-15, 15), fit_output=True),  # Keep original size
-#     iaa.GaussianBlur(sigma=(0, 1.0)),  # Slight blurring
-#     iaa.Multiply((0.8, 1.2))  # Brightness variation
-# ], random_order=True) 
-
-print("\n🚀 Step 1: Training heads only...")
-model.train(dataset_train, dataset_val,
-            learning_rate=config.LEARNING_RATE,
-            epochs=20,
-            layers="all"
-            )
-
-# Save trained model
-print("Training complete.")
-model_path = os.path.join(MODEL_DIR, "aroomy_mask_rcnn_trained.h5")
-model.keras_model.save_weights(model_path)
-print(f"Model weights saved at {model_path}")
\ No newline at end of file
+        Each polygon is filled within its bounding box, straight into the
+        [height, width, instances] mask array.
+        """
+        image_info = self.image_info[image_id]
+        height, width = image_info["height"], image_info["width"]
+        class_ids = image_info["class_ids"]
+        points, offsets = image_info["points"], image_info["polygon_offsets"]
+        masks = np.zeros([height, width, len(class_ids)], dtype=np.uint8)
+
+        for i, instance in enumerate(image_info["polygon_instances"]):
+            polygon = points[offsets[i]:offsets[i + 1]]
+            if not len(polygon):
+                continue
+            # Bounding box of the polygon, clipped to the image
+            x1, y1 = np.maximum(polygon.min(axis=0), 0)
+            x2, y2 = np.minimum(polygon.max(axis=0) + 1, [width, height])
+            if x2 <= x1 or y2 <= y1:
+                continue
+            crop = np.zeros([y2 - y1, x2 - x1], dtype=np.uint8)
+            cv2.fillPoly(crop, [polygon], 1, offset=(-int(x1), -int(y1)))
+            masks[y1:y2, x1:x2, instance] |= crop
+
+        return masks, class_ids.copy()
+
+def main():
+    # Paths and configuration
+    print("Setting path configuration...")
+    ROOT_DIR = os.path.abspath(".")  # Ensure absolute path
+    MODEL_DIR = os.path.abspath("mrcnn")
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    # COCO_WEIGHTS_PATH = os.path.join(ROOT_DIR, "coco/mask_rcnn_aroomy_0025.h5")
+    COCO_WEIGHTS_PATH = os.path.join(ROOT_DIR, "coco/best_initial_weight.h5")
+    DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
+    print("Set path configuration...")
+
+    # Prepare datasets
+    print("Preparing dataset...")
+    config = FloorplanConfig()
+    dataset_train = FloorplanDataset()
+    dataset_train.load_floorplan(DATASET_DIR, "train")
+    dataset_train.prepare()
+
+    dataset_val = FloorplanDataset()
+    dataset_val.load_floorplan(DATASET_DIR, "val")
+    dataset_val.prepare()
+    print("Prepared dataset")
+
+    # Dynamically update STEPS_PER_EPOCH after dataset preparation
+    config.STEPS_PER_EPOCH = len(dataset_train.image_ids)
+    print(f"STEPS_PER_EPOCH set to: {config.STEPS_PER_EPOCH}")
+
+    # Validate dataset
+    print("Validating dataset...")
+    for image_id in dataset_train.image_ids[:5]:  # Print only first 5 for efficiency
+        image = dataset_train.load_image(image_id)
+        masks, class_ids = dataset_train.load_mask(image_id)
+        print(f"Image {image_id}: Shape={image.shape}, Masks={masks.shape}, Classes={class_ids}")
+
+    # Create model
+    print("Creating model...")
+    model = modellib.MaskRCNN(mode="training", config=config, model_dir=MODEL_DIR)
+    print("Created model...")
+
+    # Load pretrained weights
+    if not os.path.exists(COCO_WEIGHTS_PATH):
+        utils.download_trained_weights(COCO_WEIGHTS_PATH)
+
+    print("Loading weights...")
+    model.load_weights(COCO_WEIGHTS_PATH, by_name=True, exclude=["mrcnn_class_logits", "mrcnn_bbox_fc", "mrcnn_mask"])
+    print("Loaded weights")
+
+    # Data Augmentation to Reduce Overfitting. imgaug is only needed for training.
+    import imgaug
+    import imgaug.augmenters as iaa
+    # augmentation = iaa.Sequential([
+    #     iaa.Fliplr(0.5),  # Flip horizontally with 50% probability
+    #     #iaa.Affine(rotate=(-15, 15), fit_output=True),  # Keep original size
+    #     iaa.GaussianBlur(sigma=(0, 1.0)),  # Slight blurring
+    #     iaa.Multiply((0.8, 1.2))  # Brightness variation
+    # ], random_order=True) 
+
+    print("\n🚀 Step 1: Training heads only...")
+    model.train(dataset_train, dataset_val,
+                learning_rate=config.LEARNING_RATE,
+                epochs=20,
+                layers="all"
+                )
+
+    # Save trained model
+    print("Training complete.")
+    model_path = os.path.join(MODEL_DIR, "aroomy_mask_rcnn_trained.h5")
+    model.keras_model.save_weights(model_path)
+    print(f"Model weights saved at {model_path}")
+
+
+if __name__ == "__main__":
+    main()
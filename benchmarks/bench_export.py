@@ -0,0 +1,95 @@
+"""
+Benchmark detect() latency of the Keras model against the same model
+exported to SavedModel and TFLite and run through mrcnn.export.ExportedModel.
+Also reports the largest difference of each runtime's outputs to Keras.
+Runs a randomly initialized model unless --weights is given.
+
+Usage: python benchmarks/bench_export.py [--size 256] [--backbone resnet50]
+                                         [--weights mask_rcnn.h5] [--threads 4]
+                                         [--quantize backbone=int8,fpn=int8,heads=dynamic]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import export
+from mrcnn import model as modellib
+from mrcnn.config import Config
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exported model latency")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--backbone", default="resnet50")
+    parser.add_argument("--weights", help="Optional .h5 weights, loaded by name")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--runtimes", nargs="+", default=["savedmodel", "tflite"],
+                        choices=["savedmodel", "tflite"])
+    parser.add_argument("--quantize", nargs="*", default=[],
+                        help="Also run TFLite quantized per layer group, each as "
+                             "group=mode,..., e.g. backbone=int8,fpn=int8,heads=dynamic")
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        NAME = "bench"
+        NUM_CLASSES = 1 + 3
+        GPU_COUNT = 1
+        IMAGES_PER_GPU = 1
+        BACKBONE = args.backbone
+        IMAGE_MIN_DIM = args.size
+        IMAGE_MAX_DIM = args.size
+        INFERENCE_MASK_DTYPE = "uint8"
+
+    model = modellib.MaskRCNN(mode="inference", config=BenchConfig(),
+                              model_dir=tempfile.mkdtemp())
+    if args.weights:
+        model.load_weights(args.weights, by_name=True)
+    image = np.random.randint(0, 255, (args.size, args.size, 3)).astype(np.uint8)
+    molded_images, image_metas, _ = model.mold_inputs([image])
+    anchors = model.get_anchors(molded_images[0].shape)[np.newaxis]
+    inputs = [molded_images, image_metas, anchors]
+    expected = model.predict_detections(*inputs)
+
+    print("{} backbone, {}x{} image, batch of 1".format(args.backbone, args.size, args.size))
+    print("{:50} {:>10} {:>12} {:>12}".format("runtime", "detect ms", "max box diff", "max mask diff"))
+    print("{:50} {:10.2f}".format("keras", timeit(lambda: model.detect([image]), args.repeat)))
+    export_dir = tempfile.mkdtemp()
+    # A random image calibrates as well as any for random weights
+    variants = [(runtime, None) for runtime in args.runtimes] + \
+        [("tflite", export.parse_quantization(spec)) for spec in args.quantize]
+    for i, (runtime, quantization) in enumerate(variants):
+        path = os.path.join(export_dir, str(i))
+        if runtime == "savedmodel":
+            export.export_saved_model(model, path)
+        else:
+            export.export_tflite(model, path, quantization=quantization,
+                                 calibration_images=[image])
+        exported = export.ExportedModel(path, runtime=runtime, num_threads=args.threads)
+        outputs = exported.predict_detections(*inputs)
+        exported.detect([image])  # Warm up
+        name = runtime if quantization is None else "tflite " + ",".join(
+            "{}={}".format(*item) for item in quantization.items())
+        print("{:50} {:10.2f} {:12.2e} {:12d}".format(
+            name, timeit(lambda: exported.detect([image]), args.repeat),
+            np.abs(outputs[0] - expected[0]).max(),
+            int(np.abs(outputs[1].astype(np.int32) - expected[1]).max())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark the per call latency of Mask R-CNN inference:
+keras_model.predict() against the compiled MaskRCNN.inference_function()
+that detect() uses. Runs a randomly initialized model, so no weights are
+needed.
+
+Usage: python benchmarks/bench_inference.py [--size 256] [--backbone resnet50]
+                                           [--mask-dtype uint8]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import model as modellib
+from mrcnn.config import Config
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference latency")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--backbone", default="resnet50")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--mask-dtype", default="float32", choices=["float32", "float16", "uint8"])
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        NAME = "bench"
+        NUM_CLASSES = 1 + 3
+        GPU_COUNT = 1
+        IMAGES_PER_GPU = 1
+        BACKBONE = args.backbone
+        IMAGE_MIN_DIM = args.size
+        IMAGE_MAX_DIM = args.size
+        INFERENCE_MASK_DTYPE = args.mask_dtype
+
+    model = modellib.MaskRCNN(mode="inference", config=BenchConfig(),
+                              model_dir=tempfile.mkdtemp())
+    image = np.random.randint(0, 255, (args.size, args.size, 3)).astype(np.uint8)
+    molded_images, image_metas, _ = model.mold_inputs([image])
+    anchors = model.get_anchors(molded_images[0].shape)[np.newaxis]
+    inputs = [molded_images, image_metas, anchors]
+
+    # Warm up both paths
+    model.keras_model.predict(inputs, verbose=0)
+    model.predict_detections(*inputs)
+
+    print("{} backbone, {}x{} image, batch of 1".format(args.backbone, args.size, args.size))
+    outputs = model.keras_model.predict(inputs, verbose=0)
+    print("predict() output size:  {:9.1f} KB".format(sum(o.nbytes for o in outputs) / 1024))
+    outputs = model.predict_detections(*inputs)
+    print("serving output size:    {:9.1f} KB ({} masks)".format(
+        sum(o.nbytes for o in outputs) / 1024, args.mask_dtype))
+    print("keras_model.predict():  {:9.2f} ms".format(timeit(
+        lambda: model.keras_model.predict(inputs, verbose=0), args.repeat)))
+    print("inference_function():   {:9.2f} ms".format(timeit(
+        lambda: model.predict_detections(*inputs), args.repeat)))
+    print("detect() end to end:    {:9.2f} ms".format(timeit(
+        lambda: model.detect([image]), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
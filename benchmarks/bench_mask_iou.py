@@ -0,0 +1,93 @@
+"""
+Benchmark mask IoU for evaluation: the previous dense matrix product of
+the flattened float32 masks against the box-pruned, bit-packed
+utils.compute_overlaps_masks(), and utils.compute_overlaps_sparse_masks()
+on box crops. Reports time and the peak memory allocated by each.
+
+Usage: python benchmarks/bench_mask_iou.py [--size 1024] [--pred 35] [--gt 100]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def peak_memory(fn):
+    """Returns the peak memory allocated while running fn(), in MB"""
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def matmul_compute_overlaps_masks(masks1, masks2):
+    """The previous implementation of utils.compute_overlaps_masks()"""
+    masks1 = np.reshape(masks1 > .5, (-1, masks1.shape[-1])).astype(np.float32)
+    masks2 = np.reshape(masks2 > .5, (-1, masks2.shape[-1])).astype(np.float32)
+    area1 = np.sum(masks1, axis=0)
+    area2 = np.sum(masks2, axis=0)
+    intersections = np.dot(masks1.T, masks2)
+    union = area1[:, None] + area2[None, :] - intersections
+    return intersections / union
+
+
+def random_instances(rng, count, size):
+    """Boxes of walls, doors and rooms sized instances, filled 70%"""
+    masks = np.zeros((size, size, count), dtype=bool)
+    h = rng.randint(8, size // 4, count)
+    w = rng.randint(8, size // 4, count)
+    y1 = rng.randint(0, size - h)
+    x1 = rng.randint(0, size - w)
+    boxes = np.stack([y1, x1, y1 + h, x1 + w], axis=1)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        masks[y1:y2, x1:x2, i] = rng.rand(y2 - y1, x2 - x1) < 0.7
+    return boxes, masks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mask IoU")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--pred", type=int, default=35)
+    parser.add_argument("--gt", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    boxes1, masks1 = random_instances(rng, args.pred, args.size)
+    boxes2, masks2 = random_instances(rng, args.gt, args.size)
+    sparse1 = utils.dense_to_sparse_masks(boxes1, masks1)
+    sparse2 = utils.dense_to_sparse_masks(boxes2, masks2)
+    np.testing.assert_allclose(utils.compute_overlaps_masks(masks1, masks2),
+                               matmul_compute_overlaps_masks(masks1, masks2), atol=1e-6)
+
+    runs = [
+        ("matrix product", lambda: matmul_compute_overlaps_masks(masks1, masks2)),
+        ("bit-packed", lambda: utils.compute_overlaps_masks(masks1, masks2)),
+        ("bit-packed sparse", lambda: utils.compute_overlaps_sparse_masks(
+            boxes1, sparse1, boxes2, sparse2)),
+    ]
+    print("{} x {} instances on a {}x{} image".format(args.pred, args.gt, args.size, args.size))
+    print("{:20} {:>10} {:>10}".format("", "ms", "peak MB"))
+    for name, fn in runs:
+        print("{:20} {:10.2f} {:10.1f}".format(name, timeit(fn, args.repeat), peak_memory(fn)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark the mask conversions of the data generator: the previous per
+instance loops of extract_bboxes(), minimize_mask() and expand_mask()
+(resize() of each crop) against the batched versions in utils.
+
+Usage: python benchmarks/bench_masks.py [--size 1024] [--count 50]
+                                        [--mini-shape 56 56]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def loop_extract_bboxes(mask):
+    """The previous implementation of utils.extract_bboxes()"""
+    boxes = np.zeros([mask.shape[-1], 4], dtype=np.int32)
+    for i in range(mask.shape[-1]):
+        m = mask[:, :, i]
+        horizontal_indicies = np.where(np.any(m, axis=0))[0]
+        vertical_indicies = np.where(np.any(m, axis=1))[0]
+        if horizontal_indicies.shape[0]:
+            x1, x2 = horizontal_indicies[[0, -1]]
+            y1, y2 = vertical_indicies[[0, -1]]
+            boxes[i] = np.array([y1, x1, y2 + 1, x2 + 1])
+    return boxes
+
+
+def loop_minimize_mask(bbox, mask, mini_shape):
+    """The previous implementation of utils.minimize_mask(). Crops are cast
+    to float, which newer skimage requires for bilinear resizing.
+    """
+    mini_mask = np.zeros(mini_shape + (mask.shape[-1],), dtype=bool)
+    for i in range(mask.shape[-1]):
+        y1, x1, y2, x2 = bbox[i][:4]
+        m = mask[y1:y2, x1:x2, i].astype(np.float64)
+        mini_mask[:, :, i] = np.around(utils.resize(m, mini_shape)).astype(bool)
+    return mini_mask
+
+
+def loop_expand_mask(bbox, mini_mask, image_shape):
+    """The previous implementation of utils.expand_mask()"""
+    mask = np.zeros(image_shape[:2] + (mini_mask.shape[-1],), dtype=bool)
+    for i in range(mask.shape[-1]):
+        y1, x1, y2, x2 = bbox[i][:4]
+        m = utils.resize(mini_mask[:, :, i].astype(np.float64), (y2 - y1, x2 - x1))
+        mask[y1:y2, x1:x2, i] = np.around(m).astype(bool)
+    return mask
+
+
+def random_instances(rng, count, size):
+    """Walls, doors and rooms sized instances, half of them solid"""
+    masks = np.zeros((size, size, count), dtype=bool)
+    h = rng.randint(8, size // 4, count)
+    w = rng.randint(8, size // 4, count)
+    y1 = rng.randint(0, size - h)
+    x1 = rng.randint(0, size - w)
+    for i in range(count):
+        crop = np.ones((h[i], w[i]), bool) if i % 2 else rng.rand(h[i], w[i]) < 0.7
+        masks[y1[i]:y1[i] + h[i], x1[i]:x1[i] + w[i], i] = crop
+    return masks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mask conversions")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--mini-shape", type=int, nargs=2, default=[56, 56])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    mini_shape = tuple(args.mini_shape)
+
+    masks = random_instances(np.random.RandomState(0), args.count, args.size)
+    boxes = utils.extract_bboxes(masks)
+    mini = utils.minimize_mask(boxes, masks, mini_shape)
+    np.testing.assert_array_equal(boxes, loop_extract_bboxes(masks))
+    np.testing.assert_array_equal(mini, loop_minimize_mask(boxes, masks, mini_shape))
+    np.testing.assert_array_equal(utils.expand_mask(boxes, mini, masks.shape),
+                                  loop_expand_mask(boxes, mini, masks.shape))
+
+    runs = [
+        ("extract_bboxes", lambda: loop_extract_bboxes(masks),
+         lambda: utils.extract_bboxes(masks)),
+        ("minimize_mask", lambda: loop_minimize_mask(boxes, masks, mini_shape),
+         lambda: utils.minimize_mask(boxes, masks, mini_shape)),
+        ("expand_mask", lambda: loop_expand_mask(boxes, mini, masks.shape),
+         lambda: utils.expand_mask(boxes, mini, masks.shape)),
+    ]
+    print("{} instances on a {}x{} image".format(args.count, args.size, args.size))
+    print("{:16} {:>10} {:>10}".format("", "loop ms", "batch ms"))
+    for name, loop, batch in runs:
+        print("{:16} {:10.2f} {:10.2f}".format(
+            name, timeit(loop, args.repeat), timeit(batch, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
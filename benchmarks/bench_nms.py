@@ -0,0 +1,87 @@
+"""
+Benchmark non-maximum suppression: the previous one box at a time loop
+(compute_iou() against the remaining boxes, then np.delete()) against the
+blocked utils.non_max_suppression(), hard and per class, and
+utils.soft_non_max_suppression(). Boxes are clustered, so most overlap.
+The loop is skipped for counts above --max-loop, where it takes minutes.
+
+Usage: python benchmarks/bench_nms.py [--counts 1000 10000 100000]
+                                      [--threshold 0.5] [--clusters 200]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def loop_non_max_suppression(boxes, scores, threshold):
+    """The previous implementation of utils.non_max_suppression()"""
+    boxes = boxes.astype(np.float32)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ixs = scores.argsort()[::-1]
+    pick = []
+    while len(ixs) > 0:
+        i = ixs[0]
+        pick.append(i)
+        iou = utils.compute_iou(boxes[i], boxes[ixs[1:]], area[i], area[ixs[1:]])
+        remove_ixs = np.where(iou > threshold)[0] + 1
+        ixs = np.delete(ixs, remove_ixs)
+        ixs = np.delete(ixs, 0)
+    return np.array(pick, dtype=np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark non-maximum suppression")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--max-loop", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    print("{:>8} {:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "boxes", "kept", "loop ms", "blocked ms", "per class ms", "soft ms"))
+    for count in args.counts:
+        centers = rng.randint(0, args.size, (args.clusters, 2))
+        centers = centers[rng.randint(0, args.clusters, count)] + rng.randint(-8, 8, (count, 2))
+        half = rng.randint(8, 48, (count, 2))
+        boxes = np.concatenate([centers - half, centers + half], axis=1).astype(np.float32)
+        scores = rng.rand(count).astype(np.float32)
+        class_ids = rng.randint(1, 4, count)
+
+        pick = utils.non_max_suppression(boxes, scores, args.threshold)
+        if count <= args.max_loop:
+            assert np.array_equal(pick, loop_non_max_suppression(boxes, scores, args.threshold))
+            loop = "{:12.2f}".format(timeit(
+                lambda: loop_non_max_suppression(boxes, scores, args.threshold), args.repeat))
+        else:
+            loop = "{:>12}".format("-")
+        blocked = timeit(lambda: utils.non_max_suppression(boxes, scores, args.threshold),
+                         args.repeat)
+        per_class = timeit(lambda: utils.non_max_suppression(
+            boxes, scores, args.threshold, class_ids=class_ids), args.repeat)
+        soft = timeit(lambda: utils.soft_non_max_suppression(
+            boxes, scores, score_threshold=0.05), 1)
+        print("{:8d} {:8d} {} {:12.2f} {:12.2f} {:12.2f}".format(
+            count, len(pick), loop, blocked, per_class, soft))
+
+
+if __name__ == "__main__":
+    main()
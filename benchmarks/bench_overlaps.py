@@ -0,0 +1,84 @@
+"""
+Benchmark box IoU for RPN targets: the previous column by column loop
+(compute_iou() of each GT box against all anchors into a float64 matrix)
+against the chunked float32 utils.compute_overlaps(), dense and sparse,
+on the anchors of a --size input with 5 FPN levels and 3 ratios.
+
+Usage: python benchmarks/bench_overlaps.py [--size 1024] [--gt 5 30 100]
+                                           [--chunk-size 8192]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+from mrcnn.config import Config
+from mrcnn.model import compute_backbone_shapes
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def loop_compute_overlaps(boxes1, boxes2):
+    """The previous implementation of utils.compute_overlaps()"""
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    overlaps = np.zeros((boxes1.shape[0], boxes2.shape[0]))
+    for i in range(overlaps.shape[1]):
+        overlaps[:, i] = utils.compute_iou(boxes2[i], boxes1, area2[i], area1)
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark box IoU for RPN targets")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--gt", type=int, nargs="+", default=[5, 30, 100])
+    parser.add_argument("--chunk-size", type=int, default=8192)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        NAME = "bench"
+        IMAGE_MIN_DIM = args.size
+        IMAGE_MAX_DIM = args.size
+
+    config = BenchConfig()
+    anchors = utils.generate_pyramid_anchors(
+        config.RPN_ANCHOR_SCALES, config.RPN_ANCHOR_RATIOS,
+        compute_backbone_shapes(config, config.IMAGE_SHAPE),
+        config.BACKBONE_STRIDES, config.RPN_ANCHOR_STRIDE)
+
+    rng = np.random.RandomState(0)
+    print("{} anchors for a {}x{} input".format(anchors.shape[0], args.size, args.size))
+    print("{:>6} {:>10} {:>10} {:>10} {:>10}".format(
+        "gt", "loop ms", "dense ms", "sparse ms", "nonzero"))
+    for count in args.gt:
+        y1x1 = rng.randint(0, args.size * 3 // 4, (count, 2))
+        gt_boxes = np.concatenate([y1x1, y1x1 + rng.randint(8, args.size // 4, (count, 2))],
+                                  axis=1).astype(np.int32)
+        dense = utils.compute_overlaps(anchors, gt_boxes, chunk_size=args.chunk_size)
+        np.testing.assert_allclose(dense, loop_compute_overlaps(anchors, gt_boxes), atol=1e-5)
+        sparse = utils.compute_overlaps(anchors, gt_boxes, chunk_size=args.chunk_size, sparse=True)
+        print("{:6d} {:10.2f} {:10.2f} {:10.2f} {:10.4f}".format(
+            count,
+            timeit(lambda: loop_compute_overlaps(anchors, gt_boxes), args.repeat),
+            timeit(lambda: utils.compute_overlaps(
+                anchors, gt_boxes, chunk_size=args.chunk_size), args.repeat),
+            timeit(lambda: utils.compute_overlaps(
+                anchors, gt_boxes, chunk_size=args.chunk_size, sparse=True), args.repeat),
+            sparse.nnz / dense.size))
+
+
+if __name__ == "__main__":
+    main()
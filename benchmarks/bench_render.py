@@ -0,0 +1,62 @@
+"""
+Benchmark overlay rendering: matplotlib visualize.display_instances()
+against the OpenCV/NumPy render_instances() used when serving.
+
+Usage: python benchmarks/bench_render.py [--size 1024]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.floorplan.mock_detection import MockModel
+from app.floorplan.postprocess import CLASS_NAMES
+from app.floorplan.render import render_instances
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overlay rendering")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    image = np.full((args.size, args.size, 3), 255, dtype=np.uint8)
+    r = MockModel().detect([image])[0]
+    sparse = MockModel().detect([image], sparse_masks=True)[0]
+
+    def matplotlib_render():
+        from mrcnn import visualize
+        visualize.display_instances(image, r['rois'], r['masks'], r['class_ids'],
+                                    CLASS_NAMES, r['scores'])
+        # Rasterize the figure, which is what saving it would cost
+        plt.gcf().canvas.draw()
+        plt.close("all")
+
+    print("{} instances on a {}x{} image".format(len(r['class_ids']), args.size, args.size))
+    print("display_instances():          {:9.2f} ms".format(timeit(matplotlib_render, args.repeat)))
+    print("render_instances() full size: {:9.2f} ms".format(timeit(
+        lambda: render_instances(image, r['rois'], r['masks'], r['class_ids'],
+                                 CLASS_NAMES, r['scores']), args.repeat)))
+    print("render_instances() sparse:    {:9.2f} ms".format(timeit(
+        lambda: render_instances(image, sparse['rois'], sparse['masks'], sparse['class_ids'],
+                                 CLASS_NAMES, sparse['scores']), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
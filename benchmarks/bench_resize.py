@@ -0,0 +1,77 @@
+"""
+Benchmark the resize backends (Config.RESIZE_BACKEND) on the resizing
+steps of molding and data loading: resize_image() of an RGB image to a
+square input, resize_mask() of its instance masks, and the resize() of
+ROI crops to MASK_SHAPE targets. Reports throughput per backend.
+
+Usage: python benchmarks/bench_resize.py [--size 1024] [--instances 40]
+                                         [--rois 66]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resize backends")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--instances", type=int, default=40)
+    parser.add_argument("--rois", type=int, default=66,
+                        help="Positive ROIs of an image that get mask targets")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    shapes = [(args.size * 3 // 5, args.size * 4 // 5), (args.size * 3 // 2, args.size * 2)]
+    images = [rng.randint(0, 256, shape + (3,)).astype(np.uint8) for shape in shapes]
+    masks = []
+    for h, w in shapes:
+        m = np.zeros((h, w, args.instances), dtype=bool)
+        for i in range(args.instances):
+            y, x = rng.randint(0, h - h // 8), rng.randint(0, w - w // 8)
+            m[y:y + rng.randint(4, h // 8), x:x + rng.randint(4, w // 8), i] = True
+        masks.append(m)
+    crops = [rng.rand(rng.randint(16, 200), rng.randint(16, 200)) > 0.5
+             for _ in range(args.rois)]
+
+    print("{:32} {:>12} {:>12} {:>8}".format("", "skimage ms", "opencv ms", "speedup"))
+    for image, mask in zip(images, masks):
+        _, _, scale, padding, _ = utils.resize_image(image, min_dim=args.size, max_dim=args.size)
+        h, w = image.shape[:2]
+        runs = [
+            ("resize_image {}x{}".format(h, w), lambda backend: utils.resize_image(
+                image, min_dim=args.size, max_dim=args.size, backend=backend)),
+            ("resize_mask {}x{}x{}".format(h, w, args.instances), lambda backend: utils.resize_mask(
+                mask, scale, padding, backend=backend)),
+        ]
+        for name, fn in runs:
+            times = [timeit(lambda: fn(backend), args.repeat) for backend in ("skimage", "opencv")]
+            print("{:32} {:12.2f} {:12.2f} {:7.1f}x".format(name, times[0], times[1],
+                                                            times[0] / times[1]))
+
+    def targets(backend):
+        for crop in crops:
+            utils.resize(crop.astype(np.float64), (28, 28), backend=backend)
+    times = [timeit(lambda: targets(backend), args.repeat) for backend in ("skimage", "opencv")]
+    print("{:32} {:12.2f} {:12.2f} {:7.1f}x".format(
+        "{} mask targets".format(args.rois), times[0], times[1], times[0] / times[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark reading training samples from a model.SampleCache against
+load_image_gt(), which decodes the image file, rasterizes the polygons of
+its instances and resizes both for every sample of every epoch. Uses
+random floorplan-like JPEGs and polygons written to a temporary directory.
+
+Usage: python benchmarks/bench_sample_cache.py [--images 20] [--size 1024]
+                                               [--instances 40]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+from mrcnn import model as modellib
+from mrcnn.config import Config
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+class PolygonDataset(utils.Dataset):
+    """JPEG images with rectangle polygons of walls, windows and doors"""
+
+    def load_polygons(self, directory, count, size, instances):
+        for i, name in enumerate(["wall", "window", "door"]):
+            self.add_class("bench", i + 1, name)
+        rng = np.random.RandomState(0)
+        for i in range(count):
+            h, w = size * 3 // 4, size
+            y1x1 = rng.randint(0, min(h, w) * 3 // 4, (instances, 2))
+            y2x2 = y1x1 + rng.randint(4, min(h, w) // 4, (instances, 2))
+            polygons = [np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.int32)
+                        for (y1, x1), (y2, x2) in zip(y1x1, y2x2)]
+            image = np.full((h, w, 3), 255, np.uint8)
+            cv2.polylines(image, polygons, True, (0, 0, 0), 3)
+            path = os.path.join(directory, "{}.jpg".format(i))
+            cv2.imwrite(path, image)
+            self.add_image("bench", image_id=i, path=path, width=w, height=h,
+                           polygons=polygons, class_ids=rng.randint(1, 4, instances))
+
+    def load_image(self, image_id):
+        return cv2.imread(self.image_info[image_id]["path"])[..., ::-1]
+
+    def load_mask(self, image_id):
+        info = self.image_info[image_id]
+        mask = np.zeros((info["height"], info["width"], len(info["polygons"])), dtype=np.uint8)
+        for i, polygon in enumerate(info["polygons"]):
+            mask[..., i] = cv2.fillPoly(np.ascontiguousarray(mask[..., i]), [polygon], 1)
+        return mask.astype(bool), info["class_ids"].astype(np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sample cache")
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--instances", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        NAME = "bench"
+        NUM_CLASSES = 1 + 3
+        IMAGES_PER_GPU = 1
+        IMAGE_MIN_DIM = args.size
+        IMAGE_MAX_DIM = args.size
+        USE_MINI_MASK = True
+
+    config = BenchConfig()
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = PolygonDataset()
+        dataset.load_polygons(directory, args.images, args.size, args.instances)
+        dataset.prepare()
+        cache = modellib.SampleCache(os.path.join(directory, "cache"), dataset, config)
+        start = time.perf_counter()
+        cache.build(verbose=0)
+        print("Built the cache of {} images in {:.2f} s".format(
+            args.images, time.perf_counter() - start))
+
+        def load_all():
+            for image_id in dataset.image_ids:
+                modellib.load_image_gt(dataset, config, image_id)
+
+        def read_all():
+            for image_id in dataset.image_ids:
+                cache.load(image_id)
+
+        cached = modellib.DataGenerator(dataset, config, seed=0, cache=cache)
+        uncached = modellib.DataGenerator(dataset, config, seed=0)
+        runs = [
+            ("samples", load_all, read_all, args.images),
+            ("batches", lambda: [uncached[i] for i in range(args.images)],
+             lambda: [cached[i] for i in range(args.images)], args.images),
+        ]
+        print("{:10} {:>16} {:>16}".format("", "dataset ms/each", "cache ms/each"))
+        for name, load, read, count in runs:
+            print("{:10} {:16.2f} {:16.2f}".format(
+                name, timeit(load, args.repeat) / count, timeit(read, args.repeat) / count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark spatial queries over detected elements: the R-tree used by the
+query endpoints against a linear scan over all bounding boxes.
+
+Usage: python benchmarks/bench_spatial.py [--count 5000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.floorplan.spatial import RTree, box_distance, intersects
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spatial queries")
+    parser.add_argument("--count", type=int, default=5000, help="Number of elements")
+    parser.add_argument("--size", type=int, default=4000, help="Plan size in pixels")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, args.size, (args.count, 2))
+    boxes = np.concatenate([corners, corners + rng.uniform(5, 200, (args.count, 2))], axis=1)
+    window = (args.size * 0.4, args.size * 0.4, args.size * 0.5, args.size * 0.5)
+    point = (args.size / 2, args.size / 2, args.size / 2, args.size / 2)
+
+    print("{} elements on a {}x{} plan".format(args.count, args.size, args.size))
+    print("RTree build:          {:9.3f} ms".format(timeit(lambda: RTree(boxes), 3)))
+    tree = RTree(boxes)
+    print("window, linear scan:  {:9.3f} ms".format(timeit(
+        lambda: np.nonzero(intersects(boxes, window))[0], args.repeat)))
+    print("window, RTree:        {:9.3f} ms".format(timeit(
+        lambda: tree.search(window), args.repeat)))
+    print("10-nearest, scan:     {:9.3f} ms".format(timeit(
+        lambda: np.argsort(box_distance(boxes, point))[:10], args.repeat)))
+    print("10-nearest, RTree:    {:9.3f} ms".format(timeit(
+        lambda: tree.nearest(point[:2], 10), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark mask unmolding: the previous per-instance loop (skimage resize
+into a fresh full size mask) against the batched utils.unmold_masks(), for
+full size and sparse outputs.
+
+Usage: python benchmarks/bench_unmold.py [--instances 35] [--size 1024]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrcnn import utils
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mask unmolding")
+    parser.add_argument("--instances", type=int, default=35)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    shape = (args.size, args.size)
+    masks = rng.rand(args.instances, 28, 28).astype(np.float32)
+    y1 = rng.randint(0, args.size * 3 // 4, args.instances)
+    x1 = rng.randint(0, args.size * 3 // 4, args.instances)
+    h = rng.randint(8, args.size // 4, args.instances)
+    w = rng.randint(8, args.size // 4, args.instances)
+    boxes = np.stack([y1, x1, y1 + h, x1 + w], axis=1)
+
+    def loop():
+        full_masks = []
+        for mask, (y1, x1, y2, x2) in zip(masks, boxes):
+            full_mask = np.zeros(shape, dtype=bool)
+            full_mask[y1:y2, x1:x2] = utils.resize(mask, (y2 - y1, x2 - x1)) >= 0.5
+            full_masks.append(full_mask)
+        return np.stack(full_masks, axis=-1)
+
+    print("{} instances on a {}x{} image".format(args.instances, *shape))
+    print("per-instance loop:         {:8.2f} ms".format(timeit(loop, args.repeat)))
+    print("unmold_masks() full size:  {:8.2f} ms".format(
+        timeit(lambda: utils.unmold_masks(masks, boxes, shape), args.repeat)))
+    print("unmold_masks() sparse:     {:8.2f} ms".format(
+        timeit(lambda: utils.unmold_masks(masks, boxes, sparse=True), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark wall vectorization on mock detections, stage by stage, including
+the skimage thinning that the distance transform ridge replaces.
+
+Usage: python benchmarks/bench_vectorize.py [--size 1024]
+"""
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+from skimage.morphology import skeletonize
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.floorplan.mock_detection import MockModel
+from app.floorplan.vectorize import medial_axis, vectorize_walls, wall_union
+
+
+def timeit(fn, repeat):
+    """Returns the best wall time of fn() over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wall vectorization")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    image = np.zeros((args.size, args.size, 3), dtype=np.uint8)
+    r = MockModel(seed=0).detect([image], sparse_masks=True)[0]
+    shape = (args.size, args.size)
+    union = wall_union(r, shape=shape)
+    dist = cv2.distanceTransform(union, cv2.DIST_L2, 3)
+
+    print("{} walls on a {}x{} image".format(int((r['class_ids'] == 1).sum()), *shape))
+    print("skimage skeletonize():   {:9.2f} ms".format(timeit(
+        lambda: skeletonize(union.astype(bool)), args.repeat)))
+    print("distance transform:      {:9.2f} ms".format(timeit(
+        lambda: cv2.distanceTransform(union, cv2.DIST_L2, 3), args.repeat)))
+    print("medial_axis():           {:9.2f} ms".format(timeit(
+        lambda: medial_axis(union, dist), args.repeat)))
+    print("vectorize_walls() total: {:9.2f} ms".format(timeit(
+        lambda: vectorize_walls(r, shape=shape), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
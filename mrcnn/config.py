@@ -47,6 +47,24 @@ class Config(object):
     # down the training.
     VALIDATION_STEPS = 10
 
+    # Processes that build training batches in the background, and how many
+    # batches they build ahead of training. None uses all CPUs. 0 builds
+    # each batch on the training thread when it's needed.
+    DATA_WORKERS = None
+    DATA_QUEUE_SIZE = 10
+
+    # Seed of the training data: image order, augmentation and target
+    # sampling. A seeded run trains on the same batches whatever the number
+    # of DATA_WORKERS. None for different batches every run.
+    DATA_SEED = None
+
+    # Directory to cache the preprocessed training samples in, see
+    # model.SampleCache. The train and val datasets get a subdirectory
+    # each, rebuilt when the dataset or the image settings change. Not
+    # used for training with augmentation. None loads and resizes every
+    # image every epoch.
+    SAMPLE_CACHE_DIR = None
+
     # Backbone network architecture
     # Supported values are: resnet50, resnet101.
     # You can also provide a callable that should have the signature
@@ -131,6 +149,12 @@ class Config(object):
     # the width and height, or more, even if MIN_IMAGE_DIM doesn't require it.
     # However, in 'square' mode, it can be overruled by IMAGE_MAX_DIM.
     IMAGE_MIN_SCALE = 0
+    # Library that resizes images and masks in resize_image(), resize_mask()
+    # and the mask targets: "opencv" or "skimage". OpenCV is several times
+    # faster. Its results differ from skimage's by about one intensity level
+    # and, for masks, a pixel at instance edges. Use "skimage" to reproduce
+    # the original Matterport preprocessing exactly.
+    RESIZE_BACKEND = "opencv"
     # Number of color channels per image. RGB = 3, grayscale = 1, RGB-D = 4
     # Changing this requires other changes in the code. See the WIKI for more
     # details: https://github.com/matterport/Mask_RCNN/wiki
@@ -174,6 +198,13 @@ class Config(object):
     # Non-maximum suppression threshold for detection
     DETECTION_NMS_THRESHOLD = 0.3
 
+    # Data type of the mask probabilities the inference graph returns to
+    # detect(): "float32", "float16" or "uint8" (probability * 255).
+    # Smaller types cut memory traffic and host copies. The masks are
+    # thresholded at 0.5 after resizing, so the effect on results is
+    # limited to pixels right at the mask edges.
+    INFERENCE_MASK_DTYPE = "float32"
+
     # Learning rate and momentum
     # The Mask RCNN paper uses lr=0.02, but on TensorFlow it causes
     # weights to explode. Likely due to differences in optimizer
@@ -0,0 +1,241 @@
+"""
+Mask R-CNN
+Dataset-level evaluation: COCO-style AP and AR of each class over a range
+of IoU thresholds.
+
+Predictions are cached on disk, one file per image, so an evaluation can
+be re-run without inference. Each image is matched once for all IoU
+thresholds (see utils.compute_matches_range()), in a pool of processes,
+and the matches of all images are pooled per class before computing AP.
+
+Usage:
+    cache = PredictionCache("predictions/val", model_fingerprint(weights_path, config))
+    predict_dataset(model, dataset, cache)
+    results = evaluate_dataset(dataset, cache)
+    print(format_report(results))
+"""
+
+import os
+import hashlib
+import multiprocessing
+import numpy as np
+
+from mrcnn import utils
+
+# COCO IoU thresholds, 0.5 to 0.95 in steps of 0.05
+IOU_THRESHOLDS = np.round(np.arange(0.5, 1.0, 0.05), 2)
+
+
+def model_fingerprint(weights_path, config):
+    """Hash of the contents of a weights file and of all config values,
+    which identifies the predictions of a model.
+    """
+    digest = hashlib.sha1()
+    with open(weights_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    utils.update_hash(digest, config.to_dict())
+    return digest.hexdigest()
+
+
+class PredictionCache(object):
+    """Detections of a model on a dataset, one .npz file per image.
+    Masks are stored cropped to their boxes and bit-packed.
+
+    Use one directory per model and dataset split. Images are keyed by
+    their id in the dataset source, see cache_key().
+
+    fingerprint: Optional. Identifies the model, see model_fingerprint().
+        It's stored in the directory. Predictions of another, or an
+        unknown, model are deleted, so they're predicted again. Without
+        it, the cached predictions are used whatever model they're from.
+    """
+
+    def __init__(self, directory, fingerprint=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if fingerprint is not None and self.fingerprint() != fingerprint:
+            for name in os.listdir(directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(directory, name))
+            with open(os.path.join(directory, "fingerprint.txt"), "w") as f:
+                f.write(fingerprint)
+
+    def fingerprint(self):
+        """Returns the fingerprint of the model of the cached predictions,
+        or None if it's not known.
+        """
+        path = os.path.join(self.directory, "fingerprint.txt")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip()
+
+    def path(self, key):
+        return os.path.join(self.directory, "{}.npz".format(key))
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, r):
+        """Stores a detection result dict with 'rois', 'class_ids', 'scores'
+        and 'masks', full size or sparse.
+        """
+        rois = np.asarray(r['rois'], dtype=np.int32).reshape(-1, 4)
+        masks = utils.dense_to_sparse_masks(rois, r['masks'])
+        bits = np.concatenate([m.ravel() for m in masks]) if masks else np.zeros(0, dtype=bool)
+        # Write to a temporary file first, so an interrupted run never
+        # leaves a truncated file behind
+        path = self.path(key)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, rois=rois, class_ids=np.asarray(r['class_ids'], dtype=np.int32),
+                     scores=np.asarray(r['scores'], dtype=np.float32),
+                     masks=np.packbits(bits), mask_bits=bits.size)
+        os.replace(path + ".tmp", path)
+
+    def load(self, key):
+        """Returns the detection result dict of an image, with sparse masks"""
+        with np.load(self.path(key)) as data:
+            rois = data["rois"]
+            bits = np.unpackbits(data["masks"], count=int(data["mask_bits"])).astype(bool)
+            sizes = (rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1])
+            masks = [m.reshape(y2 - y1, x2 - x1) for m, (y1, x1, y2, x2) in
+                     zip(np.split(bits, np.cumsum(sizes)[:-1]), rois)]
+            return {"rois": rois, "class_ids": data["class_ids"],
+                    "scores": data["scores"], "masks": masks}
+
+
+def cache_key(dataset, image_id):
+    """Key of an image in a PredictionCache: its id in the dataset source,
+    which, unlike the internal image_id, doesn't depend on load order.
+    """
+    return dataset.image_info[image_id]["id"]
+
+
+def predict_dataset(model, dataset, cache, image_ids=None, verbose=1):
+    """Runs a model on the images of a dataset that aren't in the cache yet.
+    model: A MaskRCNN, or anything with its detect_many().
+
+    Returns the number of images that were run.
+    """
+    image_ids = dataset.image_ids if image_ids is None else image_ids
+    missing = [i for i in image_ids if cache_key(dataset, i) not in cache]
+    if verbose:
+        print("Predicting {} of {} images".format(len(missing), len(image_ids)))
+    images = (dataset.load_image(image_id) for image_id in missing)
+    for image_id, r in zip(missing, model.detect_many(images, sparse_masks=True)):
+        cache.save(cache_key(dataset, image_id), r)
+    return len(missing)
+
+
+# Dataset, cache and thresholds of the worker processes
+_worker = {}
+
+
+def _init_worker(dataset, directory, iou_thresholds):
+    _worker.update(dataset=dataset, cache=PredictionCache(directory),
+                   iou_thresholds=iou_thresholds)
+
+
+def _match_image(image_id):
+    """Matches the cached predictions of an image to its ground truth.
+
+    Returns the GT class IDs, and the class IDs, scores and
+    [thresholds, predictions] matched flags of the predictions.
+    """
+    dataset = _worker["dataset"]
+    gt_masks, gt_class_ids = dataset.load_mask(image_id)
+    # Instances can be empty after cropping or resizing. Skip them.
+    keep = np.any(gt_masks, axis=(0, 1))
+    gt_masks, gt_class_ids = gt_masks[..., keep], gt_class_ids[keep]
+    gt_boxes = utils.extract_bboxes(gt_masks)
+    r = _worker["cache"].load(cache_key(dataset, image_id))
+    _, pred_match, _, indices = utils.compute_matches_range(
+        gt_boxes, gt_class_ids, gt_masks,
+        r['rois'], r['class_ids'], r['scores'], r['masks'], _worker["iou_thresholds"])
+    return gt_class_ids, r['class_ids'][indices], r['scores'][indices], pred_match > -1
+
+
+def evaluate_dataset(dataset, cache, image_ids=None, iou_thresholds=IOU_THRESHOLDS,
+                     workers=None):
+    """Computes the AP and AR of each class from the cached predictions.
+    dataset: A prepared utils.Dataset with load_mask().
+    cache: PredictionCache with a prediction of each image.
+    iou_thresholds: IoU thresholds that AP and AR are averaged over.
+    workers: Number of processes that match images. Defaults to the CPU
+        count. 0 matches in this process.
+
+    Like COCO, the predictions of all images are ranked together by score
+    for each class. AP at a threshold is the area under the precision and
+    recall curve, interpolated as in utils.compute_ap(). AR is the recall
+    of all predictions.
+
+    Returns a dict with the thresholds, "classes", a dict of class name to
+    {"gt", "predictions", "AP", "AP50", "AP75", "AR", "APs", "recalls"},
+    and the means over the classes with GT instances of AP, AP50, AP75
+    and AR. AP50 and AP75 are None if those thresholds aren't evaluated.
+    """
+    image_ids = dataset.image_ids if image_ids is None else image_ids
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+    args = (dataset, cache.directory, iou_thresholds)
+    if workers == 0:
+        _init_worker(*args)
+        matches = [_match_image(image_id) for image_id in image_ids]
+    else:
+        with multiprocessing.Pool(workers, _init_worker, args) as pool:
+            matches = pool.map(_match_image, image_ids, chunksize=4)
+
+    gt_class_ids, pred_class_ids, scores, matched = zip(*matches) if matches else ([],) * 4
+    gt_class_ids = np.concatenate([np.zeros(0, np.int32)] + list(gt_class_ids))
+    pred_class_ids = np.concatenate([np.zeros(0, np.int32)] + list(pred_class_ids))
+    scores = np.concatenate([np.zeros(0, np.float32)] + list(scores))
+    matched = np.concatenate([np.zeros((len(iou_thresholds), 0), bool)] + list(matched), axis=1)
+
+    def at(values, threshold):
+        ix = np.flatnonzero(np.isclose(iou_thresholds, threshold))
+        return float(values[ix[0]]) if ix.size else None
+
+    classes = {}
+    for class_id, name in zip(dataset.class_ids[1:], dataset.class_names[1:]):
+        gt_count = int(np.sum(gt_class_ids == class_id))
+        members = np.flatnonzero(pred_class_ids == class_id)
+        # All predictions of the class, by score from high to low
+        members = members[np.argsort(-scores[members], kind="stable")]
+        APs = np.full(len(iou_thresholds), np.nan)
+        recalls = np.full(len(iou_thresholds), np.nan)
+        if gt_count:
+            for t in range(len(iou_thresholds)):
+                pred_match = np.where(matched[t, members], 0, -1)
+                APs[t] = utils.compute_ap_from_matches(pred_match, gt_count)[0]
+                recalls[t] = np.sum(matched[t, members]) / gt_count
+        classes[name] = {
+            "gt": gt_count, "predictions": len(members),
+            "AP": float(np.mean(APs)), "AP50": at(APs, 0.5), "AP75": at(APs, 0.75),
+            "AR": float(np.mean(recalls)), "APs": APs, "recalls": recalls,
+        }
+
+    def mean(key):
+        values = [c[key] for c in classes.values() if c["gt"] and c[key] is not None]
+        return float(np.mean(values)) if values else None
+
+    return {"iou_thresholds": iou_thresholds, "classes": classes,
+            "AP": mean("AP"), "AP50": mean("AP50"), "AP75": mean("AP75"), "AR": mean("AR")}
+
+
+def format_report(results):
+    """Formats the results of evaluate_dataset() as a table"""
+    def cell(value):
+        return "{:>8}".format("-") if value is None or np.isnan(value) else "{:8.3f}".format(value)
+
+    thresholds = results["iou_thresholds"]
+    lines = ["AP and AR at IoU {:.2f}-{:.2f}".format(thresholds[0], thresholds[-1]),
+             "{:15} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+                 "class", "gt", "preds", "AP", "AP50", "AP75", "AR")]
+    for name, c in results["classes"].items():
+        lines.append("{:15} {:6d} {:8d} {} {} {} {}".format(
+            name, c["gt"], c["predictions"], cell(c["AP"]), cell(c["AP50"]),
+            cell(c["AP75"]), cell(c["AR"])))
+    lines.append("{:15} {:>6} {:>8} {} {} {} {}".format(
+        "mean", "", "", cell(results["AP"]), cell(results["AP50"]),
+        cell(results["AP75"]), cell(results["AR"])))
+    return "\n".join(lines)
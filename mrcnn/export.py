@@ -0,0 +1,380 @@
+"""
+Mask R-CNN
+Export of the inference graph to SavedModel and TFLite, and a runtime that
+runs the exported models with the same detect() interface as MaskRCNN.
+
+The exported graph is the serving graph of MaskRCNN.serving_model(): the
+custom layers (ProposalLayer, PyramidROIAlign, DetectionLayer) are plain
+TensorFlow ops in it, so no Python code is needed to load it. The
+preprocessing contract, i.e. the config that mold_inputs() and
+unmold_detections() depend on, is stored next to the graph.
+
+Usage:
+    python -m mrcnn.export --weights mask_rcnn.h5 \\
+        --config app.floorplan.detection:FloorPlanConfig \\
+        --output exported --format savedmodel tflite
+"""
+
+import os
+import json
+import argparse
+import importlib
+import numpy as np
+import skimage.io
+import tensorflow as tf
+
+from mrcnn.config import Config
+from mrcnn.model import InferenceModel
+
+# Names of the inputs and outputs of the exported graph, in the order
+# inference_function() takes and returns them
+INPUT_NAMES = ("input_image", "input_image_meta", "input_anchors")
+OUTPUT_NAMES = ("detections", "masks")
+
+CONTRACT_FILE = "contract.json"
+TFLITE_FILE = "model.tflite"
+
+# Layer groups that can be quantized separately, in the order they run
+LAYER_GROUPS = ("backbone", "fpn", "heads")
+# Quantization modes of each group. Calibrating the heads would run the TF
+# Select ops of the detection layers, which the calibrator doesn't support.
+QUANTIZATION_MODES = {
+    "backbone": ("float", "dynamic", "int8"),
+    "fpn": ("float", "dynamic", "int8"),
+    "heads": ("float", "dynamic"),
+}
+
+
+def config_to_json(config):
+    """Returns the values of a Config as a JSON serializable dict, and the
+    names of the values that are NumPy arrays.
+    """
+    values, arrays = {}, []
+    for key, value in config.to_dict().items():
+        if isinstance(value, np.ndarray):
+            arrays.append(key)
+            value = value.tolist()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        values[key] = value
+    return values, arrays
+
+
+def config_from_json(values, arrays):
+    """Rebuilds a Config from the output of config_to_json()."""
+    attributes = {key: np.array(value) if key in arrays else value
+                  for key, value in values.items()}
+    return type("ExportedConfig", (Config,), attributes)()
+
+
+def write_contract(model, export_dir, mask_dtype, **extra):
+    """Writes the preprocessing contract of a model to export_dir, keeping
+    the entries that another export to the same directory added.
+    """
+    path = os.path.join(export_dir, CONTRACT_FILE)
+    contract = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            contract = json.load(f)
+    values, arrays = config_to_json(model.config)
+    contract.update(config=values, array_keys=arrays, mask_dtype=mask_dtype,
+                    inputs=list(INPUT_NAMES), outputs=list(OUTPUT_NAMES), **extra)
+    os.makedirs(export_dir, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(contract, f, indent=2)
+
+
+def export_saved_model(model, export_dir, mask_dtype=None):
+    """Exports the serving graph of an inference MaskRCNN to a SavedModel.
+
+    model: MaskRCNN in inference mode, with its weights loaded.
+    export_dir: Directory to write. Must not exist yet or be empty.
+    mask_dtype: Type of the exported masks, see MaskRCNN.serving_model().
+        Defaults to config.INFERENCE_MASK_DTYPE.
+
+    The SavedModel has one "serving_default" signature with the inputs
+    INPUT_NAMES and the outputs OUTPUT_NAMES. The contract is written to
+    export_dir/contract.json.
+    """
+    mask_dtype = mask_dtype or model.config.INFERENCE_MASK_DTYPE
+    serving = model.serving_model(mask_dtype)
+    session = tf.compat.v1.keras.backend.get_session()
+    signature = tf.compat.v1.saved_model.predict_signature_def(
+        inputs=dict(zip(INPUT_NAMES, serving.inputs)),
+        outputs=dict(zip(OUTPUT_NAMES, serving.outputs)))
+    builder = tf.compat.v1.saved_model.Builder(export_dir)
+    builder.add_meta_graph_and_variables(
+        session, [tf.compat.v1.saved_model.tag_constants.SERVING],
+        signature_def_map={"serving_default": signature},
+        strip_default_attrs=True)
+    builder.save()
+    write_contract(model, export_dir, mask_dtype)
+    return export_dir
+
+
+def check_quantization(quantization):
+    """Raises ValueError unless quantization maps layer groups to modes
+    they support. Returns quantization.
+    """
+    for group, mode in quantization.items():
+        if group not in LAYER_GROUPS:
+            raise ValueError("Unknown layer group: {}".format(group))
+        if mode not in QUANTIZATION_MODES[group]:
+            raise ValueError("{} can't be quantized to {}".format(group, mode))
+    return quantization
+
+
+def parse_quantization(spec):
+    """Parses "group=mode,group=mode", e.g. "backbone=int8,heads=dynamic",
+    into the quantization dict of export_tflite().
+    """
+    return check_quantization(dict(item.split("=") for item in spec.split(",") if item))
+
+
+def layer_groups(model, mask_dtype=None):
+    """Splits the serving graph into its layer groups.
+
+    Returns a list of (group, inputs, outputs) tuples, one per name in
+    LAYER_GROUPS, in the order they run. The backbone maps the image to
+    C2-C5, the FPN maps those to P2-P6, and the heads, from the RPN on,
+    map P2-P6 to the detections and masks.
+    """
+    keras_model = model.keras_model
+    serving = model.serving_model(mask_dtype)
+    input_image, input_image_meta, input_anchors = serving.inputs
+    C = [keras_model.get_layer("fpn_c{0}p{0}".format(i)).input for i in range(2, 6)]
+    P = [keras_model.get_layer("fpn_p{}".format(i)).output for i in range(2, 7)]
+    return [("backbone", [input_image], C),
+            ("fpn", C, P),
+            ("heads", P + [input_image_meta, input_anchors], serving.outputs)]
+
+
+def convert_tflite(session, inputs, outputs, quantization="float",
+                   representative_dataset=None):
+    """Converts part of the graph in session to a TFLite flatbuffer.
+
+    quantization: "float", "dynamic" for int8 weights with activations
+        quantized on the fly, or "int8" for int8 weights and activations,
+        with activation ranges calibrated on representative_dataset.
+    representative_dataset: For "int8", a callable that returns an
+        iterable of lists of input arrays.
+    """
+    converter = tf.compat.v1.lite.TFLiteConverter.from_session(session, inputs, outputs)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS,
+                                           tf.lite.OpsSet.SELECT_TF_OPS]
+    if quantization in ("dynamic", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+
+def tflite_name(tensor):
+    """TFLite names tensors without the ":0" output index"""
+    return tensor.name.split(":")[0]
+
+
+def export_tflite(model, export_dir, mask_dtype=None, quantization=None,
+                  calibration_images=None):
+    """Converts the serving graph of an inference MaskRCNN to TFLite.
+
+    The weights are frozen into the flatbuffer. The ops without a TFLite
+    builtin kernel, such as the crop and resize of PyramidROIAlign and the
+    NMS of ProposalLayer and DetectionLayer, run through the TF Select
+    (Flex) ops, which tf.lite.Interpreter links in.
+
+    quantization: Optional dict of layer group to quantization mode, see
+        LAYER_GROUPS and QUANTIZATION_MODES, e.g. {"backbone": "int8",
+        "fpn": "int8", "heads": "dynamic"}. Missing groups stay float.
+        If given, every layer group is converted to its own model, which
+        ExportedModel runs one after the other.
+    calibration_images: List of images, e.g. a sample of the training set,
+        to calibrate the activation ranges of the "int8" groups.
+
+    Writes the models and export_dir/contract.json.
+    """
+    mask_dtype = mask_dtype or model.config.INFERENCE_MASK_DTYPE
+    session = tf.compat.v1.keras.backend.get_session()
+    if quantization is None:
+        serving = model.serving_model(mask_dtype)
+        groups = [(None, serving.inputs, serving.outputs)]
+        quantization = {}
+    else:
+        check_quantization(quantization)
+        groups = layer_groups(model, mask_dtype)
+
+    calibration = {}
+    if "int8" in quantization.values():
+        assert calibration_images, "int8 quantization needs calibration images"
+        # The inputs of every group, computed by the float graph
+        group_inputs = [inputs for group, inputs, _ in groups
+                        if quantization.get(group) == "int8"]
+        tensors = list({t.name: t for t in sum(group_inputs, [])}.values())
+        image = model.keras_model.inputs[0]
+        for molded_image in (model.mold_inputs([i])[0] for i in calibration_images):
+            values = session.run(tensors, feed_dict={image: molded_image})
+            for t, value in zip(tensors, values):
+                calibration.setdefault(t.name, []).append(value.astype(np.float32))
+
+    os.makedirs(export_dir, exist_ok=True)
+    stages = []
+    for group, inputs, outputs in groups:
+        mode = quantization.get(group, "float")
+        samples = list(zip(*[calibration[t.name] for t in inputs])) if mode == "int8" else []
+        flatbuffer = convert_tflite(session, inputs, outputs, mode,
+                                    lambda samples=samples: (list(s) for s in samples))
+        filename = "{}.tflite".format(group) if group else TFLITE_FILE
+        with open(os.path.join(export_dir, filename), "wb") as f:
+            f.write(flatbuffer)
+        stages.append({"group": group, "file": filename, "quantization": mode,
+                       "inputs": [tflite_name(t) for t in inputs],
+                       "outputs": [tflite_name(t) for t in outputs]})
+    write_contract(model, export_dir, mask_dtype, tflite_stages=stages)
+    return export_dir
+
+
+def tflite_function(path, input_names, output_names, num_threads=None):
+    """Loads a TFLite model and returns a callable that runs it on the
+    arrays of input_names and returns those of output_names.
+
+    The converted model has placeholder input shapes, so the inputs are
+    resized to the actual batch before the first call, and again only
+    if the image size changes.
+    """
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+    inputs = {d["name"]: d for d in interpreter.get_input_details()}
+    inputs = [inputs[name] for name in input_names]
+    outputs = {d["name"]: d for d in interpreter.get_output_details()}
+    outputs = [outputs[name]["index"] for name in output_names]
+    shapes = []
+
+    def run(*arrays):
+        arrays = [np.ascontiguousarray(a, dtype=d["dtype"]) for a, d in zip(arrays, inputs)]
+        if shapes != [a.shape for a in arrays]:
+            for a, d in zip(arrays, inputs):
+                interpreter.resize_tensor_input(d["index"], a.shape, strict=False)
+            interpreter.allocate_tensors()
+            shapes[:] = [a.shape for a in arrays]
+        for a, d in zip(arrays, inputs):
+            interpreter.set_tensor(d["index"], a)
+        interpreter.invoke()
+        return [interpreter.get_tensor(i) for i in outputs]
+
+    return run
+
+
+class ExportedModel(InferenceModel):
+    """Runs an exported model with the detect(), detect_many() and
+    detect_molded() of MaskRCNN, without building the Keras model.
+
+    path: Directory written by export_saved_model() or export_tflite().
+    runtime: "savedmodel" or "tflite"
+    num_threads: Optional number of CPU threads for the runtime.
+    """
+
+    def __init__(self, path, runtime="savedmodel", num_threads=None):
+        assert runtime in ("savedmodel", "tflite"), \
+            "Unknown runtime: {}".format(runtime)
+        with open(os.path.join(path, CONTRACT_FILE)) as f:
+            self.contract = json.load(f)
+        self.mode = "inference"
+        self.config = config_from_json(self.contract["config"], self.contract["array_keys"])
+        self.mask_dtype = self.contract["mask_dtype"]
+        self.path = path
+        self.runtime = runtime
+        if runtime == "savedmodel":
+            self._run = self.load_saved_model(path, num_threads)
+        else:
+            self._run = self.load_tflite(path, num_threads)
+
+    def load_saved_model(self, path, num_threads=None):
+        """Loads a SavedModel into its own graph and session and returns a
+        callable that runs it.
+        """
+        config = tf.compat.v1.ConfigProto()
+        if num_threads:
+            config.intra_op_parallelism_threads = num_threads
+            config.inter_op_parallelism_threads = num_threads
+        graph = tf.Graph()
+        self.session = tf.compat.v1.Session(graph=graph, config=config)
+        with graph.as_default():
+            meta_graph = tf.compat.v1.saved_model.loader.load(
+                self.session, [tf.compat.v1.saved_model.tag_constants.SERVING], path)
+        signature = meta_graph.signature_def["serving_default"]
+        inputs = [graph.get_tensor_by_name(signature.inputs[name].name)
+                  for name in INPUT_NAMES]
+        outputs = [graph.get_tensor_by_name(signature.outputs[name].name)
+                   for name in OUTPUT_NAMES]
+        return self.session.make_callable(outputs, feed_list=inputs)
+
+    def load_tflite(self, path, num_threads=None):
+        """Loads the TFLite models of an export and returns a callable that
+        runs them one after the other, each on the outputs of the ones
+        before.
+        """
+        stages = [(stage, tflite_function(os.path.join(path, stage["file"]), stage["inputs"],
+                                          stage["outputs"], num_threads))
+                  for stage in self.contract["tflite_stages"]]
+        outputs = stages[-1][0]["outputs"]
+
+        def run(*arrays):
+            tensors = dict(zip(INPUT_NAMES, arrays))
+            for stage, function in stages:
+                values = function(*[tensors[name] for name in stage["inputs"]])
+                tensors.update(zip(stage["outputs"], values))
+            return [tensors[name] for name in outputs]
+
+        self.stages = stages
+        return run
+
+    def inference_function(self, mask_dtype=None):
+        """Returns the callable that runs the exported graph. The mask type
+        is fixed at export time.
+        """
+        if mask_dtype and mask_dtype != self.mask_dtype:
+            raise ValueError("Model was exported with {} masks, not {}".format(
+                self.mask_dtype, mask_dtype))
+        return self._run
+
+
+def load_config(name):
+    """Returns an instance of a Config subclass given as "module:Class"."""
+    module, _, cls = name.partition(":")
+    return getattr(importlib.import_module(module), cls)()
+
+
+def main():
+    from mrcnn.model import MaskRCNN
+
+    parser = argparse.ArgumentParser(description="Export a Mask R-CNN inference model")
+    parser.add_argument("--weights", required=True, help="Path to the .h5 weights")
+    parser.add_argument("--config", required=True,
+                        help="Config class as module:Class, e.g. "
+                             "app.floorplan.detection:FloorPlanConfig")
+    parser.add_argument("--output", required=True, help="Directory to export to")
+    parser.add_argument("--format", nargs="+", default=["savedmodel"],
+                        choices=["savedmodel", "tflite"])
+    parser.add_argument("--mask-dtype", choices=["float32", "float16", "uint8"])
+    parser.add_argument("--exclude", nargs="*", default=None,
+                        help="Layers whose weights are not loaded")
+    parser.add_argument("--quantize", default=None,
+                        help="TFLite quantization of each layer group as group=mode,..., "
+                             "e.g. backbone=int8,fpn=int8,heads=dynamic")
+    parser.add_argument("--calibration-images", nargs="*", default=[],
+                        help="Images to calibrate the int8 layer groups on")
+    args = parser.parse_args()
+
+    model = MaskRCNN(mode="inference", config=load_config(args.config),
+                     model_dir=os.path.dirname(os.path.abspath(args.weights)))
+    model.load_weights(args.weights, by_name=True, exclude=args.exclude)
+    if "savedmodel" in args.format:
+        export_saved_model(model, args.output, args.mask_dtype)
+    if "tflite" in args.format:
+        quantization = parse_quantization(args.quantize) if args.quantize else None
+        calibration_images = [skimage.io.imread(path) for path in args.calibration_images]
+        export_tflite(model, args.output, args.mask_dtype, quantization, calibration_images)
+    print("Exported to {}".format(os.path.abspath(args.output)))
+
+
+if __name__ == "__main__":
+    main()
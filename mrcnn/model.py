@@ -9,11 +9,15 @@ Written by Waleed Abdulla
 """
 
 import os
+import abc
 import datetime
 import re
+import random
+import hashlib
 import math
-from collections import OrderedDict
-import multiprocessing
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import tensorflow as tf
 import tensorflow.keras as keras
@@ -24,6 +28,7 @@ from tensorflow.python.eager import context
 import tensorflow.keras.models as KM
 
 from mrcnn import utils
+from mrcnn import prefetch
 import sys
 from mrcnn.parallel_model import ParallelModel
 
@@ -1247,8 +1252,9 @@ def load_image_gt(dataset, config, image_id, augmentation=None):
         min_dim=config.IMAGE_MIN_DIM,
         min_scale=config.IMAGE_MIN_SCALE,
         max_dim=config.IMAGE_MAX_DIM,
-        mode=config.IMAGE_RESIZE_MODE)
-    mask = utils.resize_mask(mask, scale, padding, crop)
+        mode=config.IMAGE_RESIZE_MODE,
+        backend=config.RESIZE_BACKEND)
+    mask = utils.resize_mask(mask, scale, padding, crop, backend=config.RESIZE_BACKEND)
 
     # Augmentation
     # This requires the imgaug lib (https://github.com/aleju/imgaug)
@@ -1273,14 +1279,14 @@ def load_image_gt(dataset, config, image_id, augmentation=None):
         # Make augmenters deterministic to apply similarly to images and masks
         det = augmentation.to_deterministic()
         image = det.augment_image(image)
-        # Change mask to np.uint8 because imgaug doesn't support np.bool
+        # Change mask to np.uint8 because imgaug doesn't support bool
         mask = det.augment_image(mask.astype(np.uint8),
                                  hooks=imgaug.HooksImages(activator=hook))
         # Verify that shapes didn't change
         assert image.shape == image_shape, "Augmentation shouldn't change image size"
         assert mask.shape == mask_shape, "Augmentation shouldn't change mask size"
         # Change mask back to bool
-        mask = mask.astype(np.bool)
+        mask = mask.astype(bool)
 
     # Note that some boxes might be all zeros if the corresponding mask got cropped out.
     # and here is to filter them out
@@ -1348,18 +1354,8 @@ def build_detection_targets(rpn_rois, gt_class_ids, gt_boxes, gt_masks, config):
     gt_boxes = gt_boxes[instance_ids]
     gt_masks = gt_masks[:, :, instance_ids]
 
-    # Compute areas of ROIs and ground truth boxes.
-    rpn_roi_area = (rpn_rois[:, 2] - rpn_rois[:, 0]) * \
-        (rpn_rois[:, 3] - rpn_rois[:, 1])
-    gt_box_area = (gt_boxes[:, 2] - gt_boxes[:, 0]) * \
-        (gt_boxes[:, 3] - gt_boxes[:, 1])
-
     # Compute overlaps [rpn_rois, gt_boxes]
-    overlaps = np.zeros((rpn_rois.shape[0], gt_boxes.shape[0]))
-    for i in range(overlaps.shape[1]):
-        gt = gt_boxes[i]
-        overlaps[:, i] = utils.compute_iou(
-            gt, rpn_rois, gt_box_area[i], rpn_roi_area)
+    overlaps = utils.compute_overlaps(rpn_rois, gt_boxes)
 
     # Assign ROIs to GT boxes
     rpn_roi_iou_argmax = np.argmax(overlaps, axis=1)
@@ -1453,26 +1449,30 @@ def build_detection_targets(rpn_rois, gt_class_ids, gt_boxes, gt_masks, config):
             gt_h = gt_y2 - gt_y1
             # Resize mini mask to size of GT box
             placeholder[gt_y1:gt_y2, gt_x1:gt_x2] = \
-                np.round(utils.resize(class_mask, (gt_h, gt_w))).astype(bool)
+                np.round(utils.resize(class_mask, (gt_h, gt_w),
+                                      backend=config.RESIZE_BACKEND)).astype(bool)
             # Place the mini batch in the placeholder
             class_mask = placeholder
 
         # Pick part of the mask and resize it
         y1, x1, y2, x2 = rois[i].astype(np.int32)
         m = class_mask[y1:y2, x1:x2]
-        mask = utils.resize(m, config.MASK_SHAPE)
+        mask = utils.resize(m, config.MASK_SHAPE, backend=config.RESIZE_BACKEND)
         masks[i, :, :, class_id] = mask
 
     return rois, roi_gt_class_ids, bboxes, masks
 
 
-def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config):
+def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config,
+                      anchor_areas=None):
     """Given the anchors and GT boxes, compute overlaps and identify positive
     anchors and deltas to refine them to match their corresponding GT boxes.
 
     anchors: [num_anchors, (y1, x1, y2, x2)]
     gt_class_ids: [num_gt_boxes] Integer class IDs.
     gt_boxes: [num_gt_boxes, (y1, x1, y2, x2)]
+    anchor_areas: Optional [num_anchors] float32 areas of the anchors. Pass
+        them to avoid recomputing them for every image.
 
     Returns:
     rpn_match: [N] (int32) matches between anchors and GT boxes.
@@ -1495,7 +1495,8 @@ def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config):
         gt_class_ids = gt_class_ids[non_crowd_ix]
         gt_boxes = gt_boxes[non_crowd_ix]
         # Compute overlaps with crowd boxes [anchors, crowds]
-        crowd_overlaps = utils.compute_overlaps(anchors, crowd_boxes)
+        crowd_overlaps = utils.compute_overlaps(anchors, crowd_boxes,
+                                                boxes1_area=anchor_areas)
         crowd_iou_max = np.amax(crowd_overlaps, axis=1)
         no_crowd_bool = (crowd_iou_max < 0.001)
     else:
@@ -1503,7 +1504,7 @@ def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config):
         no_crowd_bool = np.ones([anchors.shape[0]], dtype=bool)
 
     # Compute overlaps [num_anchors, num_gt_boxes]
-    overlaps = utils.compute_overlaps(anchors, gt_boxes)
+    overlaps = utils.compute_overlaps(anchors, gt_boxes, boxes1_area=anchor_areas)
 
     # Match anchors to GT Boxes
     # If an anchor overlaps a GT box with IoU >= 0.7 then it's positive.
@@ -1519,8 +1520,11 @@ def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config):
     anchor_iou_max = overlaps[np.arange(overlaps.shape[0]), anchor_iou_argmax]
     rpn_match[(anchor_iou_max < 0.3) & (no_crowd_bool)] = -1
     # 2. Set an anchor for each GT box (regardless of IoU value).
-    # If multiple anchors have the same IoU match all of them
-    gt_iou_argmax = np.argwhere(overlaps == np.max(overlaps, axis=0))[:,0]
+    # If multiple anchors have the same IoU match all of them. Only anchors
+    # whose best IoU reaches the lowest of these maxima can be one of them.
+    gt_iou_max = np.max(overlaps, axis=0)
+    candidates = np.flatnonzero(anchor_iou_max >= gt_iou_max.min())
+    gt_iou_argmax = candidates[np.any(overlaps[candidates] == gt_iou_max, axis=1)]
     rpn_match[gt_iou_argmax] = 1
     # 3. Set anchors with high overlap as positive.
     rpn_match[anchor_iou_max >= 0.7] = 1
@@ -1543,36 +1547,11 @@ def build_rpn_targets(image_shape, anchors, gt_class_ids, gt_boxes, config):
         rpn_match[ids] = 0
 
     # For positive anchors, compute shift and scale needed to transform them
-    # to match the corresponding GT boxes.
+    # to match the corresponding GT boxes (the closest GT box of each, which
+    # might have IoU < 0.7), normalized.
     ids = np.where(rpn_match == 1)[0]
-    ix = 0  # index into rpn_bbox
-    # TODO: use box_refinement() rather than duplicating the code here
-    for i, a in zip(ids, anchors[ids]):
-        # Closest gt box (it might have IoU < 0.7)
-        gt = gt_boxes[anchor_iou_argmax[i]]
-
-        # Convert coordinates to center plus width/height.
-        # GT Box
-        gt_h = gt[2] - gt[0]
-        gt_w = gt[3] - gt[1]
-        gt_center_y = gt[0] + 0.5 * gt_h
-        gt_center_x = gt[1] + 0.5 * gt_w
-        # Anchor
-        a_h = a[2] - a[0]
-        a_w = a[3] - a[1]
-        a_center_y = a[0] + 0.5 * a_h
-        a_center_x = a[1] + 0.5 * a_w
-
-        # Compute the bbox refinement that the RPN should predict.
-        rpn_bbox[ix] = [
-            (gt_center_y - a_center_y) / a_h,
-            (gt_center_x - a_center_x) / a_w,
-            np.log(gt_h / a_h),
-            np.log(gt_w / a_w),
-        ]
-        # Normalize
-        rpn_bbox[ix] /= config.RPN_BBOX_STD_DEV
-        ix += 1
+    rpn_bbox[:len(ids)] = utils.box_refinement(
+        anchors[ids], gt_boxes[anchor_iou_argmax[ids]]) / config.RPN_BBOX_STD_DEV
 
     return rpn_match, rpn_bbox
 
@@ -1651,6 +1630,181 @@ def generate_random_rois(image_shape, count, gt_class_ids, gt_boxes):
     return rois
 
 
+class SampleCache(object):
+    """Preprocessed training samples of a dataset: the outputs of
+    load_image_gt() without augmentation, stored once in memory-mapped
+    shards so that they aren't decoded, rasterized and resized every epoch.
+
+    Images and masks are written to shard_NNNNN_images.npy and
+    shard_NNNNN_masks.npy files of about shard_size MB. Image metas, class
+    IDs, boxes and the offsets of each sample in the shards are in
+    index.npz, with a fingerprint of the dataset and the config settings
+    that load_image_gt() depends on. build() rebuilds the cache when the
+    fingerprint changes.
+
+    directory: Cache directory. Use one per dataset.
+    shard_size: Approximate size of the shard files, in MB.
+    """
+
+    VERSION = 1
+
+    # Config settings that change the output of load_image_gt()
+    CONFIG_KEYS = ["IMAGE_RESIZE_MODE", "IMAGE_MIN_DIM", "IMAGE_MAX_DIM", "IMAGE_MIN_SCALE",
+                   "RESIZE_BACKEND", "USE_MINI_MASK", "MINI_MASK_SHAPE"]
+
+    def __init__(self, directory, dataset, config, shard_size=512):
+        assert config.IMAGE_RESIZE_MODE != "crop", \
+            "Random crops can't be cached. Use another IMAGE_RESIZE_MODE."
+        self.directory = directory
+        self.dataset = dataset
+        self.config = config
+        self.shard_size = shard_size
+        self.fingerprint = self.compute_fingerprint()
+        self._index = None
+
+    def compute_fingerprint(self):
+        """Hash of the dataset's image and class info, the sizes and
+        modification times of its image files, and the config settings.
+        """
+        digest = hashlib.sha1()
+        settings = [self.VERSION] + [getattr(self.config, key) for key in self.CONFIG_KEYS]
+        utils.update_hash(digest, settings)
+        utils.update_hash(digest, [self.dataset.class_info, self.dataset.image_info])
+        for info in self.dataset.image_info:
+            path = info.get("path")
+            if isinstance(path, str) and os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update("{} {}".format(stat.st_size, stat.st_mtime_ns).encode())
+        return digest.hexdigest()
+
+    def is_current(self):
+        """True if the cache was built for this dataset and config"""
+        path = os.path.join(self.directory, "index.npz")
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as index:
+            return str(index["fingerprint"]) == self.fingerprint
+
+    def build(self, workers=None, verbose=1):
+        """Preprocesses all images of the dataset into the cache, unless it's
+        already current. Images are loaded by a pool of threads, at most
+        twice as many at a time as there are threads.
+
+        Returns True if the cache was (re)built.
+        """
+        if self.is_current():
+            return False
+        # The default of ThreadPoolExecutor
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.startswith("shard_") or name.startswith("index."):
+                os.remove(os.path.join(self.directory, name))
+        image_ids = self.dataset.image_ids
+        if verbose:
+            log("Caching {} preprocessed samples in {}".format(len(image_ids), self.directory))
+
+        def load(image_id):
+            return load_image_gt(self.dataset, self.config, image_id)
+
+        index = {key: [] for key in ["shards", "image_offsets", "image_shapes", "mask_offsets",
+                                     "mask_shapes", "image_metas", "class_ids", "bboxes"]}
+        shard = {"images": [], "masks": []}
+        offsets = {"images": 0, "masks": 0}
+        shard_count = 0
+
+        def write_shard():
+            for key in ["images", "masks"]:
+                np.save(os.path.join(self.directory, "shard_{:05d}_{}.npy".format(
+                    shard_count, key)), np.concatenate(shard[key]))
+                shard[key] = []
+                offsets[key] = 0
+
+        def samples(executor):
+            # Keeps a bounded window of images loading ahead of the one being
+            # written. executor.map() would submit, and hold, all of them.
+            ids = iter(image_ids)
+            pending = deque(executor.submit(load, image_id)
+                            for image_id in itertools.islice(ids, 2 * workers))
+            while pending:
+                sample = pending.popleft().result()
+                for image_id in itertools.islice(ids, 1):
+                    pending.append(executor.submit(load, image_id))
+                yield sample
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for image, image_meta, class_ids, bbox, mask in samples(executor):
+                index["shards"].append(shard_count)
+                for key, array in [("images", image), ("masks", mask)]:
+                    index[key[:-1] + "_offsets"].append(offsets[key])
+                    index[key[:-1] + "_shapes"].append(array.shape)
+                    shard[key].append(array.ravel())
+                    offsets[key] += array.size
+                index["image_metas"].append(image_meta)
+                index["class_ids"].append(class_ids)
+                index["bboxes"].append(bbox)
+                if sum(a.nbytes for arrays in shard.values() for a in arrays) \
+                        >= self.shard_size * 2 ** 20:
+                    write_shard()
+                    shard_count += 1
+        if shard["images"]:
+            write_shard()
+
+        counts = [len(c) for c in index["class_ids"]]
+        # Write the index last, so an interrupted build is rebuilt next time
+        path = os.path.join(self.directory, "index.npz")
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, fingerprint=self.fingerprint, image_ids=np.asarray(image_ids),
+                     shards=np.array(index["shards"], dtype=np.int32),
+                     image_offsets=np.array(index["image_offsets"], dtype=np.int64),
+                     image_shapes=np.array(index["image_shapes"], dtype=np.int64).reshape(-1, 3),
+                     mask_offsets=np.array(index["mask_offsets"], dtype=np.int64),
+                     mask_shapes=np.array(index["mask_shapes"], dtype=np.int64).reshape(-1, 3),
+                     image_metas=np.array(index["image_metas"]),
+                     instance_offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                     class_ids=np.concatenate([np.zeros(0, np.int32)] + index["class_ids"]),
+                     bboxes=np.concatenate([np.zeros((0, 4), np.int32)] + index["bboxes"]))
+        os.replace(path + ".tmp", path)
+        self._index = None
+        return True
+
+    def _open(self):
+        """Loads the index and memory-maps the shards"""
+        with np.load(os.path.join(self.directory, "index.npz")) as index:
+            self._index = {key: index[key] for key in index.files}
+        assert str(self._index["fingerprint"]) == self.fingerprint, \
+            "Sample cache {} is out of date. Run build().".format(self.directory)
+        self._rows = {image_id: row for row, image_id in enumerate(self._index["image_ids"])}
+        self._shards = [
+            {key: np.load(os.path.join(self.directory, "shard_{:05d}_{}.npy".format(i, key)),
+                          mmap_mode="r") for key in ["images", "masks"]}
+            for i in range(self._index["shards"].max() + 1 if self._rows else 0)]
+
+    def load(self, image_id):
+        """Returns the sample of an image like load_image_gt() does. The image
+        and mask are read-only views of the memory-mapped shards.
+        """
+        if self._index is None:
+            self._open()
+        index = self._index
+        row = self._rows[image_id]
+        shard = self._shards[index["shards"][row]]
+        start, size = index["image_offsets"][row], np.prod(index["image_shapes"][row])
+        image = shard["images"][start:start + size].reshape(index["image_shapes"][row])
+        start, size = index["mask_offsets"][row], np.prod(index["mask_shapes"][row])
+        mask = shard["masks"][start:start + size].reshape(index["mask_shapes"][row])
+        instances = slice(index["instance_offsets"][row], index["instance_offsets"][row + 1])
+        return (image, index["image_metas"][row], index["class_ids"][instances],
+                index["bboxes"][instances], mask)
+
+    def __getstate__(self):
+        # Worker processes map the shards again
+        state = self.__dict__.copy()
+        state["_index"] = None
+        state.pop("_shards", None)
+        return state
+
+
 class DataGenerator(KU.Sequence):
     """An iterable that returns images and corresponding target class ids,
         bounding box deltas, and masks. It inherits from keras.utils.Sequence to avoid data redundancy
@@ -1668,6 +1822,12 @@ class DataGenerator(KU.Sequence):
         detection_targets: If True, generate detection targets (class IDs, bbox
             deltas, and masks). Typically for debugging or visualizations because
             in trainig detection targets are generated by DetectionTargetLayer.
+        seed: Optional. If set, batch idx only depends on the seed and idx,
+            not on the batches built before it or the process building it.
+            Reseeds the numpy, random and imgaug global generators.
+        cache: Optional. A built SampleCache of the dataset to read the
+            samples from instead of calling load_image_gt(). Can't be used
+            with augmentation.
 
         Returns a Python iterable. Upon calling __getitem__() on it, the
         iterable returns two lists, inputs and outputs. The contents
@@ -1689,7 +1849,8 @@ class DataGenerator(KU.Sequence):
         """
 
     def __init__(self, dataset, config, shuffle=True, augmentation=None,
-                 random_rois=0, detection_targets=False):
+                 random_rois=0, detection_targets=False, seed=None, cache=None):
+        assert not (cache and augmentation), "Cached samples can't be augmented"
 
         self.image_ids = np.copy(dataset.image_ids)
         self.dataset = dataset
@@ -1703,17 +1864,36 @@ class DataGenerator(KU.Sequence):
                                                       self.backbone_shapes,
                                                       config.BACKBONE_STRIDES,
                                                       config.RPN_ANCHOR_STRIDE)
+        # Anchor areas, in float32 like utils.compute_overlaps() computes them
+        anchors = self.anchors.astype(np.float32)
+        self.anchor_areas = (anchors[:, 2] - anchors[:, 0]) * (anchors[:, 3] - anchors[:, 1])
 
         self.shuffle = shuffle
         self.augmentation = augmentation
         self.random_rois = random_rois
         self.batch_size = self.config.BATCH_SIZE
         self.detection_targets = detection_targets
+        self.seed = seed
+        self.cache = cache
 
     def __len__(self):
         return int(np.ceil(len(self.image_ids) / float(self.batch_size)))
 
+    def seed_batch(self, idx):
+        """Seeds the global random generators for building batch idx, and
+        resets the image order that batches are shuffled from.
+        """
+        seed = np.random.SeedSequence([self.seed, idx]).generate_state(1)[0]
+        np.random.seed(seed)
+        random.seed(int(seed))
+        if self.augmentation:
+            import imgaug
+            imgaug.seed(int(seed))
+        self.image_ids = np.copy(self.dataset.image_ids)
+
     def __getitem__(self, idx):
+        if self.seed is not None:
+            self.seed_batch(idx)
         b = 0
         image_index = -1
         while b < self.batch_size:
@@ -1725,9 +1905,13 @@ class DataGenerator(KU.Sequence):
 
             # Get GT bounding boxes and masks for image.
             image_id = self.image_ids[image_index]
-            image, image_meta, gt_class_ids, gt_boxes, gt_masks = \
-                load_image_gt(self.dataset, self.config, image_id,
-                              augmentation=self.augmentation)
+            if self.cache:
+                image, image_meta, gt_class_ids, gt_boxes, gt_masks = \
+                    self.cache.load(image_id)
+            else:
+                image, image_meta, gt_class_ids, gt_boxes, gt_masks = \
+                    load_image_gt(self.dataset, self.config, image_id,
+                                  augmentation=self.augmentation)
 
             # Skip images that have no instances. This can happen in cases
             # where we train on a subset of classes and the image doesn't
@@ -1737,7 +1921,8 @@ class DataGenerator(KU.Sequence):
 
             # RPN Targets
             rpn_match, rpn_bbox = build_rpn_targets(image.shape, self.anchors,
-                                                    gt_class_ids, gt_boxes, self.config)
+                                                    gt_class_ids, gt_boxes, self.config,
+                                                    anchor_areas=self.anchor_areas)
 
             # Mask R-CNN Targets
             if self.random_rois:
@@ -1824,7 +2009,370 @@ class DataGenerator(KU.Sequence):
 #  MaskRCNN Class
 ############################################################
 
-class MaskRCNN(object):
+class InferenceModel(abc.ABC):
+    """The detection pipeline around a Mask R-CNN inference graph: molding
+    the images, running the network and unmolding its outputs.
+
+    Subclasses provide config, mode and inference_function(), which runs
+    the network. MaskRCNN runs the Keras model, export.ExportedModel runs
+    an exported SavedModel or TFLite model.
+    """
+
+    def mold_inputs(self, images):
+        """Takes a list of images and modifies them to the format expected
+        as an input to the neural network.
+        images: List of image matrices [height,width,depth]. Images can have
+            different sizes.
+
+        Returns 3 Numpy matrices:
+        molded_images: [N, h, w, 3]. Images resized and normalized.
+        image_metas: [N, length of meta data]. Details about each image.
+        windows: [N, (y1, x1, y2, x2)]. The portion of the image that has the
+            original image (padding excluded).
+        """
+        molded_images = []
+        image_metas = []
+        windows = []
+        for image in images:
+            # Resize image
+            # TODO: move resizing to mold_image()
+            molded_image, window, scale, padding, crop = utils.resize_image(
+                image,
+                min_dim=self.config.IMAGE_MIN_DIM,
+                min_scale=self.config.IMAGE_MIN_SCALE,
+                max_dim=self.config.IMAGE_MAX_DIM,
+                mode=self.config.IMAGE_RESIZE_MODE,
+                backend=self.config.RESIZE_BACKEND)
+            molded_image = mold_image(molded_image, self.config)
+            # Build image_meta
+            image_meta = compose_image_meta(
+                0, image.shape, molded_image.shape, window, scale,
+                np.zeros([self.config.NUM_CLASSES], dtype=np.int32))
+            # Append
+            molded_images.append(molded_image)
+            windows.append(window)
+            image_metas.append(image_meta)
+        # Pack into arrays
+        molded_images = np.stack(molded_images)
+        image_metas = np.stack(image_metas)
+        windows = np.stack(windows)
+        return molded_images, image_metas, windows
+
+    def unmold_detections(self, detections, mrcnn_mask, original_image_shape,
+                          image_shape, window, sparse_masks=False):
+        """Reformats the detections of one image from the format of the neural
+        network output to a format suitable for use in the rest of the
+        application.
+
+        detections: [N, (y1, x1, y2, x2, class_id, score)] in normalized coordinates
+        mrcnn_mask: [N, height, width, num_classes], or [N, height, width] if
+            the masks were already picked for their class. Either float, or
+            uint8 probabilities * 255.
+        original_image_shape: [H, W, C] Original image shape before resizing
+        image_shape: [H, W, C] Shape of the image after resizing and padding
+        window: [y1, x1, y2, x2] Pixel coordinates of box in the image where the real
+                image is excluding the padding.
+        sparse_masks: If True, return masks cropped to their boxes instead of
+                pasting them into full size masks.
+
+        Returns:
+        boxes: [N, (y1, x1, y2, x2)] Bounding boxes in pixels
+        class_ids: [N] Integer class IDs for each bounding box
+        scores: [N] Float probability scores of the class_id
+        masks: [height, width, num_instances] Instance masks, or a list of
+               num_instances [y2 - y1, x2 - x1] masks if sparse_masks is True.
+        """
+        # How many detections do we have?
+        # Detections array is padded with zeros. Find the first class_id == 0.
+        zero_ix = np.where(detections[:, 4] == 0)[0]
+        N = zero_ix[0] if zero_ix.shape[0] > 0 else detections.shape[0]
+
+        # Extract boxes, class_ids, scores, and class-specific masks
+        boxes = detections[:N, :4]
+        class_ids = detections[:N, 4].astype(np.int32)
+        scores = detections[:N, 5]
+        if mrcnn_mask.ndim == 3:
+            # Masks already picked for their class by the serving graph
+            masks = mrcnn_mask[:N]
+        else:
+            masks = mrcnn_mask[np.arange(N), :, :, class_ids]
+        if masks.dtype == np.uint8:
+            masks = masks.astype(np.float32) / 255
+        else:
+            masks = masks.astype(np.float32, copy=False)
+
+        # Translate normalized coordinates in the resized image to pixel
+        # coordinates in the original image before resizing
+        window = utils.norm_boxes(window, image_shape[:2])
+        wy1, wx1, wy2, wx2 = window
+        shift = np.array([wy1, wx1, wy1, wx1])
+        wh = wy2 - wy1  # window height
+        ww = wx2 - wx1  # window width
+        scale = np.array([wh, ww, wh, ww])
+        # Convert boxes to normalized coordinates on the window
+        boxes = np.divide(boxes - shift, scale)
+        # Convert boxes to pixel coordinates on the original image
+        boxes = utils.denorm_boxes(boxes, original_image_shape[:2])
+
+        # Filter out detections with zero area. Happens in early training when
+        # network weights are still random
+        exclude_ix = np.where(
+            (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) <= 0)[0]
+        if exclude_ix.shape[0] > 0:
+            boxes = np.delete(boxes, exclude_ix, axis=0)
+            class_ids = np.delete(class_ids, exclude_ix, axis=0)
+            scores = np.delete(scores, exclude_ix, axis=0)
+            masks = np.delete(masks, exclude_ix, axis=0)
+            N = class_ids.shape[0]
+
+        # Resize masks to original image size and set boundary threshold.
+        # All masks are unmolded in one batched pass, either into their
+        # boxes only (sparse) or into one full size [H, W, N] array.
+        full_masks = utils.unmold_masks(masks, boxes, original_image_shape,
+                                        sparse=sparse_masks)
+
+        return boxes, class_ids, scores, full_masks
+
+    def detect(self, images, verbose=0, sparse_masks=False):
+        """Runs the detection pipeline.
+
+        images: List of BATCH_SIZE images, potentially of different sizes.
+            To run any number of images, use detect_many().
+        sparse_masks: If True, masks are returned cropped to their boxes
+            (see utils.dense_to_sparse_masks()) so memory depends on the
+            instance areas rather than on the image size.
+
+        Returns a list of dicts, one dict per image. The dict contains:
+        rois: [N, (y1, x1, y2, x2)] detection bounding boxes
+        class_ids: [N] int class IDs
+        scores: [N] float probability scores for the class IDs
+        masks: [H, W, N] instance binary masks, or a list of N
+               [y2 - y1, x2 - x1] binary masks if sparse_masks is True.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        assert len(
+            images) == self.config.BATCH_SIZE, "len(images) must be equal to BATCH_SIZE"
+
+        if verbose:
+            log("Processing {} images".format(len(images)))
+            for image in images:
+                log("image", image)
+
+        # Mold inputs to format expected by the neural network
+        molded_images, image_metas, windows = self.mold_inputs(images)
+        return self.detect_batch(images, molded_images, image_metas, windows,
+                                 verbose=verbose, sparse_masks=sparse_masks)
+
+    def detect_batch(self, images, molded_images, image_metas, windows,
+                     verbose=0, sparse_masks=False):
+        """Runs the network on molded images and unmolds the detections.
+
+        images: List of the original images.
+        molded_images, image_metas, windows: Output of mold_inputs(images).
+            If there are fewer images than BATCH_SIZE, or not a multiple of
+            it, the batch is padded by repeating the last image and the extra
+            results are dropped.
+        sparse_masks: If True, masks are returned cropped to their boxes.
+
+        Returns a list of result dicts, one per image, as detect() does.
+        """
+        # Validate image sizes
+        # All images in a batch MUST be of the same size
+        image_shape = molded_images[0].shape
+        for g in molded_images[1:]:
+            assert g.shape == image_shape,\
+                "After resizing, all images must have the same size. Check IMAGE_RESIZE_MODE and image sizes."
+
+        # Pad to a whole number of batches. The graph has a fixed batch size.
+        padding = -len(molded_images) % self.config.BATCH_SIZE
+        if padding:
+            molded_images = np.concatenate(
+                [molded_images, np.repeat(molded_images[-1:], padding, axis=0)])
+            image_metas = np.concatenate(
+                [image_metas, np.repeat(image_metas[-1:], padding, axis=0)])
+
+        # Anchors
+        anchors = self.get_anchors(image_shape)
+        # Duplicate across the batch dimension because Keras requires it
+        # TODO: can this be optimized to avoid duplicating the anchors?
+        anchors = np.broadcast_to(anchors, (len(molded_images),) + anchors.shape)
+
+        if verbose:
+            log("molded_images", molded_images)
+            log("image_metas", image_metas)
+            log("anchors", anchors)
+        # Run object detection
+        detections, mrcnn_mask = self.predict_detections(molded_images, image_metas, anchors)
+        # Process detections
+        results = []
+        for i, image in enumerate(images):
+            final_rois, final_class_ids, final_scores, final_masks =\
+                self.unmold_detections(detections[i], mrcnn_mask[i],
+                                       image.shape, molded_images[i].shape,
+                                       windows[i], sparse_masks=sparse_masks)
+            results.append({
+                "rois": final_rois,
+                "class_ids": final_class_ids,
+                "scores": final_scores,
+                "masks": final_masks,
+            })
+        return results
+
+    def detect_many(self, images, batch_size=None, verbose=0, sparse_masks=False):
+        """Runs the detection pipeline on any number of images.
+
+        Unlike detect(), the number of images doesn't have to match
+        BATCH_SIZE. Images are processed in chunks of batch_size, rounded up
+        to a multiple of BATCH_SIZE, and the last chunk is padded. While the
+        network runs on one chunk, the next one is taken from images and
+        molded in a background thread.
+
+        images: Iterable of images, e.g. a generator that loads them from
+            disk. All images must have the same size after resizing.
+        batch_size: Number of images run through the network per call.
+            Defaults to BATCH_SIZE. Larger chunks amortize the per-call
+            overhead at the cost of memory.
+        sparse_masks: If True, masks are returned cropped to their boxes.
+
+        Yields one result dict per image, in input order, as detect() returns.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        batch_size = batch_size or self.config.BATCH_SIZE
+        batch_size = -(-batch_size // self.config.BATCH_SIZE) * self.config.BATCH_SIZE
+        images = iter(images)
+
+        def load_chunk():
+            # Pulls the images in the background too, so loading them from
+            # a generator also overlaps with the network
+            chunk = list(itertools.islice(images, batch_size))
+            return (chunk,) + self.mold_inputs(chunk) if chunk else None
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            loading = executor.submit(load_chunk)
+            while True:
+                loaded = loading.result()
+                if loaded is None:
+                    break
+                chunk, molded_images, image_metas, windows = loaded
+                # Load and mold the next chunk while this one runs
+                loading = executor.submit(load_chunk)
+                if verbose:
+                    log("Processing {} images".format(len(chunk)))
+                yield from self.detect_batch(chunk, molded_images, image_metas, windows,
+                                             verbose=verbose, sparse_masks=sparse_masks)
+
+    def detect_molded(self, molded_images, image_metas, verbose=0,
+                      sparse_masks=False):
+        """Runs the detection pipeline, but expect inputs that are
+        molded already. Used mostly for debugging and inspecting
+        the model.
+
+        molded_images: List of images loaded using load_image_gt()
+        image_metas: image meta data, also returned by load_image_gt()
+        sparse_masks: If True, masks are returned cropped to their boxes.
+
+        Returns a list of dicts, one dict per image. The dict contains:
+        rois: [N, (y1, x1, y2, x2)] detection bounding boxes
+        class_ids: [N] int class IDs
+        scores: [N] float probability scores for the class IDs
+        masks: [H, W, N] instance binary masks, or a list of N
+               [y2 - y1, x2 - x1] binary masks if sparse_masks is True.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        assert len(molded_images) == self.config.BATCH_SIZE,\
+            "Number of images must be equal to BATCH_SIZE"
+
+        if verbose:
+            log("Processing {} images".format(len(molded_images)))
+            for image in molded_images:
+                log("image", image)
+
+        # Validate image sizes
+        # All images in a batch MUST be of the same size
+        image_shape = molded_images[0].shape
+        for g in molded_images[1:]:
+            assert g.shape == image_shape, "Images must have the same size"
+
+        # Anchors
+        anchors = self.get_anchors(image_shape)
+        # Duplicate across the batch dimension because Keras requires it
+        # TODO: can this be optimized to avoid duplicating the anchors?
+        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
+
+        if verbose:
+            log("molded_images", molded_images)
+            log("image_metas", image_metas)
+            log("anchors", anchors)
+        # Run object detection
+        detections, mrcnn_mask = self.predict_detections(molded_images, image_metas, anchors)
+        # Process detections
+        results = []
+        for i, image in enumerate(molded_images):
+            window = [0, 0, image.shape[0], image.shape[1]]
+            final_rois, final_class_ids, final_scores, final_masks =\
+                self.unmold_detections(detections[i], mrcnn_mask[i],
+                                       image.shape, molded_images[i].shape,
+                                       window, sparse_masks=sparse_masks)
+            results.append({
+                "rois": final_rois,
+                "class_ids": final_class_ids,
+                "scores": final_scores,
+                "masks": final_masks,
+            })
+        return results
+
+    def get_anchors(self, image_shape):
+        """Returns anchor pyramid for the given image size."""
+        backbone_shapes = compute_backbone_shapes(self.config, image_shape)
+        # Cache anchors and reuse if image shape is the same
+        if not hasattr(self, "_anchor_cache"):
+            self._anchor_cache = {}
+        if not tuple(image_shape) in self._anchor_cache:
+            # Generate Anchors
+            a = utils.generate_pyramid_anchors(
+                self.config.RPN_ANCHOR_SCALES,
+                self.config.RPN_ANCHOR_RATIOS,
+                backbone_shapes,
+                self.config.BACKBONE_STRIDES,
+                self.config.RPN_ANCHOR_STRIDE)
+            # Keep a copy of the latest anchors in pixel coordinates because
+            # it's used in inspect_model notebooks.
+            # TODO: Remove this after the notebook are refactored to not use it
+            self.anchors = a
+            # Normalize coordinates
+            self._anchor_cache[tuple(image_shape)] = utils.norm_boxes(a, image_shape[:2])
+        return self._anchor_cache[tuple(image_shape)]
+
+    @abc.abstractmethod
+    def inference_function(self, mask_dtype=None):
+        """Returns a callable that runs the network on one batch of
+        (molded_images, image_metas, anchors) and returns its detections
+        and masks. See MaskRCNN.inference_function().
+        """
+
+    def predict_detections(self, molded_images, image_metas, anchors, mask_dtype=None):
+        """Runs the serving graph, BATCH_SIZE images at a time.
+
+        molded_images, image_metas, anchors: Network inputs for a multiple of
+            BATCH_SIZE images.
+        mask_dtype: Type of the returned masks. Defaults to
+            config.INFERENCE_MASK_DTYPE.
+
+        Returns:
+        detections: [N, DETECTION_MAX_INSTANCES, (y1, x1, y2, x2, class_id, score)]
+        masks: [N, DETECTION_MAX_INSTANCES, height, width] mask of each
+            detection's class, of type mask_dtype
+        """
+        run = self.inference_function(mask_dtype)
+        step = self.config.BATCH_SIZE
+        outputs = [run(molded_images[i:i + step], image_metas[i:i + step], anchors[i:i + step])
+                   for i in range(0, len(molded_images), step)]
+        if len(outputs) == 1:
+            return outputs[0]
+        return [np.concatenate(o) for o in zip(*outputs)]
+
+
+class MaskRCNN(InferenceModel):
     """Encapsulates the Mask RCNN model functionality.
 
     The actual Keras model is in the keras_model property.
@@ -2333,10 +2881,23 @@ class MaskRCNN(object):
         if layers in layer_regex.keys():
             layers = layer_regex[layers]
 
+        # Preprocessed sample caches
+        train_cache = val_cache = None
+        if self.config.SAMPLE_CACHE_DIR:
+            if not augmentation:
+                train_cache = SampleCache(os.path.join(self.config.SAMPLE_CACHE_DIR, "train"),
+                                          train_dataset, self.config)
+                train_cache.build()
+            val_cache = SampleCache(os.path.join(self.config.SAMPLE_CACHE_DIR, "val"),
+                                    val_dataset, self.config)
+            val_cache.build()
+
         # Data generators
         train_generator = DataGenerator(train_dataset, self.config, shuffle=True,
-                                         augmentation=augmentation)
-        val_generator = DataGenerator(val_dataset, self.config, shuffle=True)
+                                         augmentation=augmentation,
+                                         seed=self.config.DATA_SEED, cache=train_cache)
+        val_generator = DataGenerator(val_dataset, self.config, shuffle=True,
+                                       seed=self.config.DATA_SEED, cache=val_cache)
 
         # Create log_dir if it does not exist
         if not os.path.exists(self.log_dir):
@@ -2350,6 +2911,18 @@ class MaskRCNN(object):
                                             verbose=0, save_weights_only=True),
         ]
 
+        # Work-around for Windows: Keras fails on Windows when using
+        # multiprocessing workers. See discussion here:
+        # https://github.com/matterport/Mask_RCNN/issues/13#issuecomment-353124009
+        workers = 0 if os.name == 'nt' else self.config.DATA_WORKERS
+        # Build training batches in worker processes, continuing from the
+        # batches of the epochs already trained
+        train_batches = prefetch.BatchPrefetcher(
+            train_generator, workers=workers, queue_size=self.config.DATA_QUEUE_SIZE,
+            start=self.epoch * self.config.STEPS_PER_EPOCH)
+        # Before the other callbacks, so they see the data wait in the logs
+        callbacks.insert(0, prefetch.DataWaitLogger(train_batches))
+
         # Add custom callbacks to the list
         if custom_callbacks:
             callbacks += custom_callbacks
@@ -2360,269 +2933,83 @@ class MaskRCNN(object):
         self.set_trainable(layers)
         self.compile(learning_rate, self.config.LEARNING_MOMENTUM)
 
-        # Work-around for Windows: Keras fails on Windows when using
-        # multiprocessing workers. See discussion here:
-        # https://github.com/matterport/Mask_RCNN/issues/13#issuecomment-353124009
-        if os.name == 'nt':
-            workers = 0
-        else:
-            workers = multiprocessing.cpu_count()
-
-        self.keras_model.fit(
-            train_generator,
-            initial_epoch=self.epoch,
-            epochs=epochs,
-            steps_per_epoch=self.config.STEPS_PER_EPOCH,
-            callbacks=callbacks,
-            validation_data=val_generator,
-            validation_steps=self.config.VALIDATION_STEPS,
-            max_queue_size=100,
-            workers=0,
-            use_multiprocessing=False,
-        )
+        # Validation is short, so its batches are still built on the
+        # training thread, from a Sequence that Keras restarts every epoch
+        with train_batches:
+            self.keras_model.fit(
+                train_batches,
+                initial_epoch=self.epoch,
+                epochs=epochs,
+                steps_per_epoch=self.config.STEPS_PER_EPOCH,
+                callbacks=callbacks,
+                validation_data=val_generator,
+                validation_steps=self.config.VALIDATION_STEPS,
+                workers=0,
+                use_multiprocessing=False,
+            )
         self.epoch = max(self.epoch, epochs)
 
-    def mold_inputs(self, images):
-        """Takes a list of images and modifies them to the format expected
-        as an input to the neural network.
-        images: List of image matrices [height,width,depth]. Images can have
-            different sizes.
-
-        Returns 3 Numpy matrices:
-        molded_images: [N, h, w, 3]. Images resized and normalized.
-        image_metas: [N, length of meta data]. Details about each image.
-        windows: [N, (y1, x1, y2, x2)]. The portion of the image that has the
-            original image (padding excluded).
-        """
-        molded_images = []
-        image_metas = []
-        windows = []
-        for image in images:
-            # Resize image
-            # TODO: move resizing to mold_image()
-            molded_image, window, scale, padding, crop = utils.resize_image(
-                image,
-                min_dim=self.config.IMAGE_MIN_DIM,
-                min_scale=self.config.IMAGE_MIN_SCALE,
-                max_dim=self.config.IMAGE_MAX_DIM,
-                mode=self.config.IMAGE_RESIZE_MODE)
-            molded_image = mold_image(molded_image, self.config)
-            # Build image_meta
-            image_meta = compose_image_meta(
-                0, image.shape, molded_image.shape, window, scale,
-                np.zeros([self.config.NUM_CLASSES], dtype=np.int32))
-            # Append
-            molded_images.append(molded_image)
-            windows.append(window)
-            image_metas.append(image_meta)
-        # Pack into arrays
-        molded_images = np.stack(molded_images)
-        image_metas = np.stack(image_metas)
-        windows = np.stack(windows)
-        return molded_images, image_metas, windows
-
-    def unmold_detections(self, detections, mrcnn_mask, original_image_shape,
-                          image_shape, window):
-        """Reformats the detections of one image from the format of the neural
-        network output to a format suitable for use in the rest of the
-        application.
-
-        detections: [N, (y1, x1, y2, x2, class_id, score)] in normalized coordinates
-        mrcnn_mask: [N, height, width, num_classes]
-        original_image_shape: [H, W, C] Original image shape before resizing
-        image_shape: [H, W, C] Shape of the image after resizing and padding
-        window: [y1, x1, y2, x2] Pixel coordinates of box in the image where the real
-                image is excluding the padding.
-
-        Returns:
-        boxes: [N, (y1, x1, y2, x2)] Bounding boxes in pixels
-        class_ids: [N] Integer class IDs for each bounding box
-        scores: [N] Float probability scores of the class_id
-        masks: [height, width, num_instances] Instance masks
-        """
-        # How many detections do we have?
-        # Detections array is padded with zeros. Find the first class_id == 0.
-        zero_ix = np.where(detections[:, 4] == 0)[0]
-        N = zero_ix[0] if zero_ix.shape[0] > 0 else detections.shape[0]
-
-        # Extract boxes, class_ids, scores, and class-specific masks
-        boxes = detections[:N, :4]
-        class_ids = detections[:N, 4].astype(np.int32)
-        scores = detections[:N, 5]
-        masks = mrcnn_mask[np.arange(N), :, :, class_ids]
-
-        # Translate normalized coordinates in the resized image to pixel
-        # coordinates in the original image before resizing
-        window = utils.norm_boxes(window, image_shape[:2])
-        wy1, wx1, wy2, wx2 = window
-        shift = np.array([wy1, wx1, wy1, wx1])
-        wh = wy2 - wy1  # window height
-        ww = wx2 - wx1  # window width
-        scale = np.array([wh, ww, wh, ww])
-        # Convert boxes to normalized coordinates on the window
-        boxes = np.divide(boxes - shift, scale)
-        # Convert boxes to pixel coordinates on the original image
-        boxes = utils.denorm_boxes(boxes, original_image_shape[:2])
-
-        # Filter out detections with zero area. Happens in early training when
-        # network weights are still random
-        exclude_ix = np.where(
-            (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) <= 0)[0]
-        if exclude_ix.shape[0] > 0:
-            boxes = np.delete(boxes, exclude_ix, axis=0)
-            class_ids = np.delete(class_ids, exclude_ix, axis=0)
-            scores = np.delete(scores, exclude_ix, axis=0)
-            masks = np.delete(masks, exclude_ix, axis=0)
-            N = class_ids.shape[0]
-
-        # Resize masks to original image size and set boundary threshold.
-        full_masks = []
-        for i in range(N):
-            # Convert neural network mask to full size mask
-            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape)
-            full_masks.append(full_mask)
-        full_masks = np.stack(full_masks, axis=-1)\
-            if full_masks else np.empty(original_image_shape[:2] + (0,))
+    def serving_model(self, mask_dtype=None):
+        """Returns a model that only computes what detect() uses.
 
-        return boxes, class_ids, scores, full_masks
-
-    def detect(self, images, verbose=0):
-        """Runs the detection pipeline.
+        Of the seven inference outputs, only detections and mrcnn_mask are
+        kept, so the rest of the graph is pruned when it runs. The mask of
+        each detection is picked for its class inside the graph and cast to
+        mask_dtype, which cuts the mask output by a factor of NUM_CLASSES,
+        and more for smaller types.
 
-        images: List of images, potentially of different sizes.
+        mask_dtype: "float32", "float16" or "uint8" (probability * 255).
+            Defaults to config.INFERENCE_MASK_DTYPE.
 
-        Returns a list of dicts, one dict per image. The dict contains:
-        rois: [N, (y1, x1, y2, x2)] detection bounding boxes
-        class_ids: [N] int class IDs
-        scores: [N] float probability scores for the class IDs
-        masks: [H, W, N] instance binary masks
+        Returns a Keras model with the inputs of keras_model and outputs:
+        detections: [batch, DETECTION_MAX_INSTANCES, (y1, x1, y2, x2, class_id, score)]
+        masks: [batch, DETECTION_MAX_INSTANCES, height, width] of mask_dtype
         """
         assert self.mode == "inference", "Create model in inference mode."
-        assert len(
-            images) == self.config.BATCH_SIZE, "len(images) must be equal to BATCH_SIZE"
-
-        if verbose:
-            log("Processing {} images".format(len(images)))
-            for image in images:
-                log("image", image)
-
-        # Mold inputs to format expected by the neural network
-        molded_images, image_metas, windows = self.mold_inputs(images)
-
-        # Validate image sizes
-        # All images in a batch MUST be of the same size
-        image_shape = molded_images[0].shape
-        for g in molded_images[1:]:
-            assert g.shape == image_shape,\
-                "After resizing, all images must have the same size. Check IMAGE_RESIZE_MODE and image sizes."
-
-        # Anchors
-        anchors = self.get_anchors(image_shape)
-        # Duplicate across the batch dimension because Keras requires it
-        # TODO: can this be optimized to avoid duplicating the anchors?
-        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
-
-        if verbose:
-            log("molded_images", molded_images)
-            log("image_metas", image_metas)
-            log("anchors", anchors)
-        # Run object detection
-        detections, _, _, mrcnn_mask, _, _, _ =\
-            self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
-        # Process detections
-        results = []
-        for i, image in enumerate(images):
-            final_rois, final_class_ids, final_scores, final_masks =\
-                self.unmold_detections(detections[i], mrcnn_mask[i],
-                                       image.shape, molded_images[i].shape,
-                                       windows[i])
-            results.append({
-                "rois": final_rois,
-                "class_ids": final_class_ids,
-                "scores": final_scores,
-                "masks": final_masks,
-            })
-        return results
-
-    def detect_molded(self, molded_images, image_metas, verbose=0):
-        """Runs the detection pipeline, but expect inputs that are
-        molded already. Used mostly for debugging and inspecting
-        the model.
-
-        molded_images: List of images loaded using load_image_gt()
-        image_metas: image meta data, also returned by load_image_gt()
-
-        Returns a list of dicts, one dict per image. The dict contains:
-        rois: [N, (y1, x1, y2, x2)] detection bounding boxes
-        class_ids: [N] int class IDs
-        scores: [N] float probability scores for the class IDs
-        masks: [H, W, N] instance binary masks
+        mask_dtype = mask_dtype or self.config.INFERENCE_MASK_DTYPE
+        assert mask_dtype in ("float32", "float16", "uint8"), \
+            "Unsupported mask dtype: {}".format(mask_dtype)
+        if not hasattr(self, "_serving_models"):
+            self._serving_models = {}
+        if mask_dtype not in self._serving_models:
+            outputs = self.keras_model.outputs
+            detections, mrcnn_mask = outputs[0], outputs[3]
+
+            def class_masks(inputs):
+                detections, mrcnn_mask = inputs
+                class_ids = tf.cast(detections[..., 4], tf.int32)
+                # [batch, instances, classes, height, width]
+                masks = tf.transpose(mrcnn_mask, [0, 1, 4, 2, 3])
+                masks = tf.gather(masks, class_ids, axis=2, batch_dims=2)
+                if mask_dtype == "uint8":
+                    return tf.cast(tf.round(masks * 255), tf.uint8)
+                return tf.cast(masks, mask_dtype)
+
+            masks = KL.Lambda(class_masks, name="serving_masks_" + mask_dtype)(
+                [detections, mrcnn_mask])
+            self._serving_models[mask_dtype] = KM.Model(
+                self.keras_model.inputs, [detections, masks],
+                name="mask_rcnn_serving_" + mask_dtype)
+        return self._serving_models[mask_dtype]
+
+    def inference_function(self, mask_dtype=None):
+        """Returns a callable that runs the serving graph on NumPy arrays.
+
+        The callable is built once, from the session that holds the model
+        weights, and takes (molded_images, image_metas, anchors) for one
+        batch of BATCH_SIZE images. It returns the outputs of
+        serving_model(mask_dtype) and skips the per call setup of
+        keras_model.predict().
         """
-        assert self.mode == "inference", "Create model in inference mode."
-        assert len(molded_images) == self.config.BATCH_SIZE,\
-            "Number of images must be equal to BATCH_SIZE"
-
-        if verbose:
-            log("Processing {} images".format(len(molded_images)))
-            for image in molded_images:
-                log("image", image)
-
-        # Validate image sizes
-        # All images in a batch MUST be of the same size
-        image_shape = molded_images[0].shape
-        for g in molded_images[1:]:
-            assert g.shape == image_shape, "Images must have the same size"
-
-        # Anchors
-        anchors = self.get_anchors(image_shape)
-        # Duplicate across the batch dimension because Keras requires it
-        # TODO: can this be optimized to avoid duplicating the anchors?
-        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
-
-        if verbose:
-            log("molded_images", molded_images)
-            log("image_metas", image_metas)
-            log("anchors", anchors)
-        # Run object detection
-        detections, _, _, mrcnn_mask, _, _, _ =\
-            self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
-        # Process detections
-        results = []
-        for i, image in enumerate(molded_images):
-            window = [0, 0, image.shape[0], image.shape[1]]
-            final_rois, final_class_ids, final_scores, final_masks =\
-                self.unmold_detections(detections[i], mrcnn_mask[i],
-                                       image.shape, molded_images[i].shape,
-                                       window)
-            results.append({
-                "rois": final_rois,
-                "class_ids": final_class_ids,
-                "scores": final_scores,
-                "masks": final_masks,
-            })
-        return results
-
-    def get_anchors(self, image_shape):
-        """Returns anchor pyramid for the given image size."""
-        backbone_shapes = compute_backbone_shapes(self.config, image_shape)
-        # Cache anchors and reuse if image shape is the same
-        if not hasattr(self, "_anchor_cache"):
-            self._anchor_cache = {}
-        if not tuple(image_shape) in self._anchor_cache:
-            # Generate Anchors
-            a = utils.generate_pyramid_anchors(
-                self.config.RPN_ANCHOR_SCALES,
-                self.config.RPN_ANCHOR_RATIOS,
-                backbone_shapes,
-                self.config.BACKBONE_STRIDES,
-                self.config.RPN_ANCHOR_STRIDE)
-            # Keep a copy of the latest anchors in pixel coordinates because
-            # it's used in inspect_model notebooks.
-            # TODO: Remove this after the notebook are refactored to not use it
-            self.anchors = a
-            # Normalize coordinates
-            self._anchor_cache[tuple(image_shape)] = utils.norm_boxes(a, image_shape[:2])
-        return self._anchor_cache[tuple(image_shape)]
+        mask_dtype = mask_dtype or self.config.INFERENCE_MASK_DTYPE
+        if not hasattr(self, "_inference_functions"):
+            self._inference_functions = {}
+        if mask_dtype not in self._inference_functions:
+            model = self.serving_model(mask_dtype)
+            session = tf.compat.v1.keras.backend.get_session()
+            self._inference_functions[mask_dtype] = session.make_callable(
+                model.outputs, feed_list=model.inputs)
+        return self._inference_functions[mask_dtype]
 
     def ancestor(self, tensor, name, checked=None):
         """Finds the ancestor of a TF tensor in the computation graph.
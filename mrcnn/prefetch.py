@@ -0,0 +1,163 @@
+"""
+Mask R-CNN
+Prefetching input pipeline for training.
+
+Batches of a DataGenerator are built by a pool of worker processes, ahead
+of the training loop, and handed back through shared memory instead of
+being pickled through a pipe. Batches are returned in order, and with a
+seeded generator batch i only depends on the seed and i, so a seeded run
+trains on the same batches whatever the number of workers.
+
+Usage:
+    generator = DataGenerator(dataset, config, seed=1)
+    with BatchPrefetcher(generator, workers=4, queue_size=10) as batches:
+        model.keras_model.fit(batches, steps_per_epoch=100,
+                              callbacks=[DataWaitLogger(batches)])
+"""
+
+import copy
+import time
+import itertools
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import tensorflow.keras as keras
+
+# Generator and shared memory batch slots of the worker processes
+_worker = {}
+
+
+def _init_worker(generator, slots):
+    import cv2
+    # Workers already run in parallel. OpenCV's thread pool can also
+    # deadlock in a forked process.
+    cv2.setNumThreads(0)
+    memory = [[shared_memory.SharedMemory(name) for name, _, _ in slot] for slot in slots]
+    _worker.update(generator=generator, memory=memory, slots=[
+        [np.ndarray(shape, dtype, buffer=m.buf) for m, (_, shape, dtype) in zip(ms, slot)]
+        for ms, slot in zip(memory, slots)])
+
+
+def _build_batch(index, slot):
+    """Builds batch index of the generator into a shared memory slot"""
+    inputs, outputs = _worker["generator"][index]
+    for view, array in zip(_worker["slots"][slot], inputs + outputs):
+        view[...] = array
+    return index, slot
+
+
+class BatchPrefetcher(object):
+    """An iterator over batches start, start + 1, ... of a DataGenerator,
+    built by worker processes up to queue_size batches ahead.
+
+    generator: DataGenerator, or a keras.utils.Sequence with the same
+        (inputs, outputs) batches of fixed shapes. Indices aren't wrapped
+        at len(generator). Unseeded DataGenerators get a random seed, so
+        the workers don't repeat each other's random choices.
+    workers: Number of worker processes. Defaults to the CPU count. 0 builds
+        each batch in this process when it's requested.
+    queue_size: Number of batches built ahead.
+    start: Index of the first batch, e.g. epoch * steps per epoch when
+        resuming training.
+
+    wait_times holds the seconds that each batch was waited for. Close the
+    prefetcher, or use it as a context manager, to stop the workers.
+    """
+
+    def __init__(self, generator, workers=None, queue_size=10, start=0):
+        if getattr(generator, "seed", 0) is None:
+            generator = copy.copy(generator)
+            generator.seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.generator = generator
+        self.workers = multiprocessing.cpu_count() if workers is None else workers
+        self.queue_size = max(1, queue_size)
+        self.index = start
+        self.wait_times = []
+        self._pool = None
+        self._memory = []
+        self._pending = collections.deque()
+
+    def _start(self, inputs, outputs):
+        """Allocates queue_size slots with the array shapes of a batch and
+        starts the workers on the batches after it.
+        """
+        arrays = inputs + outputs
+        self._input_count = len(inputs)
+        self._memory = [[shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+                         for a in arrays] for _ in range(self.queue_size)]
+        self._slots = [[np.ndarray(a.shape, a.dtype, buffer=m.buf) for m, a in zip(memory, arrays)]
+                       for memory in self._memory]
+        slots = [[(m.name, a.shape, a.dtype) for m, a in zip(memory, arrays)]
+                 for memory in self._memory]
+        self._pool = multiprocessing.Pool(self.workers, _init_worker, (self.generator, slots))
+        for slot in range(self.queue_size):
+            self._submit(self.index + 1 + slot, slot)
+
+    def _submit(self, index, slot):
+        self._pending.append(self._pool.apply_async(_build_batch, (index, slot)))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        if not self.workers or self._pool is None:
+            inputs, outputs = self.generator[self.index]
+            if self.workers:
+                # The first batch gives the shapes of the shared memory
+                self._start(inputs, outputs)
+        else:
+            index, slot = self._pending.popleft().get()
+            arrays = [np.array(view) for view in self._slots[slot]]
+            inputs, outputs = arrays[:self._input_count], arrays[self._input_count:]
+            self._submit(index + self.queue_size, slot)
+        self.wait_times.append(time.perf_counter() - start)
+        self.index += 1
+        return inputs, outputs
+
+    def close(self):
+        """Stops the workers and frees the shared memory"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._slots = []
+        for memory in itertools.chain.from_iterable(self._memory):
+            memory.close()
+            memory.unlink()
+        self._memory = []
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DataWaitLogger(keras.callbacks.Callback):
+    """Reports the time training waited for the data of a BatchPrefetcher.
+
+    Adds "data_wait" to the logs of each step and epoch, in milliseconds:
+    the wait of the last batch taken from the prefetcher, and the mean of
+    the epoch. Keras takes batches a few steps ahead of training on them,
+    so the wait shows up in the logs of an earlier step.
+    """
+
+    def __init__(self, prefetcher):
+        super(DataWaitLogger, self).__init__()
+        self.prefetcher = prefetcher
+        self._epoch_start = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = len(self.prefetcher.wait_times)
+
+    def on_train_batch_end(self, batch, logs=None):
+        if logs is not None and self.prefetcher.wait_times:
+            logs["data_wait"] = self.prefetcher.wait_times[-1] * 1000
+
+    def on_epoch_end(self, epoch, logs=None):
+        waits = self.prefetcher.wait_times[self._epoch_start:]
+        if logs is not None and waits:
+            logs["data_wait"] = float(np.mean(waits)) * 1000
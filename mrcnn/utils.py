@@ -15,9 +15,12 @@ import random
 import numpy as np
 import tensorflow as tf
 import scipy
+import scipy.sparse
+import cv2
 import skimage.color
 import skimage.io
 import skimage.transform
+import skimage.util
 import urllib.request
 import shutil
 import warnings
@@ -37,23 +40,19 @@ def extract_bboxes(mask):
 
     Returns: bbox array [num_instances, (y1, x1, y2, x2)].
     """
-    boxes = np.zeros([mask.shape[-1], 4], dtype=np.int32)
-    for i in range(mask.shape[-1]):
-        m = mask[:, :, i]
-        # Bounding box.
-        horizontal_indicies = np.where(np.any(m, axis=0))[0]
-        vertical_indicies = np.where(np.any(m, axis=1))[0]
-        if horizontal_indicies.shape[0]:
-            x1, x2 = horizontal_indicies[[0, -1]]
-            y1, y2 = vertical_indicies[[0, -1]]
-            # x2 and y2 should not be part of the box. Increment by 1.
-            x2 += 1
-            y2 += 1
-        else:
-            # No mask for this instance. Might happen due to
-            # resizing or cropping. Set bbox to zeros
-            x1, x2, y1, y2 = 0, 0, 0, 0
-        boxes[i] = np.array([y1, x1, y2, x2])
+    # Rows and columns of each instance that have mask pixels, from two
+    # reductions over the whole stack
+    horizontal = np.any(mask, axis=0)
+    vertical = np.any(mask, axis=1)
+    # First and last of them. x2 and y2 should not be part of the box.
+    x1 = np.argmax(horizontal, axis=0)
+    x2 = horizontal.shape[0] - np.argmax(horizontal[::-1], axis=0)
+    y1 = np.argmax(vertical, axis=0)
+    y2 = vertical.shape[0] - np.argmax(vertical[::-1], axis=0)
+    boxes = np.stack([y1, x1, y2, x2], axis=1)
+    # No mask for this instance. Might happen due to
+    # resizing or cropping. Set bbox to zeros
+    boxes[~np.any(horizontal, axis=0)] = 0
     return boxes.astype(np.int32)
 
 
@@ -78,82 +77,298 @@ def compute_iou(box, boxes, box_area, boxes_area):
     return iou
 
 
-def compute_overlaps(boxes1, boxes2):
+def compute_iou_pairs(boxes1, boxes2, area1, area2):
+    """Calculates the IoU of boxes1[i] with boxes2[i] for all i.
+    boxes1, boxes2: [..., (y1, x1, y2, x2)], broadcastable against each
+        other, e.g. [N, 4] and [N, 4], or [4] and [N, 4].
+    area1, area2: Areas of boxes1 and boxes2.
+
+    Computes the same values as compute_iou(). Pairs of boxes without area
+    have an IoU of NaN.
+    """
+    y1 = np.maximum(boxes1[..., 0], boxes2[..., 0])
+    y2 = np.minimum(boxes1[..., 2], boxes2[..., 2])
+    x1 = np.maximum(boxes1[..., 1], boxes2[..., 1])
+    x2 = np.minimum(boxes1[..., 3], boxes2[..., 3])
+    intersection = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    union = area1 + area2 - intersection
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return intersection / union
+
+
+def compute_overlaps(boxes1, boxes2, chunk_size=8192, dtype=np.float32, sparse=False,
+                     boxes1_area=None):
     """Computes IoU overlaps between two sets of boxes.
     boxes1, boxes2: [N, (y1, x1, y2, x2)].
+    chunk_size: Number of boxes1 rows computed at once. Bounds the memory
+        of the temporaries to two [chunk_size, boxes2 count] arrays.
+    dtype: Data type of the IoU computation and of the result.
+    sparse: If True, returns a scipy.sparse.csr_matrix that only stores
+        the pairs with IoU > 0. Anchors mostly don't overlap any GT box.
+    boxes1_area: Optional precomputed areas of boxes1, e.g. of anchors that
+        are matched against the GT boxes of every image.
 
     For better performance, pass the largest set first and the smaller second.
     """
+    boxes1 = np.asarray(boxes1, dtype=dtype)
+    boxes2 = np.asarray(boxes2, dtype=dtype)
     # Areas of anchors and GT boxes
-    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    if boxes1_area is None:
+        area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    else:
+        area1 = np.asarray(boxes1_area, dtype=dtype)
     area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
 
     # Compute overlaps to generate matrix [boxes1 count, boxes2 count]
-    # Each cell contains the IoU value.
-    overlaps = np.zeros((boxes1.shape[0], boxes2.shape[0]))
-    for i in range(overlaps.shape[1]):
-        box2 = boxes2[i]
-        overlaps[:, i] = compute_iou(box2, boxes1, area2[i], area1)
-    return overlaps
+    # Each cell contains the IoU value. Chunks are computed in place, into
+    # the result and one scratch array, to keep the temporaries in cache.
+    shape = (boxes1.shape[0], boxes2.shape[0])
+    chunk_size = max(min(chunk_size, shape[0]), 1)
+    overlaps = [] if sparse else np.empty(shape, dtype=dtype)
+    iou = np.empty((chunk_size, shape[1]), dtype=dtype)
+    scratch = np.empty((chunk_size, shape[1]), dtype=dtype)
+    for start in range(0, shape[0], chunk_size):
+        end = min(start + chunk_size, shape[0])
+        b1 = boxes1[start:end, np.newaxis]
+        out = iou[:end - start] if sparse else overlaps[start:end]
+        tmp = scratch[:end - start]
+        # Intersection height times width
+        np.minimum(b1[..., 2], boxes2[:, 2], out=out)
+        out -= np.maximum(b1[..., 0], boxes2[:, 0], out=tmp)
+        np.maximum(out, 0, out=out)
+        np.minimum(b1[..., 3], boxes2[:, 3], out=tmp)
+        tmp -= np.maximum(b1[..., 1], boxes2[:, 1])
+        np.maximum(tmp, 0, out=tmp)
+        out *= tmp
+        # Divided by the union
+        np.add(area1[start:end, np.newaxis], area2, out=tmp)
+        tmp -= out
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out /= tmp
+        if sparse:
+            rows, columns = np.nonzero(out > 0)
+            overlaps.append((rows + start, columns, out[rows, columns]))
+    if not sparse:
+        return overlaps
+    rows, columns, values = [np.concatenate(a) for a in zip(*overlaps)] if overlaps \
+        else (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, dtype))
+    return scipy.sparse.csr_matrix((values, (rows, columns)), shape=shape)
 
 
 def compute_overlaps_masks(masks1, masks2):
     """Computes IoU overlaps between two sets of masks.
     masks1, masks2: [Height, Width, instances]
+
+    Masks are cropped to their bounding boxes and bit-packed, so only
+    pairs with overlapping boxes are compared, 8 pixels per byte. Memory
+    is about the size of the box crops instead of the full size masks.
     """
     
     # If either set of masks is empty return empty result
     if masks1.shape[-1] == 0 or masks2.shape[-1] == 0:
         return np.zeros((masks1.shape[-1], masks2.shape[-1]))
-    # flatten masks and compute their areas
-    masks1 = np.reshape(masks1 > .5, (-1, masks1.shape[-1])).astype(np.float32)
-    masks2 = np.reshape(masks2 > .5, (-1, masks2.shape[-1])).astype(np.float32)
-    area1 = np.sum(masks1, axis=0)
-    area2 = np.sum(masks2, axis=0)
+    # Crop to the extent of the nonzero pixels, binarize and pack
+    packed = []
+    for masks in (masks1, masks2):
+        boxes = extract_bboxes(masks)
+        packed.append(_pack_masks(boxes, [masks[y1:y2, x1:x2, i] > .5
+                                          for i, (y1, x1, y2, x2) in enumerate(boxes)]))
+    return _packed_mask_overlaps(*packed).astype(np.float32)
+
+
+# Number of set bits of each byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
 
-    # intersections and union
-    intersections = np.dot(masks1.T, masks2)
-    union = area1[:, None] + area2[None, :] - intersections
-    overlaps = intersections / union
+def _pack_masks(boxes, masks):
+    """Bit-packs box-cropped masks along their rows. Bytes are aligned to
+    the image columns (byte k holds columns 8k to 8k + 7), so the bytes of
+    any two masks can be ANDed where their boxes overlap.
+    boxes: [N, (y1, x1, y2, x2)] in pixels.
+    masks: list of N bool arrays of shape [y2 - y1, x2 - x1].
 
+    Returns:
+    grid: [N, (y1, byte1, y2, byte2)] extent of each packed mask.
+    packed: list of N uint8 arrays of shape [y2 - y1, byte2 - byte1].
+    areas: [N] number of pixels in each mask.
+    """
+    grid = np.zeros((len(masks), 4), dtype=np.int64)
+    areas = np.zeros(len(masks), dtype=np.int64)
+    packed = []
+    for i, ((y1, x1, y2, x2), m) in enumerate(zip(boxes[:, :4].astype(np.int64), masks)):
+        p = np.packbits(np.pad(m, ((0, 0), (x1 % 8, 0))), axis=1)
+        grid[i] = y1, x1 // 8, y1 + p.shape[0], x1 // 8 + p.shape[1]
+        areas[i] = _POPCOUNT[p].sum()
+        packed.append(p)
+    return grid, packed, areas
+
+
+def _packed_mask_overlaps(packed1, packed2):
+    """Computes IoU overlaps between two sets of masks packed with
+    _pack_masks(). Only pairs whose extents overlap are intersected, and
+    only on the rows and bytes they share.
+    """
+    grid1, masks1, area1 = packed1
+    grid2, masks2, area2 = packed2
+    overlaps = np.zeros((len(masks1), len(masks2)))
+    y1 = np.maximum(grid1[:, None, 0], grid2[None, :, 0])
+    b1 = np.maximum(grid1[:, None, 1], grid2[None, :, 1])
+    y2 = np.minimum(grid1[:, None, 2], grid2[None, :, 2])
+    b2 = np.minimum(grid1[:, None, 3], grid2[None, :, 3])
+    for i, j in zip(*np.where((y2 > y1) & (b2 > b1))):
+        a = masks1[i][y1[i, j] - grid1[i, 0]:y2[i, j] - grid1[i, 0],
+                      b1[i, j] - grid1[i, 1]:b2[i, j] - grid1[i, 1]]
+        b = masks2[j][y1[i, j] - grid2[j, 0]:y2[i, j] - grid2[j, 0],
+                      b1[i, j] - grid2[j, 1]:b2[i, j] - grid2[j, 1]]
+        intersection = _POPCOUNT[a & b].sum()
+        union = area1[i] + area2[j] - intersection
+        overlaps[i, j] = intersection / union if union > 0 else 0
     return overlaps
 
 
-def non_max_suppression(boxes, scores, threshold):
+def _blocked_non_max_suppression(boxes, threshold, block_size, max_pairs):
+    """Greedy NMS of boxes already sorted by score, highest first.
+    Returns the sorted indices of the kept boxes. See non_max_suppression().
+    """
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    # Boxes of later blocks that are not removed yet, sorted by y1. A box
+    # can only overlap the boxes whose y1 is between its own y1 minus the
+    # tallest box height and its y2.
+    by_y1 = np.argsort(boxes[:, 0], kind="stable")
+    max_height = np.max(boxes[:, 2] - boxes[:, 0]) if threshold >= 0 else np.inf
+
+    def suppressed(rows, columns):
+        """Which row, column pairs have IoU over the threshold"""
+        return compute_iou_pairs(boxes[rows], boxes[columns], area[rows], area[columns]) > threshold
+
+    count = boxes.shape[0]
+    removed = np.zeros(count, dtype=bool)
+    pick = []
+    for start in range(0, count, block_size):
+        end = min(start + block_size, count)
+        block = np.flatnonzero(~removed[start:end]) + start
+        if not block.size:
+            continue
+        # Suppression mask of the block and greedy picks on it
+        rows, columns = np.repeat(block, block.size), np.tile(block, block.size)
+        mask = suppressed(rows, columns).reshape(block.size, block.size)
+        is_suppressed = np.zeros(block.size, dtype=bool)
+        kept = []
+        for k in range(block.size):
+            if not is_suppressed[k]:
+                kept.append(k)
+                is_suppressed |= mask[k]
+        kept = block[kept]
+        pick.append(kept)
+
+        # Kept boxes suppress the boxes of later blocks that they overlap
+        by_y1 = by_y1[(by_y1 >= end) & ~removed[by_y1]]
+        y1_sorted = boxes[by_y1, 0]
+        lo = np.searchsorted(y1_sorted, boxes[kept, 0] - max_height, side="right")
+        hi = np.searchsorted(y1_sorted, boxes[kept, 2], side="left")
+        lengths = np.maximum(hi - lo, 0)
+        # Split the kept boxes into groups of at most max_pairs pairs
+        group = np.cumsum(lengths) // max_pairs
+        for g in np.unique(group):
+            members = group == g
+            rows = np.repeat(kept[members], lengths[members])
+            offsets = np.cumsum(lengths[members]) - lengths[members]
+            columns = by_y1[np.arange(rows.size) - np.repeat(offsets - lo[members], lengths[members])]
+            removed[columns[suppressed(rows, columns)]] = True
+    return np.concatenate(pick)
+
+
+def non_max_suppression(boxes, scores, threshold, class_ids=None,
+                        block_size=256, max_pairs=1 << 22):
     """Performs non-maximum suppression and returns indices of kept boxes.
     boxes: [N, (y1, x1, y2, x2)]. Notice that (y2, x2) lays outside the box.
     scores: 1-D array of box scores.
     threshold: Float. IoU threshold to use for filtering.
+    class_ids: Optional 1-D array of box classes. If given, boxes only
+        suppress boxes of the same class, so one call does the NMS of all
+        classes.
+    block_size: Number of boxes, in score order, resolved at once.
+    max_pairs: Largest number of box pairs compared at once. Bounds memory.
+
+    The boxes are visited in blocks, highest scores first. Within a block
+    the IoU matrix is computed once and the greedy picks are made on its
+    suppression mask. The boxes kept in a block then suppress the later
+    boxes in one pass, comparing them only with the boxes that can
+    overlap them vertically. The picks are the same, and in the same
+    order, as picking one box at a time.
+
+    For Soft-NMS, see soft_non_max_suppression().
     """
     assert boxes.shape[0] > 0
     if boxes.dtype.kind != "f":
         boxes = boxes.astype(np.float32)
 
-    # Compute box areas
-    y1 = boxes[:, 0]
-    x1 = boxes[:, 1]
-    y2 = boxes[:, 2]
-    x2 = boxes[:, 3]
-    area = (y2 - y1) * (x2 - x1)
-
-    # Get indicies of boxes sorted by scores (highest first)
+    # Sort by score, highest first
     ixs = scores.argsort()[::-1]
+    boxes = boxes[ixs]
+    if class_ids is None:
+        keep = _blocked_non_max_suppression(boxes, threshold, block_size, max_pairs)
+    else:
+        # Classes don't interact, so each is suppressed on its own and the
+        # picks are merged back into score order
+        class_ids = np.asarray(class_ids)[ixs]
+        keep = []
+        for class_id in np.unique(class_ids):
+            members = np.flatnonzero(class_ids == class_id)
+            keep.append(members[_blocked_non_max_suppression(
+                boxes[members], threshold, block_size, max_pairs)])
+        keep = np.sort(np.concatenate(keep))
+    return ixs[keep].astype(np.int32)
+
+
+def soft_non_max_suppression(boxes, scores, threshold=0.3, sigma=0.5,
+                             score_threshold=0.001, method="gaussian",
+                             class_ids=None):
+    """Soft-NMS (Bodla et al., 2017): instead of removing the boxes that
+    overlap a picked box, lower their scores by their IoU with it.
+    boxes: [N, (y1, x1, y2, x2)]. Notice that (y2, x2) lays outside the box.
+    scores: 1-D array of box scores.
+    threshold: For the "linear" method, IoU above which scores are lowered.
+    sigma: For the "gaussian" method, scores are multiplied by
+        exp(-IoU^2 / sigma).
+    score_threshold: Boxes whose score falls below this are dropped.
+    method: "gaussian" or "linear"
+    class_ids: Optional 1-D array of box classes. If given, boxes only
+        lower the scores of boxes of the same class.
 
+    Returns:
+    pick: Indices of kept boxes, in the order they were picked
+    scores: The lowered scores of the kept boxes
+    """
+    assert method in ("gaussian", "linear"), "Unknown method: {}".format(method)
+    if boxes.dtype.kind != "f":
+        boxes = boxes.astype(np.float32)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    scores = np.array(scores, dtype=np.float32)
+    if class_ids is not None:
+        class_ids = np.asarray(class_ids)
+
+    alive = np.flatnonzero(scores >= score_threshold)
     pick = []
-    while len(ixs) > 0:
-        # Pick top box and add its index to the list
-        i = ixs[0]
+    picked_scores = []
+    while alive.size:
+        i = alive[scores[alive].argmax()]
         pick.append(i)
-        # Compute IoU of the picked box with the rest
-        iou = compute_iou(boxes[i], boxes[ixs[1:]], area[i], area[ixs[1:]])
-        # Identify boxes with IoU over the threshold. This
-        # returns indices into ixs[1:], so add 1 to get
-        # indices into ixs.
-        remove_ixs = np.where(iou > threshold)[0] + 1
-        # Remove indices of the picked and overlapped boxes.
-        ixs = np.delete(ixs, remove_ixs)
-        ixs = np.delete(ixs, 0)
-    return np.array(pick, dtype=np.int32)
+        picked_scores.append(scores[i])
+        alive = alive[alive != i]
+        iou = compute_iou_pairs(boxes[i], boxes[alive], area[i], area[alive])
+        # Boxes without area don't overlap anything
+        iou[np.isnan(iou)] = 0
+        if class_ids is not None:
+            iou[class_ids[alive] != class_ids[i]] = 0
+        if method == "linear":
+            weight = np.where(iou > threshold, 1 - iou, 1)
+        else:
+            weight = np.exp(-(iou * iou) / sigma)
+        scores[alive] *= weight
+        alive = alive[scores[alive] >= score_threshold]
+    return np.array(pick, dtype=np.int32), np.array(picked_scores, dtype=np.float32)
 
 
 def apply_box_deltas(boxes, deltas):
@@ -385,7 +600,8 @@ class Dataset(object):
         return mask, class_ids
 
 
-def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square"):
+def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square",
+                 backend="skimage"):
     """Resizes an image keeping the aspect ratio unchanged.
 
     min_dim: if provided, resizes the image such that it's smaller
@@ -407,6 +623,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
               on min_dim and min_scale, then picks a random crop of
               size min_dim x min_dim. Can be used in training only.
               max_dim is not used in this mode.
+    backend: "skimage" or "opencv". See resize().
 
     Returns:
     image: the resized image
@@ -444,9 +661,13 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
             scale = max_dim / image_max
 
     # Resize image using bilinear interpolation
-    if scale != 1:
+    if scale != 1 and backend == "opencv":
+        # Resize in the image dtype. It's faster and rounds instead of
+        # truncating the float result.
+        image = _cv2_resize(image, (round(h * scale), round(w * scale)), cv2.INTER_LINEAR)
+    elif scale != 1:
         image = resize(image, (round(h * scale), round(w * scale)),
-                       preserve_range=True)
+                       preserve_range=True, backend=backend)
 
     # Need padding or cropping?
     if mode == "square":
@@ -493,7 +714,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
     return image.astype(image_dtype), window, scale, padding, crop
 
 
-def resize_mask(mask, scale, padding, crop=None):
+def resize_mask(mask, scale, padding, crop=None, backend="skimage"):
     """Resizes a mask using the given scale and padding.
     Typically, you get the scale and padding from resize_image() to
     ensure both, the image and the mask, are resized consistently.
@@ -501,12 +722,24 @@ def resize_mask(mask, scale, padding, crop=None):
     scale: mask scaling factor
     padding: Padding to add to the mask in the form
             [(top, bottom), (left, right), (0, 0)]
+    backend: "skimage" resizes with scipy.ndimage.zoom(), "opencv" with
+        cv2.resize(), 512 instances at a time. OpenCV samples the pixel
+        nearest to each output pixel center, which zoom() only
+        approximates, so instance edges can move by a pixel.
     """
-    # Suppress warning from scipy 0.13.0, the output shape of zoom() is
-    # calculated with round() instead of int()
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        mask = scipy.ndimage.zoom(mask, zoom=[scale, scale, 1], order=0)
+    if backend == "opencv":
+        if scale != 1:
+            h, w = mask.shape[:2]
+            mask = _cv2_resize(mask, (round(h * scale), round(w * scale)),
+                               cv2.INTER_NEAREST_EXACT)
+    elif backend == "skimage":
+        # Suppress warning from scipy 0.13.0, the output shape of zoom() is
+        # calculated with round() instead of int()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            mask = scipy.ndimage.zoom(mask, zoom=[scale, scale, 1], order=0)
+    else:
+        raise ValueError("Unknown resize backend: {}".format(backend))
     if crop is not None:
         y, x, h, w = crop
         mask = mask[y:y + h, x:x + w]
@@ -515,41 +748,102 @@ def resize_mask(mask, scale, padding, crop=None):
     return mask
 
 
+def _linear_zoom(k, in_size, out_size):
+    """Source pixels and weights of output pixels k when resizing from
+    in_size to out_size with resize(), i.e. scipy.ndimage.zoom() with
+    order=1 and grid_mode=True. The arithmetic is the same, so the results
+    are too, to the last bit.
+
+    Returns lo, the first of the two source pixels, and their weights.
+    """
+    coord = (k + 0.5) * (in_size / out_size) - 0.5
+    lo = np.floor(coord)
+    w_hi = coord - lo
+    return lo.astype(np.int64), 1.0 - w_hi, w_hi
+
+
 def minimize_mask(bbox, mask, mini_shape):
     """Resize masks to a smaller version to reduce memory load.
     Mini-masks can be resized back to image scale using expand_masks()
 
+    All masks are resized at once, bilinearly like resize(): the two by two
+    source pixels of every mini-mask pixel are gathered straight from the
+    full size masks, without cropping them.
+
     See inspect_data.ipynb notebook for more details.
     """
-    mini_mask = np.zeros(mini_shape + (mask.shape[-1],), dtype=bool)
-    for i in range(mask.shape[-1]):
-        # Pick slice and cast to bool in case load_mask() returned wrong dtype
-        m = mask[:, :, i].astype(bool)
-        y1, x1, y2, x2 = bbox[i][:4]
-        m = m[y1:y2, x1:x2]
-        if m.size == 0:
-            raise Exception("Invalid bounding box with area of zero")
-        # Resize with bilinear interpolation
-        m = resize(m, mini_shape)
-        mini_mask[:, :, i] = np.around(m).astype(np.bool)
-    return mini_mask
+    bbox = np.asarray(bbox)[:, :4].astype(np.int64)
+    y1, x1, y2, x2 = bbox.T
+    heights, widths = y2 - y1, x2 - x1
+    if np.any((heights <= 0) | (widths <= 0)):
+        raise Exception("Invalid bounding box with area of zero")
+    count = mask.shape[-1]
+    rows, *row_weights = _linear_zoom(np.arange(mini_shape[0]), heights[:, None], mini_shape[0])
+    cols, *col_weights = _linear_zoom(np.arange(mini_shape[1]), widths[:, None], mini_shape[1])
+    # Gather with flat indices, which is faster than indexing three axes
+    height, width = mask.shape[:2]
+    flat = np.ravel(mask)
+    instances = np.arange(count)[:, None, None]
+
+    # Sum the weighted source pixels in the order scipy.ndimage does.
+    # Pixels outside the box read as zeros (mode="constant").
+    values = np.zeros((count,) + tuple(mini_shape))
+    full = np.ones(count, dtype=bool)
+    for dy, wy in enumerate(row_weights):
+        y = rows + dy
+        y_in = (y >= 0) & (y < heights[:, None])
+        y = np.clip(y + y1[:, None], 0, height - 1)
+        for dx, wx in enumerate(col_weights):
+            x = cols + dx
+            x_in = (x >= 0) & (x < widths[:, None])
+            x = np.clip(x + x1[:, None], 0, width - 1)
+            inside = y_in[:, :, None] & x_in[:, None, :]
+            # Cast to bool in case load_mask() returned wrong dtype
+            m = flat.take((y[:, :, None] * width + x[:, None, :]) * count + instances) != 0
+            full &= np.all(m | ~inside, axis=(1, 2))
+            values += (m & inside) * wy[:, :, None] * wx[:, None, :]
+    # resize() clips to the value range of the crop, so masks that fill
+    # their box stay full. Sampled pixels are only a hint for which do.
+    values[[i for i in np.flatnonzero(full)
+            if mask[y1[i]:y2[i], x1[i]:x2[i], i].all()]] = 1
+    # Round like np.around()
+    return np.moveaxis(values > 0.5, 0, -1)
 
 
 def expand_mask(bbox, mini_mask, image_shape):
     """Resizes mini masks back to image size. Reverses the change
     of minimize_mask().
 
+    Each mask is resized bilinearly like resize(), as two gathers of its
+    source rows and columns, and written into its box.
+
     See inspect_data.ipynb notebook for more details.
     """
+    bbox = np.asarray(bbox)[:, :4].astype(np.int64)
     mask = np.zeros(image_shape[:2] + (mini_mask.shape[-1],), dtype=bool)
-    for i in range(mask.shape[-1]):
-        m = mini_mask[:, :, i]
-        y1, x1, y2, x2 = bbox[i][:4]
-        h = y2 - y1
-        w = x2 - x1
-        # Resize with bilinear interpolation
-        m = resize(m, (h, w))
-        mask[y1:y2, x1:x2, i] = np.around(m).astype(np.bool)
+    mh, mw = mini_mask.shape[:2]
+    # Pad with zeros, which pixels outside the mini mask read as
+    padded = np.pad(mini_mask.astype(np.float64), ((1, 1), (1, 1), (0, 0)))
+    low, high = mini_mask.min(axis=(0, 1)), mini_mask.max(axis=(0, 1))
+    for i, (y1, x1, y2, x2) in enumerate(bbox):
+        h, w = y2 - y1, x2 - x1
+        if h <= 0 or w <= 0:
+            continue
+        rows, wy0, wy1 = _linear_zoom(np.arange(h), mh, h)
+        cols, wx0, wx1 = _linear_zoom(np.arange(w), mw, w)
+        m = padded[:, :, i]
+        # Rows weighted first, then columns, summed in the order of
+        # scipy.ndimage
+        r0 = m[rows + 1] * wy0[:, None]
+        r1 = m[rows + 2] * wy1[:, None]
+        values = r0[:, cols + 1] * wx0
+        values += r0[:, cols + 2] * wx1
+        values += r1[:, cols + 1] * wx0
+        values += r1[:, cols + 2] * wx1
+        # resize() clips to the value range of the mini mask
+        np.clip(values, low[i], high[i], out=values)
+        # Round like np.around()
+        mask[y1:y2, x1:x2, i] = values > 0.5
     return mask
 
 
@@ -566,17 +860,164 @@ def unmold_mask(mask, bbox, image_shape):
 
     Returns a binary mask with the same size as the original image.
     """
-    threshold = 0.5
     y1, x1, y2, x2 = bbox
-    mask = resize(mask, (y2 - y1, x2 - x1))
-    mask = np.where(mask >= threshold, 1, 0).astype(np.bool)
+    mask = unmold_mask_crop(mask, bbox)
 
     # Put the mask in the right location.
-    full_mask = np.zeros(image_shape[:2], dtype=np.bool)
+    full_mask = np.zeros(image_shape[:2], dtype=bool)
     full_mask[y1:y2, x1:x2] = mask
     return full_mask
 
 
+def unmold_mask_crop(mask, bbox):
+    """Like unmold_mask(), but returns only the part of the mask that's
+    inside the bounding box instead of pasting it into a full size image.
+    mask: [height, width] of type float. A small, typically 28x28 mask.
+    bbox: [y1, x1, y2, x2]. The box to fit the mask in.
+
+    Returns a binary mask of shape [y2 - y1, x2 - x1].
+    """
+    return unmold_masks(mask[np.newaxis], np.array([bbox]), sparse=True)[0]
+
+
+def _interpolation_weights(sizes, in_size):
+    """Builds bilinear interpolation matrices that resize a 1D signal of
+    length in_size to each of the given sizes. Matches resize() with its
+    default arguments: pixel centers are aligned and samples outside the
+    input blend with zeros (mode="constant").
+
+    sizes: [N] int. Output lengths.
+
+    Returns a float32 array [sum(sizes), in_size]. Rows of output i are
+    at [sum(sizes[:i]), sum(sizes[:i + 1])).
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    owner = np.repeat(np.arange(sizes.shape[0]), sizes)
+    ix = np.arange(owner.shape[0]) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    # Source coordinate of each output pixel
+    coord = (ix + 0.5) * (in_size / sizes[owner]) - 0.5
+    lo = np.floor(coord).astype(np.int64)
+    w_hi = (coord - lo).astype(np.float32)
+    rows = np.arange(owner.shape[0])
+    weights = np.zeros((owner.shape[0], in_size + 2), dtype=np.float32)
+    # Shift by one so that neighbours at -1 and in_size land in the
+    # border columns, which are then dropped (i.e. they read as zeros).
+    weights[rows, lo + 1] = 1 - w_hi
+    weights[rows, lo + 2] += w_hi
+    return weights[:, 1:-1]
+
+
+def unmold_masks(masks, boxes, image_shape=None, sparse=False, threshold=0.5):
+    """Batched version of unmold_mask(). Resizes all masks to their boxes and
+    pastes them into a single preallocated array.
+
+    The interpolation weights of all boxes are computed at once, then each
+    mask is resized with two small float32 matrix products and thresholded
+    straight into the output, without full size temporaries.
+
+    masks: [N, height, width] of type float. Small, typically 28x28 masks.
+    boxes: [N, (y1, x1, y2, x2)]. The boxes to fit the masks in.
+    image_shape: [height, width, ...] of the original image. Only needed
+        when sparse is False.
+    sparse: If True, return a list of N masks cropped to their boxes instead
+        of full size masks. See dense_to_sparse_masks().
+    threshold: Mask probability at which a pixel is part of the instance.
+
+    Returns a bool array [height, width, N], or a list if sparse is True.
+    """
+    boxes = np.asarray(boxes)[:, :4].astype(np.int64)
+    masks = np.asarray(masks, dtype=np.float32)
+    N, mh, mw = masks.shape
+    heights = boxes[:, 2] - boxes[:, 0]
+    widths = boxes[:, 3] - boxes[:, 1]
+    row_weights = _interpolation_weights(heights, mh)
+    col_weights = _interpolation_weights(widths, mw)
+    row_starts = np.cumsum(heights) - heights
+    col_starts = np.cumsum(widths) - widths
+
+    if sparse:
+        crops = []
+    else:
+        full_masks = np.zeros(tuple(image_shape[:2]) + (N,), dtype=bool)
+    for i in range(N):
+        ay = row_weights[row_starts[i]:row_starts[i] + heights[i]]
+        ax = col_weights[col_starts[i]:col_starts[i] + widths[i]]
+        m = (ay @ masks[i] @ ax.T) >= threshold
+        if sparse:
+            crops.append(m)
+        else:
+            y1, x1, y2, x2 = boxes[i]
+            full_masks[y1:y2, x1:x2, i] = m
+    return crops if sparse else full_masks
+
+
+############################################################
+#  Sparse Masks
+############################################################
+
+# Full-size [height, width, N] masks are mostly zeros. The sparse form keeps
+# only the part of each mask that's inside its bounding box: a list of N
+# bool arrays, where masks[i] has shape [y2 - y1, x2 - x1] of boxes[i]. Memory
+# then depends on the instance areas rather than on the image size.
+
+def is_sparse_masks(masks):
+    """Returns True if masks are in the sparse (list of box crops) form."""
+    return isinstance(masks, (list, tuple))
+
+
+def dense_to_sparse_masks(boxes, masks):
+    """Crops full size masks to their bounding boxes.
+    boxes: [N, (y1, x1, y2, x2)] in pixels.
+    masks: [height, width, N]
+
+    Returns a list of N bool arrays of shape [y2 - y1, x2 - x1].
+    """
+    if is_sparse_masks(masks):
+        return list(masks)
+    return [masks[y1:y2, x1:x2, i].astype(bool)
+            for i, (y1, x1, y2, x2) in enumerate(boxes[:, :4].astype(np.int32))]
+
+
+def sparse_to_dense_masks(boxes, masks, image_shape):
+    """Pastes box-cropped masks into a full size mask array.
+    boxes: [N, (y1, x1, y2, x2)] in pixels.
+    masks: list of N bool arrays of shape [y2 - y1, x2 - x1].
+    image_shape: [height, width, ...]
+
+    Returns a bool array of shape [height, width, N].
+    """
+    if not is_sparse_masks(masks):
+        return masks
+    full_masks = np.zeros(tuple(image_shape[:2]) + (len(masks),), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(boxes[:, :4].astype(np.int32)):
+        full_masks[y1:y2, x1:x2, i] = masks[i]
+    return full_masks
+
+
+def select_masks(masks, ix):
+    """Picks instances from either mask form. Equivalent to masks[..., ix]
+    for full size masks.
+    ix: a slice or a 1D array of instance indices.
+    """
+    if not is_sparse_masks(masks):
+        return masks[..., ix]
+    if isinstance(ix, slice):
+        return list(masks[ix])
+    return [masks[i] for i in ix]
+
+
+def compute_overlaps_sparse_masks(boxes1, masks1, boxes2, masks2):
+    """Computes IoU overlaps between two sets of sparse masks. Only pairs
+    with overlapping boxes are compared, and only inside the box overlap.
+    boxes1, boxes2: [N, (y1, x1, y2, x2)] in pixels.
+    masks1, masks2: lists of box-cropped bool masks. See dense_to_sparse_masks()
+    """
+    if not len(masks1) or not len(masks2):
+        return np.zeros((len(masks1), len(masks2)))
+    return _packed_mask_overlaps(_pack_masks(boxes1, [m.astype(bool, copy=False) for m in masks1]),
+                                 _pack_masks(boxes2, [m.astype(bool, copy=False) for m in masks2]))
+
+
 ############################################################
 #  Anchors
 ############################################################
@@ -659,6 +1100,10 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
                     iou_threshold=0.5, score_threshold=0.0):
     """Finds matches between prediction and ground truth instances.
 
+    gt_masks, pred_masks: Either [height, width, instances] or the sparse
+        form (see dense_to_sparse_masks()). If either one is sparse, the
+        overlaps are computed on box crops only.
+
     Returns:
         gt_match: 1-D array. For each GT box it has the index of the matched
                   predicted box.
@@ -666,10 +1111,32 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
                     the matched ground truth box.
         overlaps: [pred_boxes, gt_boxes] IoU overlaps.
     """
+    gt_match, pred_match, overlaps, _ = compute_matches_range(
+        gt_boxes, gt_class_ids, gt_masks,
+        pred_boxes, pred_class_ids, pred_scores, pred_masks,
+        [iou_threshold], score_threshold)
+    return gt_match[0], pred_match[0], overlaps
+
+
+def compute_matches_range(gt_boxes, gt_class_ids, gt_masks,
+                          pred_boxes, pred_class_ids, pred_scores, pred_masks,
+                          iou_thresholds, score_threshold=0.0):
+    """Like compute_matches(), but matches at several IoU thresholds from
+    one computation of the overlaps.
+
+    Returns:
+        gt_match: [thresholds, gt boxes] index of the matched predicted box
+            at each threshold, or -1.
+        pred_match: [thresholds, pred boxes] index of the matched GT box at
+            each threshold, or -1. Predictions are sorted by score.
+        overlaps: [pred_boxes, gt_boxes] IoU overlaps.
+        indices: Indices of the predictions in score order.
+    """
     # Trim zero padding
     # TODO: cleaner to do zero unpadding upstream
     gt_boxes = trim_zeros(gt_boxes)
-    gt_masks = gt_masks[..., :gt_boxes.shape[0]]
+    gt_masks = select_masks(gt_masks, slice(0, gt_boxes.shape[0]))
+    gt_class_ids = gt_class_ids[:gt_boxes.shape[0]]
     pred_boxes = trim_zeros(pred_boxes)
     pred_scores = pred_scores[:pred_boxes.shape[0]]
     # Sort predictions by score from high to low
@@ -677,62 +1144,58 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
     pred_boxes = pred_boxes[indices]
     pred_class_ids = pred_class_ids[indices]
     pred_scores = pred_scores[indices]
-    pred_masks = pred_masks[..., indices]
+    pred_masks = select_masks(pred_masks, indices)
 
     # Compute IoU overlaps [pred_masks, gt_masks]
-    overlaps = compute_overlaps_masks(pred_masks, gt_masks)
-
-    # Loop through predictions and find matching ground truth boxes
-    match_count = 0
-    pred_match = -1 * np.ones([pred_boxes.shape[0]])
-    gt_match = -1 * np.ones([gt_boxes.shape[0]])
+    if is_sparse_masks(pred_masks) or is_sparse_masks(gt_masks):
+        overlaps = compute_overlaps_sparse_masks(
+            pred_boxes, dense_to_sparse_masks(pred_boxes, pred_masks),
+            gt_boxes, dense_to_sparse_masks(gt_boxes, gt_masks))
+    else:
+        overlaps = compute_overlaps_masks(pred_masks, gt_masks)
+
+    # Loop through predictions and find matching ground truth boxes, at
+    # all thresholds at once
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+    pred_match = -1 * np.ones([len(iou_thresholds), pred_boxes.shape[0]])
+    gt_match = -1 * np.ones([len(iou_thresholds), gt_boxes.shape[0]])
+    thresholds = np.arange(len(iou_thresholds))
     for i in range(len(pred_boxes)):
-        # Find best matching ground truth box
-        # 1. Sort matches by score
+        # Ground truth boxes by IoU from high to low, without low scores,
+        # and only those of the same class can match
         sorted_ixs = np.argsort(overlaps[i])[::-1]
-        # 2. Remove low scores
         low_score_idx = np.where(overlaps[i, sorted_ixs] < score_threshold)[0]
         if low_score_idx.size > 0:
             sorted_ixs = sorted_ixs[:low_score_idx[0]]
-        # 3. Find the match
-        for j in sorted_ixs:
-            # If ground truth box is already matched, go to next one
-            if gt_match[j] > -1:
-                continue
-            # If we reach IoU smaller than the threshold, end the loop
-            iou = overlaps[i, j]
-            if iou < iou_threshold:
-                break
-            # Do we have a match?
-            if pred_class_ids[i] == gt_class_ids[j]:
-                match_count += 1
-                gt_match[j] = i
-                pred_match[i] = j
-                break
-
-    return gt_match, pred_match, overlaps
-
-
-def compute_ap(gt_boxes, gt_class_ids, gt_masks,
-               pred_boxes, pred_class_ids, pred_scores, pred_masks,
-               iou_threshold=0.5):
-    """Compute Average Precision at a set IoU threshold (default 0.5).
+        sorted_ixs = sorted_ixs[gt_class_ids[sorted_ixs] == pred_class_ids[i]]
+        # The first one that isn't matched yet, if its IoU is high enough
+        candidates = (gt_match[:, sorted_ixs] == -1) & \
+            (overlaps[i, sorted_ixs] >= iou_thresholds[:, None])
+        found = thresholds[np.any(candidates, axis=1)]
+        if not found.size:
+            continue
+        j = sorted_ixs[np.argmax(candidates[found], axis=1)]
+        gt_match[found, j] = i
+        pred_match[found, i] = j
+
+    return gt_match, pred_match, overlaps, indices
+
+
+def compute_ap_from_matches(pred_match, gt_count):
+    """Computes Average Precision from the matches of predictions sorted by
+    score from high to low.
+    pred_match: 1-D array. For each prediction, the index of the matched
+        GT box or -1.
+    gt_count: Number of GT boxes.
 
     Returns:
     mAP: Mean Average Precision
     precisions: List of precisions at different class score thresholds.
     recalls: List of recall values at different class score thresholds.
-    overlaps: [pred_boxes, gt_boxes] IoU overlaps.
     """
-    # Get matches and overlaps
-    gt_match, pred_match, overlaps = compute_matches(
-        gt_boxes, gt_class_ids, gt_masks,
-        pred_boxes, pred_class_ids, pred_scores, pred_masks,
-        iou_threshold)
-
     # Compute precision and recall at each prediction box step
     precisions = np.cumsum(pred_match > -1) / (np.arange(len(pred_match)) + 1)
-    recalls = np.cumsum(pred_match > -1).astype(np.float32) / len(gt_match)
+    recalls = np.cumsum(pred_match > -1).astype(np.float32) / gt_count
 
     # Pad with start and end values to simplify the math
     precisions = np.concatenate([[0], precisions, [0]])
@@ -741,31 +1204,52 @@ def compute_ap(gt_boxes, gt_class_ids, gt_masks,
     # Ensure precision values decrease but don't increase. This way, the
     # precision value at each recall threshold is the maximum it can be
     # for all following recall thresholds, as specified by the VOC paper.
-    for i in range(len(precisions) - 2, -1, -1):
-        precisions[i] = np.maximum(precisions[i], precisions[i + 1])
+    precisions = np.maximum.accumulate(precisions[::-1])[::-1]
 
     # Compute mean AP over recall range
     indices = np.where(recalls[:-1] != recalls[1:])[0] + 1
     mAP = np.sum((recalls[indices] - recalls[indices - 1]) *
                  precisions[indices])
 
+    return mAP, precisions, recalls
+
+
+def compute_ap(gt_boxes, gt_class_ids, gt_masks,
+               pred_boxes, pred_class_ids, pred_scores, pred_masks,
+               iou_threshold=0.5):
+    """Compute Average Precision at a set IoU threshold (default 0.5).
+
+    Returns:
+    mAP: Mean Average Precision
+    precisions: List of precisions at different class score thresholds.
+    recalls: List of recall values at different class score thresholds.
+    overlaps: [pred_boxes, gt_boxes] IoU overlaps.
+    """
+    # Get matches and overlaps
+    gt_match, pred_match, overlaps = compute_matches(
+        gt_boxes, gt_class_ids, gt_masks,
+        pred_boxes, pred_class_ids, pred_scores, pred_masks,
+        iou_threshold)
+    mAP, precisions, recalls = compute_ap_from_matches(pred_match, len(gt_match))
     return mAP, precisions, recalls, overlaps
 
 
 def compute_ap_range(gt_box, gt_class_id, gt_mask,
                      pred_box, pred_class_id, pred_score, pred_mask,
                      iou_thresholds=None, verbose=1):
-    """Compute AP over a range or IoU thresholds. Default range is 0.5-0.95."""
+    """Compute AP over a range or IoU thresholds. Default range is 0.5-0.95.
+    The overlaps are computed once and matched at all thresholds.
+    """
     # Default is 0.5 to 0.95 with increments of 0.05
     iou_thresholds = iou_thresholds or np.arange(0.5, 1.0, 0.05)
     
     # Compute AP over range of IoU thresholds
+    gt_match, pred_match, _, _ = compute_matches_range(
+        gt_box, gt_class_id, gt_mask,
+        pred_box, pred_class_id, pred_score, pred_mask, iou_thresholds)
     AP = []
-    for iou_threshold in iou_thresholds:
-        ap, precisions, recalls, overlaps =\
-            compute_ap(gt_box, gt_class_id, gt_mask,
-                        pred_box, pred_class_id, pred_score, pred_mask,
-                        iou_threshold=iou_threshold)
+    for iou_threshold, matches in zip(iou_thresholds, pred_match):
+        ap = compute_ap_from_matches(matches, gt_match.shape[1])[0]
         if verbose:
             print("AP @{:.2f}:\t {:.3f}".format(iou_threshold, ap))
         AP.append(ap)
@@ -851,6 +1335,34 @@ def download_trained_weights(coco_model_path, verbose=1):
         print("... done downloading pretrained model!")
 
 
+def update_hash(digest, value):
+    """Feeds a canonical form of value to a hashlib digest, so the hash
+    only depends on the contents, not on the Python or NumPy version or on
+    dict order. Supports dicts, lists, tuples, NumPy arrays and scalars,
+    strings, bytes and None.
+    """
+    if isinstance(value, dict):
+        digest.update(b"d%d" % len(value))
+        for key in sorted(value, key=repr):
+            update_hash(digest, key)
+            update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"l%d" % len(value))
+        for item in value:
+            update_hash(digest, item)
+    elif isinstance(value, (np.ndarray, np.generic)):
+        value = np.ascontiguousarray(value)
+        digest.update("a{}{}".format(value.dtype.str, value.shape).encode())
+        digest.update(value.tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif isinstance(value, bytes):
+        digest.update(b"b%d" % len(value) + value)
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        text = "{}:{!r}".format(type(value).__name__, value).encode()
+        digest.update(b"s%d" % len(text) + text)
+    else:
+        raise TypeError("Can't hash {}".format(type(value).__name__))
+
+
 def norm_boxes(boxes, shape):
     """Converts boxes from pixel coordinates to normalized coordinates.
     boxes: [N, (y1, x1, y2, x2)] in pixel coordinates
@@ -885,15 +1397,59 @@ def denorm_boxes(boxes, shape):
     return np.around(np.multiply(boxes, scale) + shift).astype(np.int32)
 
 
+def _cv2_resize(image, output_shape, interpolation):
+    """cv2.resize() of an [height, width] or [height, width, channels] array
+    to output_shape (height, width). Arrays with more channels than OpenCV
+    supports are resized in groups of channels.
+
+    Returns an array of the same dtype. Bool arrays are resized as uint8
+    and dtypes that OpenCV can't interpolate as float64.
+    """
+    h, w = output_shape[:2]
+    dtype = image.dtype
+    if dtype == bool:
+        image = image.view(np.uint8)
+    elif dtype not in (np.uint8, np.uint16, np.int16, np.float32, np.float64):
+        image = image.astype(np.float64)
+    if image.ndim == 2:
+        return cv2.resize(image, (w, h), interpolation=interpolation).astype(dtype, copy=False)
+    output = np.empty((h, w, image.shape[2]), dtype=dtype)
+    for c in range(0, image.shape[2], _CV2_MAX_CHANNELS):
+        group = np.ascontiguousarray(image[:, :, c:c + _CV2_MAX_CHANNELS])
+        output[:, :, c:c + group.shape[2]] = cv2.resize(
+            group, (w, h), interpolation=interpolation).reshape(h, w, -1)
+    return output
+
+
+# Channels that cv2.resize() handles in one call (CV_CN_MAX)
+_CV2_MAX_CHANNELS = 512
+
+
 def resize(image, output_shape, order=1, mode='constant', cval=0, clip=True,
-           preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None):
+           preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None,
+           backend="skimage"):
     """A wrapper for Scikit-Image resize().
 
     Scikit-Image generates warnings on every call to resize() if it doesn't
     receive the right parameters. The right parameters depend on the version
     of skimage. This solves the problem by using different parameters per
     version. And it provides a central place to control resizing defaults.
+
+    backend: "skimage", or "opencv" to resize with cv2.resize() instead.
+        Returns float64 like skimage, but only supports order 0 and 1,
+        replicates the edge pixels instead of using mode and cval, and
+        doesn't anti-alias.
     """
+    if backend == "opencv":
+        if order not in (0, 1) or anti_aliasing:
+            raise ValueError("The opencv backend only supports order 0 and 1 "
+                             "without anti-aliasing")
+        if not preserve_range or image.dtype == bool:
+            image = skimage.util.img_as_float(image)
+        return _cv2_resize(image.astype(np.float64, copy=False), output_shape,
+                           cv2.INTER_NEAREST_EXACT if order == 0 else cv2.INTER_LINEAR)
+    if backend != "skimage":
+        raise ValueError("Unknown resize backend: {}".format(backend))
     if LooseVersion(skimage.__version__) >= LooseVersion("0.14"):
         # New in 0.14: anti_aliasing. Default it to False for backward
         # compatibility with skimage 0.13.
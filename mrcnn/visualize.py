@@ -89,7 +89,8 @@ def display_instances(image, boxes, masks, class_ids, class_names,
                       colors=None, captions=None):
     """
     boxes: [num_instance, (y1, x1, y2, x2, class_id)] in image coordinates.
-    masks: [height, width, num_instances]
+    masks: [height, width, num_instances], or the sparse form: a list of
+        num_instances masks cropped to their boxes.
     class_ids: [num_instances]
     class_names: list of class names of the dataset
     scores: (optional) confidence scores for each box
@@ -106,7 +107,8 @@ def display_instances(image, boxes, masks, class_ids, class_names,
     if not N:
         print("\n*** No instances to display *** \n")
     else:
-        assert boxes.shape[0] == masks.shape[-1] == class_ids.shape[0]
+        mask_count = len(masks) if utils.is_sparse_masks(masks) else masks.shape[-1]
+        assert boxes.shape[0] == mask_count == class_ids.shape[0]
 
     # If no axis is passed, create one and automatically call show()
     auto_show = False
@@ -154,9 +156,18 @@ def display_instances(image, boxes, masks, class_ids, class_names,
                     color='w', size=11, backgroundcolor="none")
 
         # Mask
-        mask = masks[:, :, i]
+        # Sparse masks only cover their box, so work on that part of the
+        # image and shift the polygons by the box corner.
+        if utils.is_sparse_masks(masks):
+            mask = masks[i]
+            region = masked_image[y1:y2, x1:x2]
+            offset = np.array([x1, y1])
+        else:
+            mask = masks[:, :, i]
+            region = masked_image
+            offset = np.array([0, 0])
         if show_mask:
-            masked_image = apply_mask(masked_image, mask, color)
+            apply_mask(region, mask, color)
 
         # Mask Polygon
         # Pad to ensure proper polygons for masks that touch image edges.
@@ -166,7 +177,7 @@ def display_instances(image, boxes, masks, class_ids, class_names,
         contours = find_contours(padded_mask, 0.5)
         for verts in contours:
             # Subtract the padding and flip (y, x) to (x, y)
-            verts = np.fliplr(verts) - 1
+            verts = np.fliplr(verts) - 1 + offset
             p = Polygon(verts, facecolor="none", edgecolor=color)
             ax.add_patch(p)
     ax.imshow(masked_image.astype(np.uint8))
@@ -192,7 +203,11 @@ def display_differences(image,
     class_ids = np.concatenate([gt_class_id, pred_class_id])
     scores = np.concatenate([np.zeros([len(gt_match)]), pred_score])
     boxes = np.concatenate([gt_box, pred_box])
-    masks = np.concatenate([gt_mask, pred_mask], axis=-1)
+    if utils.is_sparse_masks(gt_mask) or utils.is_sparse_masks(pred_mask):
+        masks = utils.dense_to_sparse_masks(gt_box, gt_mask) +\
+            utils.dense_to_sparse_masks(pred_box, pred_mask)
+    else:
+        masks = np.concatenate([gt_mask, pred_mask], axis=-1)
     # Captions per instance show score/IoU
     captions = ["" for m in gt_match] + ["{:.2f} / {:.2f}".format(
         pred_score[i],
@@ -1,9 +1,21 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
 client = TestClient(app)
 
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """Point the upload, processed and output directories of the app to
+    tmp_path, so test runs don't write into data/. Returns the output
+    directory."""
+    for name in ["UPLOAD_DIR", "PROCESSED_DIR", "OUTPUT_DIR"]:
+        directory = tmp_path / name.split("_")[0].lower()
+        directory.mkdir()
+        monkeypatch.setattr(f"app.main.{name}", str(directory))
+    return str(tmp_path / "output")
+
 def test_health_check():
     """Test the health check endpoint"""
     response = client.get("/health")
@@ -15,7 +27,7 @@ def test_invalid_endpoint():
     response = client.get("/invalid-endpoint")
     assert response.status_code == 404
 
-def test_predict_api(tmp_path):
+def test_predict_api(output_dir):
     """Test the predict endpoint with a sample image"""
     # Create a dummy image file
     test_image_path = "tests/test.png"
@@ -28,6 +40,117 @@ def test_predict_api(tmp_path):
     # Optionally, check the response content if you know the expected output
     # assert "prediction" in response.json()
 
+def test_predict_api_simplification_params(output_dir):
+    """Test that contour simplification parameters are accepted"""
+    with open("tests/test.png", "rb") as f:
+        response = client.post(
+            "/api/floorplan/detect?tolerance=2&snap_walls=true",
+            files={"file": ("test.png", f, "image/png")}
+        )
+    assert response.status_code == 200
+    for wall in response.json()["elements"]["walls"]:
+        assert len(wall["contour"]) == 4
+
+def test_overlay_rendered_on_demand(output_dir):
+    """Test that the overlay image is rendered on first request and cached"""
+    with open("tests/test.png", "rb") as f:
+        response = client.post(
+            "/api/floorplan/detect",
+            files={"file": ("test.png", f, "image/png")}
+        )
+    result = response.json()
+    overlay_path = os.path.join(output_dir, f"{result['id']}_detected.jpg")
+    assert not os.path.exists(overlay_path)
+
+    response = client.get(result["image_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert os.path.exists(overlay_path)
+
+    response = client.get(f"/api/floorplan/results/{result['id']}?style=masks&colors=class")
+    assert response.status_code == 200
+    assert os.path.exists(os.path.join(output_dir, f"{result['id']}_detected_masks_class.jpg"))
+
+def test_overlay_invalid_requests():
+    """Test unknown results and rendering options"""
+    assert client.get("/api/floorplan/results/unknown-id").status_code == 404
+    assert client.get("/api/floorplan/images/unknown-id_detected.jpg").status_code == 404
+    assert client.get("/api/floorplan/results/unknown-id?style=wireframe").status_code == 422
+
+def test_spatial_queries(output_dir):
+    """Test the window, nearest and adjacency queries on a stored result"""
+    with open("tests/test.png", "rb") as f:
+        result = client.post(
+            "/api/floorplan/detect",
+            files={"file": ("test.png", f, "image/png")}
+        ).json()
+    base = f"/api/floorplan/results/{result['id']}"
+    total = sum(len(group) for group in result["elements"].values())
+
+    response = client.get(f"{base}/elements?x1=0&y1=0&x2=100000&y2=100000")
+    assert response.status_code == 200
+    assert len(response.json()["elements"]) == total
+
+    response = client.get(f"{base}/elements?x1=0&y1=0&x2=100000&y2=100000&group=doors")
+    assert [e["index"] for e in response.json()["elements"]] == \
+        list(range(len(result["elements"]["doors"])))
+
+    response = client.get(f"{base}/nearest?x=0&y=0&k=3")
+    distances = [e["distance"] for e in response.json()["elements"]]
+    assert len(distances) == min(3, total) and distances == sorted(distances)
+
+    response = client.get(f"{base}/adjacency?max_distance=1000000")
+    openings = response.json()["openings"]
+    assert len(openings) == len(result["elements"]["windows"]) + len(result["elements"]["doors"])
+    assert all(len(o["walls"]) == len(result["elements"]["walls"]) for o in openings)
+
+    assert client.get(f"{base}/elements?x1=10&y1=0&x2=0&y2=10").status_code == 400
+    assert client.get("/api/floorplan/results/unknown-id/nearest?x=0&y=0").status_code == 404
+
+def test_wall_graph(output_dir):
+    """Test that the wall graph is vectorized on first request and cached"""
+    with open("tests/test.png", "rb") as f:
+        result = client.post(
+            "/api/floorplan/detect",
+            files={"file": ("test.png", f, "image/png")}
+        ).json()
+    response = client.get(f"/api/floorplan/results/{result['id']}/walls")
+    assert response.status_code == 200
+    graph = response.json()
+    for segment in graph["segments"]:
+        assert all(0 <= i < len(graph["nodes"]) for i in segment["nodes"])
+        assert segment["thickness"] >= 0
+    assert os.path.exists(os.path.join(output_dir, f"{result['id']}_walls.json"))
+    assert client.get("/api/floorplan/results/unknown-id/walls").status_code == 404
+
+def test_3d_model(output_dir):
+    """Test that the 3D model is generated on first request and cached"""
+    with open("tests/test.png", "rb") as f:
+        result = client.post(
+            "/api/floorplan/detect",
+            files={"file": ("test.png", f, "image/png")}
+        ).json()
+    response = client.get(f"/api/floorplan/results/{result['id']}/model.glb")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "model/gltf-binary"
+    assert response.content[:4] == b"glTF"
+    assert os.path.exists(os.path.join(output_dir, f"{result['id']}_model.glb"))
+    assert client.get("/api/floorplan/results/unknown-id/model.glb").status_code == 404
+
+def test_rooms(output_dir):
+    """Test that rooms are segmented on first request and cached"""
+    with open("tests/test.png", "rb") as f:
+        result = client.post(
+            "/api/floorplan/detect",
+            files={"file": ("test.png", f, "image/png")}
+        ).json()
+    response = client.get(f"/api/floorplan/results/{result['id']}/rooms")
+    assert response.status_code == 200
+    areas = [room["area"] for room in response.json()["rooms"]]
+    assert areas == sorted(areas, reverse=True)
+    assert os.path.exists(os.path.join(output_dir, f"{result['id']}_rooms.json"))
+    assert client.get("/api/floorplan/results/unknown-id/rooms").status_code == 404
+
 # Add more specific API tests based on your endpoints
 # Example:
 # def test_floorplan_upload():
@@ -38,4 +161,4 @@ def test_predict_api(tmp_path):
 #             "/upload",
 #             files={"file": ("test.jpg", f, "image/jpeg")}
 #         )
-#     assert response.status_code == 200 
\ No newline at end of file
+#     assert response.status_code == 200 
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+cv2 = pytest.importorskip("cv2")
+
+from aroomy_train import FloorplanDataset
+
+
+def reference_load_mask(annotations, image):
+    """The previous load_mask(): a scan of all annotations, one full size
+    mask per instance
+    """
+    masks, class_ids = [], []
+    for annotation in annotations["annotations"]:
+        if annotation["image_id"] == image["id"]:
+            mask = np.zeros([image["height"], image["width"]], dtype=np.uint8)
+            for polygon in annotation["segmentation"]:
+                cv2.fillPoly(mask, [np.array(polygon, dtype=np.int32).reshape((-1, 2))], 1)
+            masks.append(mask)
+            class_ids.append(annotation["category_id"] + 1)
+    if not masks:
+        return (np.zeros([image["height"], image["width"], 0], dtype=np.uint8),
+                np.array([], dtype=np.int32))
+    return np.stack(masks, axis=-1), np.array(class_ids, dtype=np.int32)
+
+
+def test_load_mask_matches_scan(tmp_path):
+    """Grouped, box-cropped rasterization gives the same masks"""
+    rng = np.random.RandomState(0)
+    images, instances = [], []
+    for i in range(12):
+        h, w = rng.randint(50, 150, 2)
+        images.append({"id": 10 + i, "file_name": "{}.png".format(i),
+                       "height": int(h), "width": int(w)})
+        # Some images without instances, polygons partly outside the image
+        for _ in range(0 if i % 5 == 2 else rng.randint(1, 8)):
+            segmentation = []
+            for _ in range(rng.randint(1, 3)):
+                k = rng.randint(3, 8)
+                x, y = rng.randint(-20, w + 20), rng.randint(-20, h + 20)
+                points = np.stack([x + rng.randint(-30, 30, k), y + rng.randint(-30, 30, k)], 1)
+                segmentation.append(points.ravel().tolist())
+            instances.append({"image_id": 10 + i, "category_id": int(rng.randint(0, 3)),
+                              "segmentation": segmentation})
+    annotations = {"images": images,
+                   "annotations": [instances[j] for j in rng.permutation(len(instances))]}
+    (tmp_path / "train" / "annotations").mkdir(parents=True)
+    with open(str(tmp_path / "train" / "annotations" / "output_annotations.json"), "w") as f:
+        json.dump(annotations, f)
+
+    dataset = FloorplanDataset()
+    dataset.load_floorplan(str(tmp_path), "train")
+    dataset.prepare()
+    for image_id, image in zip(dataset.image_ids, images):
+        masks, class_ids = dataset.load_mask(image_id)
+        expected_masks, expected_class_ids = reference_load_mask(annotations, image)
+        assert masks.dtype == expected_masks.dtype and class_ids.dtype == np.int32
+        np.testing.assert_array_equal(masks, expected_masks)
+        np.testing.assert_array_equal(class_ids, expected_class_ids)
@@ -0,0 +1,61 @@
+import io
+import json
+import struct
+
+import numpy as np
+
+from app.floorplan.generation import box_mesh, wall_boxes, write_glb
+
+
+def straight_wall():
+    """One 800 px wall along x, 10 px thick, with no junctions"""
+    return {"nodes": [[100, 100], [900, 100]],
+            "segments": [{"nodes": [0, 1], "thickness": 10}]}
+
+
+def test_wall_boxes_cut_openings():
+    """Doors keep the wall above them, windows above and below"""
+    openings = [("Door", [200, 90, 300, 140]), ("Window", [500, 95, 600, 105])]
+    boxes = wall_boxes(straight_wall(), openings, scale=0.01, wall_height=2.5,
+                       door_height=2, window_sill=1, window_top=2)
+    spans = sorted(map(tuple, np.round(boxes[:, 4:8], 3).tolist()))
+    assert spans == [
+        (0, 1, 0, 2.5), (1, 2, 2, 2.5), (2, 4, 0, 2.5),
+        (4, 5, 0, 1), (4, 5, 2, 2.5), (5, 8, 0, 2.5),
+    ]
+    np.testing.assert_allclose(boxes[:, 8], 0.05)
+
+
+def test_box_mesh_faces_point_outward():
+    """Triangles wind counter clockwise seen from outside, matching normals"""
+    boxes = wall_boxes({"nodes": [[0, 0], [100, 0], [100, 80]],
+                        "segments": [{"nodes": [0, 1], "thickness": 10},
+                                     {"nodes": [1, 2], "thickness": 10}]})
+    positions, normals, indices = box_mesh(boxes)
+    assert positions.shape == (len(boxes) * 24, 3) and indices.shape == (len(boxes) * 36,)
+    triangles = positions[indices.reshape(-1, 3)]
+    cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    assert ((cross * normals[indices.reshape(-1, 3)[:, 0]]).sum(axis=1) > 0).all()
+
+
+def test_write_glb():
+    """The output is a valid GLB container whose accessors match the buffers"""
+    positions, normals, indices = box_mesh(wall_boxes(straight_wall()))
+    f = io.BytesIO()
+    write_glb(f, positions, normals, indices)
+    data = f.getvalue()
+
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    assert (magic, version, length) == (0x46546C67, 2, len(data))
+    json_length, json_type = struct.unpack_from("<II", data, 12)
+    assert json_type == 0x4E4F534A and json_length % 4 == 0
+    gltf = json.loads(data[20:20 + json_length])
+    bin_length, bin_type = struct.unpack_from("<II", data, 20 + json_length)
+    assert bin_type == 0x004E4942 and bin_length == gltf["buffers"][0]["byteLength"]
+
+    binary = data[28 + json_length:]
+    view = gltf["bufferViews"][gltf["accessors"][2]["bufferView"]]
+    decoded = np.frombuffer(binary, dtype="<u4", count=gltf["accessors"][2]["count"],
+                            offset=view["byteOffset"])
+    np.testing.assert_array_equal(decoded, indices)
+    assert gltf["accessors"][0]["count"] == len(positions)
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from mrcnn import evaluate, utils
+
+
+class BoxesDataset(utils.Dataset):
+    """Images with a few random rectangles of three classes"""
+
+    def load_boxes(self, count, seed=0):
+        for i, name in enumerate(["door", "wall", "window"]):
+            self.add_class("boxes", i + 1, name)
+        rng = np.random.RandomState(seed)
+        for i in range(count):
+            n = rng.randint(1, 6)
+            y1x1 = rng.randint(0, 48, (n, 2))
+            boxes = np.concatenate([y1x1, y1x1 + rng.randint(4, 16, (n, 2))], axis=1)
+            self.add_image("boxes", image_id=100 + i, path=None, boxes=boxes,
+                           class_ids=rng.randint(1, 4, n))
+
+    def load_image(self, image_id):
+        return np.zeros((64, 64, 3), dtype=np.uint8)
+
+    def load_mask(self, image_id):
+        info = self.image_info[image_id]
+        masks = np.zeros((64, 64, len(info["boxes"])), dtype=np.uint8)
+        for i, (y1, x1, y2, x2) in enumerate(info["boxes"]):
+            masks[y1:y2, x1:x2, i] = 1
+        return masks, info["class_ids"].astype(np.int32)
+
+
+class GroundTruthModel(object):
+    """Predicts the ground truth, and a false positive on every image"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.calls = 0
+
+    def detect_many(self, images, sparse_masks=False):
+        for image_id, _ in zip(self.dataset.image_ids[self.calls:], images):
+            self.calls += 1
+            masks, class_ids = self.dataset.load_mask(image_id)
+            rois = np.concatenate([utils.extract_bboxes(masks), [[60, 60, 64, 64]]])
+            masks = utils.dense_to_sparse_masks(rois[:-1], masks) + [np.ones((4, 4), bool)]
+            yield {"rois": rois, "class_ids": np.append(class_ids, 1),
+                   "scores": np.append(np.linspace(1, 0.5, len(class_ids)), 0.1),
+                   "masks": masks}
+
+
+@pytest.fixture
+def dataset():
+    dataset = BoxesDataset()
+    dataset.load_boxes(6)
+    dataset.prepare()
+    return dataset
+
+
+def test_prediction_cache_round_trip(dataset, tmp_path):
+    """Cached predictions load back with the same boxes and masks"""
+    cache = evaluate.PredictionCache(str(tmp_path))
+    model = GroundTruthModel(dataset)
+    assert evaluate.predict_dataset(model, dataset, cache, verbose=0) == 6
+    # Cached images aren't run again
+    assert evaluate.predict_dataset(model, dataset, cache, verbose=0) == 0
+    assert model.calls == 6
+    assert evaluate.cache_key(dataset, 0) == 100 and 100 in cache
+    r = cache.load(100)
+    masks, class_ids = dataset.load_mask(0)
+    np.testing.assert_array_equal(r["rois"][:-1], utils.extract_bboxes(masks))
+    np.testing.assert_array_equal(r["class_ids"][:-1], class_ids)
+    np.testing.assert_array_equal(utils.sparse_to_dense_masks(r["rois"][:-1], r["masks"][:-1],
+                                                              masks.shape), masks.astype(bool))
+
+
+def test_evaluate_dataset(dataset, tmp_path):
+    """Ground truth predictions have full recall, and the false positives
+    of the door class rank last, so they don't lower its AP
+    """
+    cache = evaluate.PredictionCache(str(tmp_path))
+    evaluate.predict_dataset(GroundTruthModel(dataset), dataset, cache, verbose=0)
+    results = evaluate.evaluate_dataset(dataset, cache, workers=0)
+    assert list(results["classes"]) == ["door", "wall", "window"]
+    for name, c in results["classes"].items():
+        assert c["gt"] > 0
+        assert c["AP"] == pytest.approx(1.0) and c["AR"] == pytest.approx(1.0)
+    assert results["classes"]["door"]["predictions"] == results["classes"]["door"]["gt"] + 6
+    assert results["AP"] == pytest.approx(1.0) and results["AP50"] == pytest.approx(1.0)
+    # A process pool gives the same results
+    pooled = evaluate.evaluate_dataset(dataset, cache, workers=2)
+    for name, c in results["classes"].items():
+        np.testing.assert_allclose(pooled["classes"][name]["APs"], c["APs"])
+    assert "mean" in evaluate.format_report(results)
+
+    # Without AP at 0.75, AP75 is not reported
+    results = evaluate.evaluate_dataset(dataset, cache, iou_thresholds=[0.5], workers=0)
+    assert results["AP75"] is None and results["AP50"] == pytest.approx(1.0)
+
+
+def test_prediction_cache_fingerprint(dataset, tmp_path):
+    """Predictions of another model are predicted again"""
+    from mrcnn.config import Config
+
+    class EvalConfig(Config):
+        NAME = "eval"
+
+    weights = tmp_path / "weights.h5"
+    weights.write_bytes(b"first")
+    fingerprint = evaluate.model_fingerprint(str(weights), EvalConfig())
+    assert fingerprint == evaluate.model_fingerprint(str(weights), EvalConfig())
+    directory = str(tmp_path / "cache")
+    cache = evaluate.PredictionCache(directory, fingerprint)
+    assert evaluate.predict_dataset(GroundTruthModel(dataset), dataset, cache, verbose=0) == 6
+    # Same model, or no fingerprint: the predictions are reused
+    cache = evaluate.PredictionCache(directory, fingerprint)
+    assert evaluate.predict_dataset(GroundTruthModel(dataset), dataset, cache, verbose=0) == 0
+    assert evaluate.PredictionCache(directory).fingerprint() == fingerprint
+    # New weights or config: predicted again
+    weights.write_bytes(b"second")
+    cache = evaluate.PredictionCache(directory, evaluate.model_fingerprint(str(weights), EvalConfig()))
+    assert evaluate.predict_dataset(GroundTruthModel(dataset), dataset, cache, verbose=0) == 6
+    EvalConfig.DETECTION_MIN_CONFIDENCE = 0.5
+    assert evaluate.model_fingerprint(str(weights), EvalConfig()) != cache.fingerprint()
@@ -0,0 +1,262 @@
+import threading
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from mrcnn import model as modellib
+from mrcnn.config import Config
+
+
+class TinyConfig(Config):
+    """A small inference model with random weights, fast enough for tests"""
+    NAME = "tiny"
+    NUM_CLASSES = 1 + 3
+    GPU_COUNT = 1
+    IMAGES_PER_GPU = 2
+    BACKBONE = "resnet50"
+    IMAGE_MIN_DIM = 128
+    IMAGE_MAX_DIM = 128
+    RPN_ANCHOR_SCALES = (8, 16, 32, 64, 128)
+    POST_NMS_ROIS_INFERENCE = 100
+    DETECTION_MAX_INSTANCES = 20
+    DETECTION_MIN_CONFIDENCE = 0.0
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    return modellib.MaskRCNN(mode="inference", config=TinyConfig(),
+                             model_dir=str(tmp_path_factory.mktemp("logs")))
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 255, (100 + 10 * i, 120, 3)).astype(np.uint8) for i in range(5)]
+
+
+def assert_same_results(a, b):
+    assert len(a) == len(b)
+    for ra, rb in zip(a, b):
+        np.testing.assert_array_equal(ra['rois'], rb['rois'])
+        np.testing.assert_array_equal(ra['class_ids'], rb['class_ids'])
+        np.testing.assert_allclose(ra['scores'], rb['scores'], rtol=1e-5)
+        for ma, mb in zip(ra['masks'], rb['masks']):
+            np.testing.assert_array_equal(ma, mb)
+
+
+def test_detect_many_matches_detect(model, images):
+    """Results come in input order, with the last chunk padded"""
+    expected = model.detect(images[:2]) + model.detect(images[2:4]) + \
+        model.detect([images[4], images[4]])[:1]
+    assert_same_results(list(model.detect_many(images)), expected)
+    # Chunk sizes are rounded up to multiples of BATCH_SIZE
+    assert_same_results(list(model.detect_many(iter(images), batch_size=3)), expected)
+    sparse = list(model.detect_many(images, sparse_masks=True))
+    assert all(isinstance(r['masks'], list) for r in sparse)
+    assert list(model.detect_many([])) == []
+
+
+def test_detect_many_loads_in_background(model, images):
+    """Images are taken from the iterable on the molding thread"""
+    threads = []
+
+    def load():
+        for image in images:
+            threads.append(threading.get_ident())
+            yield image
+    assert len(list(model.detect_many(load()))) == len(images)
+    assert threading.get_ident() not in threads
+
+
+def test_inference_model_is_abstract():
+    """Subclasses must provide the network's inference_function()"""
+    with pytest.raises(TypeError):
+        modellib.InferenceModel()
+
+
+def test_inference_function_matches_predict(model, images):
+    """The serving graph gives the same outputs as predict() on the full model"""
+    molded_images, image_metas, _ = model.mold_inputs(images[:2])
+    anchors = model.get_anchors(molded_images[0].shape)
+    anchors = np.broadcast_to(anchors, (2,) + anchors.shape)
+    detections, _, _, mrcnn_mask, _, _, _ = model.keras_model.predict(
+        [molded_images, image_metas, anchors], verbose=0)
+    fast_detections, masks = model.predict_detections(molded_images, image_metas, anchors)
+    np.testing.assert_allclose(fast_detections, detections, rtol=1e-5, atol=1e-6)
+    # Masks are picked for the class of each detection
+    class_ids = detections[..., 4].astype(np.int32)
+    expected = np.take_along_axis(mrcnn_mask, class_ids[:, :, None, None, None], axis=4)[..., 0]
+    np.testing.assert_allclose(masks, expected, rtol=1e-5, atol=1e-6)
+    assert model.inference_function() is model.inference_function()
+
+    _, masks_uint8 = model.predict_detections(molded_images, image_metas, anchors, "uint8")
+    _, masks_float16 = model.predict_detections(molded_images, image_metas, anchors, "float16")
+    assert masks_uint8.dtype == np.uint8 and masks_float16.dtype == np.float16
+    np.testing.assert_allclose(masks_uint8 / 255, expected, atol=0.5 / 255 + 1e-6)
+    np.testing.assert_allclose(masks_float16, expected, atol=1e-3)
+
+
+def test_unmold_detections_accepts_serving_masks(model, images):
+    """Unmolding class masks, as float or uint8, matches the full masks"""
+    molded_images, image_metas, windows = model.mold_inputs(images[:2])
+    anchors = model.get_anchors(molded_images[0].shape)
+    anchors = np.broadcast_to(anchors, (2,) + anchors.shape)
+    detections, _, _, mrcnn_mask, _, _, _ = model.keras_model.predict(
+        [molded_images, image_metas, anchors], verbose=0)
+    _, masks = model.predict_detections(molded_images, image_metas, anchors, "uint8")
+    args = (images[0].shape, molded_images[0].shape, windows[0])
+    full = model.unmold_detections(detections[0], mrcnn_mask[0], *args)
+    served = model.unmold_detections(detections[0], masks[0], *args)
+    np.testing.assert_array_equal(full[0], served[0])
+    # Rounding to 8 bits may only flip pixels right at the mask edges
+    assert (full[3] != served[3]).mean() < 1e-3
+
+
+@pytest.mark.parametrize("runtime", ["savedmodel", "tflite"])
+def test_exported_model_matches_keras(model, images, tmp_path, runtime):
+    """An exported model detects the same as the Keras model it came from"""
+    from mrcnn import export
+
+    export_dir = str(tmp_path / "exported")
+    if runtime == "savedmodel":
+        export.export_saved_model(model, export_dir)
+    else:
+        export.export_tflite(model, export_dir)
+    exported = export.ExportedModel(export_dir, runtime=runtime)
+    assert exported.config.BATCH_SIZE == model.config.BATCH_SIZE
+    np.testing.assert_array_equal(exported.config.MEAN_PIXEL, model.config.MEAN_PIXEL)
+
+    molded_images, image_metas, _ = model.mold_inputs(images[:2])
+    anchors = model.get_anchors(molded_images[0].shape)
+    anchors = np.broadcast_to(anchors, (2,) + anchors.shape)
+    expected = model.predict_detections(molded_images, image_metas, anchors)
+    outputs = exported.predict_detections(molded_images, image_metas, anchors)
+    for o, e in zip(outputs, expected):
+        assert o.shape == e.shape and o.dtype == e.dtype
+
+    results = list(exported.detect_many(images, sparse_masks=True))
+    assert len(results) == len(images)
+    if runtime == "savedmodel":
+        assert_same_results(results, list(model.detect_many(images, sparse_masks=True)))
+    else:
+        # The random weights saturate the RPN scores, so which of the tied
+        # anchors TFLite keeps depends on its rounding and the detections
+        # can't be compared one by one. The float backbone and FPN, which
+        # compute everything before the RPN, must match the Keras tensors.
+        export.export_tflite(model, str(tmp_path / "staged"), quantization={})
+        staged = export.ExportedModel(str(tmp_path / "staged"), runtime="tflite")
+        groups = export.layer_groups(model)
+        session = tf.compat.v1.keras.backend.get_session()
+        values = [molded_images]
+        for (group, _, outputs), (stage, run) in zip(groups[:2], staged.stages):
+            assert stage["group"] == group
+            expected = session.run(outputs, feed_dict={model.keras_model.inputs[0]: molded_images})
+            values = run(*values)
+            assert len(values) == len(expected)
+            for v, e in zip(values, expected):
+                np.testing.assert_allclose(v, e, rtol=1e-3, atol=1e-3)
+    with pytest.raises(ValueError):
+        exported.inference_function("float16")
+
+
+def test_quantized_tflite_export(model, images, tmp_path):
+    """Each layer group is its own TFLite model, quantized as requested"""
+    from mrcnn import export
+
+    quantization = export.parse_quantization("backbone=int8,fpn=dynamic")
+    assert quantization == {"backbone": "int8", "fpn": "dynamic"}
+    with pytest.raises(ValueError):
+        export.parse_quantization("heads=int8")
+    with pytest.raises(ValueError):
+        export.parse_quantization("neck=int8")
+
+    export_dir = str(tmp_path / "quantized")
+    export.export_tflite(model, export_dir, quantization=quantization,
+                         calibration_images=images[:2])
+    exported = export.ExportedModel(export_dir, runtime="tflite")
+    assert [(s["group"], s["quantization"]) for s, _ in exported.stages] == \
+        [("backbone", "int8"), ("fpn", "dynamic"), ("heads", "float")]
+    # Quantized weights take a quarter of the space of float32 ones
+    float_size = 4 * sum(np.prod(w.shape) for layer in model.keras_model.layers
+                         if layer.name.startswith(("conv1", "res", "bn"))
+                         for w in layer.weights)
+    stage = exported.stages[0][0]
+    assert (tmp_path / "quantized" / stage["file"]).stat().st_size < float_size / 3
+
+    molded_images, image_metas, _ = model.mold_inputs(images[:2])
+    anchors = model.get_anchors(molded_images[0].shape)
+    anchors = np.broadcast_to(anchors, (2,) + anchors.shape)
+    expected = model.predict_detections(molded_images, image_metas, anchors)
+    outputs = exported.predict_detections(molded_images, image_metas, anchors)
+    for o, e in zip(outputs, expected):
+        assert o.shape == e.shape and o.dtype == e.dtype
+    assert len(list(exported.detect_many(images))) == len(images)
+
+
+def reference_build_rpn_targets(anchors, gt_class_ids, gt_boxes, config):
+    """The per-anchor loop that build_rpn_targets() replaced"""
+    from mrcnn import utils
+
+    rpn_match = np.zeros([anchors.shape[0]], dtype=np.int32)
+    rpn_bbox = np.zeros((config.RPN_TRAIN_ANCHORS_PER_IMAGE, 4))
+    crowd_ix = np.where(gt_class_ids < 0)[0]
+    no_crowd_bool = np.ones([anchors.shape[0]], dtype=bool)
+    if crowd_ix.shape[0] > 0:
+        crowd_boxes = gt_boxes[crowd_ix]
+        gt_boxes = gt_boxes[gt_class_ids > 0]
+        no_crowd_bool = np.amax(utils.compute_overlaps(anchors, crowd_boxes), axis=1) < 0.001
+    overlaps = utils.compute_overlaps(anchors, gt_boxes)
+    anchor_iou_argmax = np.argmax(overlaps, axis=1)
+    anchor_iou_max = overlaps[np.arange(overlaps.shape[0]), anchor_iou_argmax]
+    rpn_match[(anchor_iou_max < 0.3) & no_crowd_bool] = -1
+    rpn_match[np.argwhere(overlaps == np.max(overlaps, axis=0))[:, 0]] = 1
+    rpn_match[anchor_iou_max >= 0.7] = 1
+    ids = np.where(rpn_match == 1)[0]
+    extra = len(ids) - (config.RPN_TRAIN_ANCHORS_PER_IMAGE // 2)
+    if extra > 0:
+        rpn_match[np.random.choice(ids, extra, replace=False)] = 0
+    ids = np.where(rpn_match == -1)[0]
+    extra = len(ids) - (config.RPN_TRAIN_ANCHORS_PER_IMAGE - np.sum(rpn_match == 1))
+    if extra > 0:
+        rpn_match[np.random.choice(ids, extra, replace=False)] = 0
+    for ix, i in enumerate(np.where(rpn_match == 1)[0]):
+        a, gt = anchors[i], gt_boxes[anchor_iou_argmax[i]]
+        gt_h, gt_w = gt[2] - gt[0], gt[3] - gt[1]
+        a_h, a_w = a[2] - a[0], a[3] - a[1]
+        rpn_bbox[ix] = [(gt[0] + 0.5 * gt_h - a[0] - 0.5 * a_h) / a_h,
+                        (gt[1] + 0.5 * gt_w - a[1] - 0.5 * a_w) / a_w,
+                        np.log(gt_h / a_h), np.log(gt_w / a_w)]
+        rpn_bbox[ix] /= config.RPN_BBOX_STD_DEV
+    return rpn_match, rpn_bbox
+
+
+@pytest.mark.parametrize("count,crowds", [(1, 0), (6, 0), (40, 2)])
+def test_build_rpn_targets_matches_reference(count, crowds):
+    """Vectorized RPN targets are the same as the per-anchor loop"""
+    from mrcnn import utils
+
+    config = TinyConfig()
+    anchors = utils.generate_pyramid_anchors(
+        config.RPN_ANCHOR_SCALES, config.RPN_ANCHOR_RATIOS,
+        modellib.compute_backbone_shapes(config, config.IMAGE_SHAPE),
+        config.BACKBONE_STRIDES, config.RPN_ANCHOR_STRIDE)
+    rng = np.random.RandomState(count)
+    y1x1 = rng.randint(0, 96, (count, 2))
+    gt_boxes = np.concatenate([y1x1, y1x1 + rng.randint(4, 32, (count, 2))], axis=1)
+    gt_class_ids = rng.randint(1, config.NUM_CLASSES, count)
+    gt_class_ids[:crowds] = -1
+    # Precomputed areas must round like the ones compute_overlaps() computes
+    anchors32 = anchors.astype(np.float32)
+    areas = (anchors32[:, 2] - anchors32[:, 0]) * (anchors32[:, 3] - anchors32[:, 1])
+    np.random.seed(count)
+    expected = reference_build_rpn_targets(anchors, gt_class_ids, gt_boxes, config)
+    for anchor_areas in (None, areas):
+        np.random.seed(count)
+        rpn_match, rpn_bbox = modellib.build_rpn_targets(
+            config.IMAGE_SHAPE, anchors, gt_class_ids, gt_boxes, config,
+            anchor_areas=anchor_areas)
+        np.testing.assert_array_equal(rpn_match, expected[0])
+        assert rpn_bbox.shape == expected[1].shape
+        np.testing.assert_allclose(rpn_bbox, expected[1], rtol=1e-5, atol=1e-5)
+    assert np.sum(rpn_match == 1) > 0
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from mrcnn import model as modellib
+from mrcnn import prefetch, utils
+from mrcnn.config import Config
+
+
+class SmallConfig(Config):
+    NAME = "small"
+    NUM_CLASSES = 1 + 2
+    GPU_COUNT = 1
+    IMAGES_PER_GPU = 2
+    IMAGE_MIN_DIM = 64
+    IMAGE_MAX_DIM = 64
+    RPN_ANCHOR_SCALES = (4, 8, 16, 32, 64)
+    RPN_TRAIN_ANCHORS_PER_IMAGE = 32
+    MAX_GT_INSTANCES = 4
+
+
+class NoiseDataset(utils.Dataset):
+    """Noise images of different sizes with random rectangles, some empty"""
+
+    def load_noise(self, count):
+        self.add_class("noise", 1, "wall")
+        self.add_class("noise", 2, "door")
+        rng = np.random.RandomState(0)
+        for i in range(count):
+            n = 0 if i % 5 == 4 else rng.randint(1, 7)
+            y1x1 = rng.randint(0, 30, (n, 2))
+            self.add_image("noise", image_id=i, path=None, shape=(40 + 4 * i, 50),
+                           boxes=np.concatenate([y1x1, y1x1 + rng.randint(4, 16, (n, 2))], axis=1),
+                           class_ids=rng.randint(1, 3, n))
+
+    def load_image(self, image_id):
+        info = self.image_info[image_id]
+        rng = np.random.RandomState(image_id)
+        return rng.randint(0, 256, info["shape"] + (3,)).astype(np.uint8)
+
+    def load_mask(self, image_id):
+        info = self.image_info[image_id]
+        masks = np.zeros(info["shape"] + (len(info["boxes"]),), dtype=bool)
+        for i, (y1, x1, y2, x2) in enumerate(info["boxes"]):
+            masks[y1:y2, x1:x2, i] = True
+        return masks, info["class_ids"].astype(np.int32)
+
+
+@pytest.fixture(scope="module")
+def generator():
+    dataset = NoiseDataset()
+    dataset.load_noise(10)
+    dataset.prepare()
+    return modellib.DataGenerator(dataset, SmallConfig(), random_rois=20, seed=3)
+
+
+def assert_same_batches(a, b):
+    for x, y in zip(a[0] + a[1], b[0] + b[1]):
+        np.testing.assert_array_equal(x, y)
+
+
+def test_seeded_batches_are_reproducible(generator):
+    """Batch i only depends on the seed and i, not on the batches before it"""
+    batches = [generator[i] for i in range(4)]
+    assert_same_batches(generator[2], batches[2])
+    assert_same_batches(generator[0], batches[0])
+    assert not np.array_equal(batches[0][0][0], batches[1][0][0])
+    generator.seed = 4
+    assert not np.array_equal(generator[0][0][0], batches[0][0][0])
+    generator.seed = 3
+
+
+@pytest.mark.parametrize("workers,queue_size", [(0, 1), (1, 1), (2, 3)])
+def test_prefetcher_matches_generator(generator, workers, queue_size):
+    """Prefetched batches are the generator's, in order, from start"""
+    with prefetch.BatchPrefetcher(generator, workers=workers, queue_size=queue_size,
+                                  start=5) as batches:
+        for i in range(5, 12):
+            assert_same_batches(next(batches), generator[i])
+    assert len(batches.wait_times) == 7 and batches.index == 12
+
+
+def test_prefetcher_seeds_unseeded_generator(generator):
+    """Workers of an unseeded generator don't build the same batches"""
+    unseeded = modellib.DataGenerator(generator.dataset, generator.config)
+    with prefetch.BatchPrefetcher(unseeded, workers=2, queue_size=2) as batches:
+        images = [next(batches)[0][0] for _ in range(4)]
+    assert unseeded.seed is None and batches.generator.seed is not None
+    assert len({image.tobytes() for image in images}) == 4
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from mrcnn import model as modellib
+from tests.test_mrcnn_prefetch import NoiseDataset, SmallConfig
+
+
+@pytest.fixture
+def dataset():
+    dataset = NoiseDataset()
+    dataset.load_noise(10)
+    dataset.prepare()
+    return dataset
+
+
+class MiniMaskConfig(SmallConfig):
+    USE_MINI_MASK = True
+    MINI_MASK_SHAPE = (12, 12)
+
+
+@pytest.mark.parametrize("config", [SmallConfig(), MiniMaskConfig()])
+def test_sample_cache_matches_load_image_gt(dataset, config, tmp_path):
+    """Cached samples are those of load_image_gt(), read from the shards"""
+    cache = modellib.SampleCache(str(tmp_path), dataset, config, shard_size=0.02)
+    assert cache.build(workers=2)
+    assert len([n for n in os.listdir(str(tmp_path)) if n.endswith("_images.npy")]) > 1
+    for image_id in dataset.image_ids:
+        cached = cache.load(image_id)
+        expected = modellib.load_image_gt(dataset, config, image_id)
+        for a, b in zip(cached, expected):
+            assert a.shape == b.shape
+            np.testing.assert_array_equal(a, b)
+        image, mask = cached[0], cached[4]
+        assert isinstance(image.base, np.memmap) and not image.flags.writeable
+        assert isinstance(mask.base, np.memmap) or not mask.size
+
+
+def test_sample_cache_rebuilds_on_changes(dataset, tmp_path):
+    """build() is a no-op until the dataset or config change"""
+    directory = str(tmp_path)
+    assert modellib.SampleCache(directory, dataset, SmallConfig()).build(verbose=0)
+    assert not modellib.SampleCache(directory, dataset, SmallConfig()).build(verbose=0)
+    assert modellib.SampleCache(directory, dataset, MiniMaskConfig()).is_current() is False
+    info = dataset.image_info[3]
+    info["boxes"], info["class_ids"] = info["boxes"][:1], info["class_ids"][:1]
+    cache = modellib.SampleCache(directory, dataset, SmallConfig())
+    assert not cache.is_current()
+    assert cache.build(verbose=0)
+    assert len(cache.load(3)[2]) == 1
+    # An interrupted build leaves no index
+    os.remove(os.path.join(directory, "index.npz"))
+    assert modellib.SampleCache(directory, dataset, SmallConfig()).build(verbose=0)
+
+
+def test_sample_cache_fingerprint_is_canonical(dataset, tmp_path):
+    """The fingerprint depends on the info contents, not on dict order"""
+    fingerprint = modellib.SampleCache(str(tmp_path), dataset, SmallConfig()).fingerprint
+    dataset.image_info = [dict(reversed(list(info.items()))) for info in dataset.image_info]
+    assert modellib.SampleCache(str(tmp_path), dataset, SmallConfig()).fingerprint == fingerprint
+    dataset.image_info[0]["boxes"] = dataset.image_info[0]["boxes"].astype(np.int16)
+    assert modellib.SampleCache(str(tmp_path), dataset, SmallConfig()).fingerprint != fingerprint
+
+
+def test_data_generator_reads_cache(dataset, tmp_path):
+    """Batches from the cache are the same as from the dataset"""
+    config = MiniMaskConfig()
+    cache = modellib.SampleCache(str(tmp_path), dataset, config)
+    cache.build(verbose=0)
+    cached = modellib.DataGenerator(dataset, config, seed=2, cache=cache)
+    generator = modellib.DataGenerator(dataset, config, seed=2)
+    for i in range(3):
+        for a, b in zip(cached[i][0], generator[i][0]):
+            np.testing.assert_array_equal(a, b)
+    with pytest.raises(AssertionError):
+        modellib.DataGenerator(dataset, config, augmentation=object(), cache=cache)
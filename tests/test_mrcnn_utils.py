@@ -0,0 +1,391 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from mrcnn import utils
+
+
+def random_masks(rng, count, height=64, width=80):
+    """Create random instance masks and their bounding boxes"""
+    masks = np.zeros((height, width, count), dtype=bool)
+    for i in range(count):
+        y1, x1 = rng.randint(0, height - 24), rng.randint(0, width - 30)
+        y2, x2 = y1 + rng.randint(3, 24), x1 + rng.randint(3, 30)
+        masks[y1:y2, x1:x2, i] = rng.rand(y2 - y1, x2 - x1) > 0.3
+    return utils.extract_bboxes(masks), masks
+
+
+def test_sparse_masks_round_trip():
+    """Cropping masks to their boxes and pasting them back is lossless"""
+    boxes, masks = random_masks(np.random.RandomState(0), 6)
+    sparse = utils.dense_to_sparse_masks(boxes, masks)
+    assert len(sparse) == 6
+    for (y1, x1, y2, x2), m in zip(boxes, sparse):
+        assert m.shape == (y2 - y1, x2 - x1)
+    dense = utils.sparse_to_dense_masks(boxes, sparse, masks.shape)
+    np.testing.assert_array_equal(dense, masks)
+
+
+def test_sparse_mask_overlaps_match_dense():
+    """Sparse mask IoU matches the dense implementation"""
+    rng = np.random.RandomState(1)
+    boxes1, masks1 = random_masks(rng, 7)
+    boxes2, masks2 = random_masks(rng, 5)
+    expected = utils.compute_overlaps_masks(masks1, masks2)
+    overlaps = utils.compute_overlaps_sparse_masks(
+        boxes1, utils.dense_to_sparse_masks(boxes1, masks1),
+        boxes2, utils.dense_to_sparse_masks(boxes2, masks2))
+    np.testing.assert_allclose(overlaps, expected, atol=1e-6)
+
+
+def test_compute_ap_accepts_sparse_masks():
+    """compute_ap() gives the same result for dense and sparse masks"""
+    rng = np.random.RandomState(2)
+    gt_boxes, gt_masks = random_masks(rng, 5)
+    class_ids = np.arange(5) % 3 + 1
+    scores = rng.rand(5)
+    dense_ap = utils.compute_ap(gt_boxes, class_ids, gt_masks,
+                                gt_boxes, class_ids, scores, gt_masks)[0]
+    sparse_ap = utils.compute_ap(
+        gt_boxes, class_ids, utils.dense_to_sparse_masks(gt_boxes, gt_masks),
+        gt_boxes, class_ids, scores, utils.dense_to_sparse_masks(gt_boxes, gt_masks))[0]
+    assert dense_ap == pytest.approx(1.0)
+    assert sparse_ap == pytest.approx(dense_ap)
+
+
+def test_unmold_masks_matches_unmold_mask():
+    """Batched unmolding matches resizing each mask with skimage"""
+    rng = np.random.RandomState(3)
+    masks = rng.rand(6, 28, 28).astype(np.float32)
+    boxes = np.array([[0, 0, 10, 12], [5, 7, 60, 40], [20, 30, 21, 31],
+                      [3, 50, 64, 80], [10, 10, 14, 70], [40, 2, 63, 9]])
+    expected = np.zeros((64, 80, 6), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        expected[y1:y2, x1:x2, i] = utils.resize(masks[i], (y2 - y1, x2 - x1)) >= 0.5
+    np.testing.assert_array_equal(utils.unmold_masks(masks, boxes, (64, 80)), expected)
+    crops = utils.unmold_masks(masks, boxes, sparse=True)
+    np.testing.assert_array_equal(utils.sparse_to_dense_masks(boxes, crops, (64, 80)), expected)
+
+
+def reference_non_max_suppression(boxes, scores, threshold):
+    """The one box at a time NMS that utils.non_max_suppression() replaced"""
+    if boxes.dtype.kind != "f":
+        boxes = boxes.astype(np.float32)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ixs = scores.argsort()[::-1]
+    pick = []
+    while len(ixs) > 0:
+        i = ixs[0]
+        pick.append(i)
+        iou = utils.compute_iou(boxes[i], boxes[ixs[1:]], area[i], area[ixs[1:]])
+        ixs = np.delete(ixs, np.where(iou > threshold)[0] + 1)
+        ixs = np.delete(ixs, 0)
+    return np.array(pick, dtype=np.int32)
+
+
+def clustered_boxes(rng, count, clusters=20, size=512):
+    """Integer boxes jittered around a few cluster centers, so many overlap"""
+    centers = rng.randint(0, size, (clusters, 2))[rng.randint(0, clusters, count)]
+    centers = centers + rng.randint(-10, 10, (count, 2))
+    half = rng.randint(4, 40, (count, 2))
+    return np.concatenate([centers - half, centers + half], axis=1)
+
+
+@pytest.mark.parametrize("count,block_size", [(1, 256), (300, 256), (1000, 64), (2000, 7)])
+def test_non_max_suppression_matches_reference(count, block_size):
+    """Blocked NMS picks the same boxes, in the same order"""
+    rng = np.random.RandomState(count)
+    boxes = clustered_boxes(rng, count)
+    # Rounded scores make ties, which must be broken the same way
+    scores = np.round(rng.rand(count), 2)
+    for threshold in (0.3, 0.7):
+        expected = reference_non_max_suppression(boxes, scores, threshold)
+        pick = utils.non_max_suppression(boxes, scores, threshold,
+                                         block_size=block_size, max_pairs=1000)
+        assert pick.dtype == np.int32
+        np.testing.assert_array_equal(pick, expected)
+    # Float boxes, including some without area
+    boxes = boxes.astype(np.float64) / 7
+    boxes[::50, 2] = boxes[::50, 0]
+    np.testing.assert_array_equal(utils.non_max_suppression(boxes, scores, 0.5),
+                                  reference_non_max_suppression(boxes, scores, 0.5))
+
+
+def test_non_max_suppression_per_class():
+    """With class_ids, one call does the NMS of every class"""
+    rng = np.random.RandomState(5)
+    boxes = clustered_boxes(rng, 600, clusters=5)
+    scores = rng.rand(600)
+    class_ids = rng.randint(1, 4, 600)
+    pick = utils.non_max_suppression(boxes, scores, 0.5, class_ids=class_ids)
+    expected = np.concatenate([
+        np.flatnonzero(class_ids == c)[reference_non_max_suppression(
+            boxes[class_ids == c], scores[class_ids == c], 0.5)]
+        for c in (1, 2, 3)])
+    np.testing.assert_array_equal(np.sort(pick), np.sort(expected))
+    # Picks are in score order across classes
+    assert np.all(np.diff(scores[pick]) <= 0)
+
+
+def test_soft_non_max_suppression():
+    """Soft-NMS lowers the scores of overlapping boxes instead of dropping them"""
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [0, 5, 10, 15], [50, 50, 60, 60]])
+    scores = np.array([0.9, 0.8, 0.7, 0.6])
+    pick, new_scores = utils.soft_non_max_suppression(boxes, scores, sigma=0.5)
+    # The duplicate is kept with its score times exp(-1 / sigma)
+    assert set(pick) == {0, 1, 2, 3}
+    assert new_scores[list(pick).index(1)] == pytest.approx(0.8 * np.exp(-1 / 0.5) *
+                                                            np.exp(-(1 / 3) ** 2 / 0.5), rel=1e-5)
+    assert new_scores[list(pick).index(3)] == pytest.approx(0.6)
+    assert np.all(np.diff(new_scores) <= 0)
+    # Linear decay drops the duplicate, whose IoU of 1 leaves it no score,
+    # and lowers the half overlapping box below the separate one
+    pick, _ = utils.soft_non_max_suppression(boxes, scores, threshold=0.3, method="linear")
+    assert list(pick) == [0, 3, 2]
+    # With classes, boxes of other classes keep their scores
+    pick, new_scores = utils.soft_non_max_suppression(
+        boxes, scores, method="linear", class_ids=np.array([1, 2, 1, 1]))
+    assert list(pick) == [0, 1, 3, 2] and new_scores[1] == pytest.approx(0.8)
+
+
+@pytest.mark.parametrize("chunk_size", [65536, 7])
+def test_compute_overlaps_matches_compute_iou(chunk_size):
+    """Chunked overlaps match compute_iou() column by column, dense and sparse"""
+    rng = np.random.RandomState(6)
+    boxes1 = clustered_boxes(rng, 500).astype(np.float64) / 3
+    boxes2 = clustered_boxes(rng, 9)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    expected = np.stack([utils.compute_iou(boxes2[i], boxes1, area2[i], area1)
+                         for i in range(9)], axis=1)
+    overlaps = utils.compute_overlaps(boxes1, boxes2, chunk_size=chunk_size)
+    assert overlaps.dtype == np.float32 and overlaps.shape == (500, 9)
+    np.testing.assert_allclose(overlaps, expected, atol=1e-6)
+    sparse = utils.compute_overlaps(boxes1, boxes2, chunk_size=chunk_size, sparse=True)
+    assert sparse.nnz == np.count_nonzero(expected > 0)
+    np.testing.assert_array_equal(sparse.toarray(), overlaps)
+    assert utils.compute_overlaps(boxes1[:0], boxes2, sparse=True).shape == (0, 9)
+
+
+def reference_compute_overlaps_masks(masks1, masks2):
+    """The dense matrix product that utils.compute_overlaps_masks() replaced"""
+    masks1 = np.reshape(masks1 > .5, (-1, masks1.shape[-1])).astype(np.float32)
+    masks2 = np.reshape(masks2 > .5, (-1, masks2.shape[-1])).astype(np.float32)
+    area1, area2 = np.sum(masks1, axis=0), np.sum(masks2, axis=0)
+    intersections = np.dot(masks1.T, masks2)
+    return intersections / (area1[:, None] + area2[None, :] - intersections)
+
+
+def test_compute_overlaps_masks_matches_reference():
+    """Bit-packed mask IoU matches the dense matrix product"""
+    rng = np.random.RandomState(7)
+    _, masks1 = random_masks(rng, 12, height=61, width=77)
+    _, masks2 = random_masks(rng, 9, height=61, width=77)
+    # Overlapping pairs, and masks touching the image edges
+    masks2[..., 0] = masks1[..., 0]
+    masks2[-5:, -9:, 1] = True
+    overlaps = utils.compute_overlaps_masks(masks1, masks2)
+    assert overlaps.dtype == np.float32 and overlaps.shape == (12, 9)
+    np.testing.assert_allclose(overlaps, reference_compute_overlaps_masks(masks1, masks2),
+                               atol=1e-6)
+    assert overlaps[0, 0] == pytest.approx(1.0)
+    # Soft masks are binarized at 0.5
+    soft = masks1 * rng.uniform(0.2, 1, masks1.shape).astype(np.float32)
+    np.testing.assert_allclose(utils.compute_overlaps_masks(soft, masks2),
+                               reference_compute_overlaps_masks(soft, masks2), atol=1e-6)
+    # Empty masks overlap nothing
+    masks1[..., 3] = False
+    assert not utils.compute_overlaps_masks(masks1, masks2)[3].any()
+
+
+def reference_matches(overlaps, pred_class_ids, gt_class_ids, iou_threshold):
+    """The greedy matching loop of compute_matches(), one threshold at a
+    time, on predictions sorted by score
+    """
+    pred_match = -1 * np.ones([overlaps.shape[0]])
+    gt_match = -1 * np.ones([overlaps.shape[1]])
+    for i in range(overlaps.shape[0]):
+        for j in np.argsort(overlaps[i])[::-1]:
+            if gt_match[j] > -1:
+                continue
+            if overlaps[i, j] < iou_threshold:
+                break
+            if pred_class_ids[i] == gt_class_ids[j]:
+                gt_match[j] = i
+                pred_match[i] = j
+                break
+    return gt_match, pred_match
+
+
+def test_compute_matches_range_matches_reference():
+    """Matching all thresholds at once matches each threshold on its own"""
+    rng = np.random.RandomState(8)
+    gt_boxes, gt_masks = random_masks(rng, 8)
+    pred_boxes, pred_masks = random_masks(rng, 10)
+    # Predictions that overlap the GT boxes by various amounts
+    pred_masks[..., :4] = gt_masks[..., :4]
+    pred_masks[:30, :, 1] = False
+    pred_boxes = utils.extract_bboxes(pred_masks)
+    gt_class_ids = rng.randint(1, 3, 8)
+    pred_class_ids = np.concatenate([gt_class_ids[:4], rng.randint(1, 3, 6)])
+    scores = np.round(rng.rand(10), 1)
+    thresholds = np.arange(0.5, 1.0, 0.05)
+    gt_match, pred_match, overlaps, indices = utils.compute_matches_range(
+        gt_boxes, gt_class_ids, gt_masks, pred_boxes, pred_class_ids, scores, pred_masks,
+        thresholds)
+    assert gt_match.shape == (10, 8) and pred_match.shape == (10, 10)
+    np.testing.assert_array_equal(indices, np.argsort(scores)[::-1])
+    np.testing.assert_allclose(overlaps, utils.compute_overlaps_masks(
+        pred_masks[..., indices], gt_masks), atol=1e-6)
+    for t, threshold in enumerate(thresholds):
+        expected = reference_matches(overlaps, pred_class_ids[indices], gt_class_ids, threshold)
+        np.testing.assert_array_equal(gt_match[t], expected[0])
+        np.testing.assert_array_equal(pred_match[t], expected[1])
+        np.testing.assert_array_equal(utils.compute_matches(
+            gt_boxes, gt_class_ids, gt_masks, pred_boxes, pred_class_ids, scores, pred_masks,
+            threshold)[1], expected[1])
+    assert np.sum(pred_match[0] > -1) >= 3
+
+
+def reference_minimize_mask(bbox, mask, mini_shape):
+    """The per-instance resize() loop of minimize_mask(), with crops cast
+    to float as skimage < 0.19 did for bool images
+    """
+    mini_mask = np.zeros(mini_shape + (mask.shape[-1],), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(bbox):
+        m = mask[y1:y2, x1:x2, i].astype(bool).astype(np.float64)
+        mini_mask[:, :, i] = np.around(utils.resize(m, mini_shape)).astype(bool)
+    return mini_mask
+
+
+def reference_expand_mask(bbox, mini_mask, image_shape):
+    """The per-instance resize() loop of expand_mask()"""
+    mask = np.zeros(image_shape[:2] + (mini_mask.shape[-1],), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(bbox):
+        m = utils.resize(mini_mask[:, :, i].astype(np.float64), (y2 - y1, x2 - x1))
+        mask[y1:y2, x1:x2, i] = np.around(m).astype(bool)
+    return mask
+
+
+@pytest.mark.parametrize("mini_shape", [(56, 56), (13, 40)])
+def test_mini_masks_match_resize(mini_shape):
+    """Batched bboxes and mini masks are bit-identical to the loops"""
+    rng = np.random.RandomState(9)
+    _, masks = random_masks(rng, 12, height=97, width=131)
+    masks = masks.astype(np.uint8)
+    # Masks that fill their box, a striped one and an empty one
+    masks[..., 0] = 0
+    masks[10:60, 5:9, 0] = 1
+    masks[..., 1] = 0
+    masks[3:90, 7:120, 1] = (np.arange(113) % 3 == 0)
+    masks[..., 2] = 0
+    boxes = utils.extract_bboxes(masks)
+    expected = np.zeros_like(boxes)
+    for i in range(masks.shape[-1]):
+        ys, xs = np.where(masks[:, :, i])
+        if ys.size:
+            expected[i] = ys.min(), xs.min(), ys.max() + 1, xs.max() + 1
+    np.testing.assert_array_equal(boxes, expected)
+    assert boxes.dtype == np.int32
+
+    boxes, masks = np.delete(boxes, 2, axis=0), np.delete(masks, 2, axis=-1)
+    mini = utils.minimize_mask(boxes, masks, mini_shape)
+    assert mini.shape == mini_shape + (11,) and mini.dtype == bool
+    np.testing.assert_array_equal(mini, reference_minimize_mask(boxes, masks, mini_shape))
+    assert mini[..., 0].all()
+    np.testing.assert_array_equal(utils.expand_mask(boxes, mini, masks.shape),
+                                  reference_expand_mask(boxes, mini, masks.shape))
+    soft = rng.rand(*mini.shape)
+    np.testing.assert_array_equal(utils.expand_mask(boxes, soft, masks.shape),
+                                  reference_expand_mask(boxes, soft, masks.shape))
+    with pytest.raises(Exception):
+        utils.minimize_mask(np.array([[5, 5, 5, 9]]), masks[..., :1], mini_shape)
+
+
+def smooth_image(rng, height, width):
+    """A uint8 RGB image of random blobs"""
+    small = rng.randint(0, 256, (height // 8, width // 8, 3)).astype(np.float64)
+    return np.clip(utils.resize(small, (height, width), preserve_range=True), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("shape,mode", [((300, 400, 3), "square"), ((1500, 1200, 3), "square"),
+                                        ((300, 400, 3), "pad64")])
+def test_opencv_resize_image_matches_skimage(shape, mode):
+    """OpenCV resizing agrees with skimage within a level inside the window"""
+    image = smooth_image(np.random.RandomState(0), *shape[:2])
+    expected = utils.resize_image(image, min_dim=512, max_dim=512, mode=mode)
+    resized = utils.resize_image(image, min_dim=512, max_dim=512, mode=mode, backend="opencv")
+    assert resized[0].shape == expected[0].shape and resized[0].dtype == np.uint8
+    assert resized[1:] == expected[1:]
+    # skimage blends the outermost pixels with zeros, so skip them
+    y1, x1, y2, x2 = expected[1]
+    diff = np.abs(resized[0].astype(int) - expected[0])[y1 + 1:y2 - 1, x1 + 1:x2 - 1]
+    assert diff.max() <= 1
+    # Padding is still zeros
+    assert resized[0].sum() == resized[0][y1:y2, x1:x2].sum()
+
+
+@pytest.mark.parametrize("scale", [0.6, 1.28, 2])
+def test_opencv_resize_mask_matches_skimage(scale):
+    """Nearest neighbor masks only differ from zoom() at some edge pixels"""
+    boxes, _ = random_masks(np.random.RandomState(1), 20, height=120, width=160)
+    masks = np.zeros((120, 160, 20), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        masks[y1:y2, x1:x2, i] = True
+    padding = [(3, 5), (0, 2), (0, 0)]
+    expected = utils.resize_mask(masks, scale, padding)
+    resized = utils.resize_mask(masks, scale, padding, backend="opencv")
+    assert resized.shape == expected.shape and resized.dtype == bool
+    assert np.sum(resized != expected) <= 0.05 * np.sum(expected)
+    diff = utils.extract_bboxes(resized) - utils.extract_bboxes(expected)
+    assert np.abs(diff).max() <= 1
+
+
+def test_opencv_resize_many_channels():
+    """Masks with more instances than OpenCV's channel limit are resized in groups"""
+    rng = np.random.RandomState(2)
+    masks = (rng.rand(12, 10, 600) > 0.5).astype(np.uint8)
+    resized = utils.resize_mask(masks, 2, [(0, 0)] * 3, backend="opencv")
+    assert resized.shape == (24, 20, 600) and resized.dtype == np.uint8
+    np.testing.assert_array_equal(resized, masks.repeat(2, axis=0).repeat(2, axis=1))
+    assert utils.resize_mask(masks[..., :0], 2, [(0, 0)] * 3, backend="opencv").shape == (24, 20, 0)
+
+
+def test_opencv_resize_matches_skimage():
+    """resize() returns the same floats away from the edges"""
+    rng = np.random.RandomState(3)
+    image = rng.rand(28, 30)
+    for shape in [(70, 50), (11, 13)]:
+        expected = utils.resize(image, shape)
+        resized = utils.resize(image, shape, backend="opencv")
+        assert resized.shape == shape and resized.dtype == np.float64
+        np.testing.assert_allclose(resized[2:-2, 2:-2], expected[2:-2, 2:-2], atol=1e-9)
+    # Like skimage, bool and uint8 inputs are scaled to [0, 1]
+    mask = rng.rand(20, 20) > 0.5
+    np.testing.assert_array_equal(utils.resize(mask, (40, 40), order=0, backend="opencv"),
+                                  mask.repeat(2, axis=0).repeat(2, axis=1))
+    assert utils.resize(np.full((4, 4), 255, np.uint8), (8, 8), backend="opencv").max() == 1
+    with pytest.raises(ValueError):
+        utils.resize(image, (10, 10), order=3, backend="opencv")
+    with pytest.raises(ValueError):
+        utils.resize(image, (10, 10), backend="pillow")
+
+
+def test_update_hash_is_canonical():
+    """Hashes depend on contents, not on dict order or array memory layout"""
+    import hashlib
+
+    def digest(value):
+        d = hashlib.sha1()
+        utils.update_hash(d, value)
+        return d.hexdigest()
+
+    array = np.arange(12, dtype=np.int32).reshape(3, 4)
+    value = {"b": [1, 2.5, None], "a": (array, "x", True)}
+    assert digest(value) == digest({"a": (np.asfortranarray(array), "x", True), "b": [1, 2.5, None]})
+    assert digest(value) != digest({"a": (array.astype(np.int64), "x", True), "b": [1, 2.5, None]})
+    assert digest(value) != digest({"a": (array.reshape(4, 3), "x", True), "b": [1, 2.5, None]})
+    assert digest([1]) != digest(["1"]) and digest([1, 2]) != digest([[1, 2]])
+    with pytest.raises(TypeError):
+        digest(object())
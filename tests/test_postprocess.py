@@ -0,0 +1,46 @@
+import numpy as np
+
+from app.floorplan.postprocess import (
+    build_elements, largest_contour, simplify_contour, snap_to_rectangle
+)
+
+
+def noisy_wall_result():
+    """Create a detection result with one wall that has a jagged edge"""
+    mask = np.zeros((40, 200), dtype=bool)
+    mask[10:30, 5:195] = True
+    mask[29, 5:195:2] = False
+    return {
+        'rois': np.array([[0, 0, 40, 200]]),
+        'class_ids': np.array([1]),
+        'scores': np.array([0.9]),
+        'masks': [mask],
+    }
+
+
+def test_simplify_contour_reduces_vertices():
+    """Douglas-Peucker simplification drops the noise vertices"""
+    r = noisy_wall_result()
+    contour = largest_contour(r['masks'][0])
+    simplified = simplify_contour(contour, 1.5)
+    assert len(simplified) < len(contour)
+    assert len(simplified) <= 6
+    np.testing.assert_array_equal(simplify_contour(contour, 0), contour)
+
+
+def test_snap_to_rectangle():
+    """Snapping returns the axis-aligned bounding rectangle"""
+    contour = np.array([[2, 3], [10, 4], [11, 9], [3, 8]])
+    np.testing.assert_array_equal(
+        snap_to_rectangle(contour), [[2, 3], [11, 3], [11, 9], [2, 9]])
+
+
+def test_build_elements_offsets_cropped_masks():
+    """Contours of box-cropped masks are returned in image coordinates"""
+    r = noisy_wall_result()
+    r['rois'] = np.array([[100, 50, 140, 250]])
+    elements = build_elements(r, tolerance=0, snap_walls=True)
+    wall = elements["walls"][0]
+    assert wall["bbox"] == [50, 100, 250, 140]
+    assert wall["contour"] == [[55, 110], [244, 110], [244, 129], [55, 129]]
+    assert elements["windows"] == [] and elements["doors"] == []
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+
+from app.floorplan.render import label_map, render_instances
+
+CLASS_NAMES = ['BG', 'Wall', 'Window', 'Door']
+
+
+def two_instances():
+    """Two overlapping instances, as box-cropped masks"""
+    boxes = np.array([[10, 10, 30, 50], [20, 40, 60, 60]])
+    masks = [np.ones((20, 40), dtype=bool), np.ones((40, 20), dtype=bool)]
+    return boxes, masks, np.array([1, 3]), np.array([0.9, 0.8])
+
+
+def test_label_map_dense_and_sparse_agree():
+    """Later instances are drawn on top, for both mask forms"""
+    boxes, masks, _, _ = two_instances()
+    dense = np.zeros((64, 64, 2), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        dense[y1:y2, x1:x2, i] = masks[i]
+    labels = label_map((64, 64), boxes, masks)
+    np.testing.assert_array_equal(labels, label_map((64, 64), boxes, dense))
+    assert labels[15, 15] == 1
+    assert labels[25, 45] == 2
+    assert labels[0, 0] == 0
+
+
+def test_render_instances_blends_masks():
+    """Masks are blended with their colors and the input is not modified"""
+    image = np.full((64, 64, 3), 200, dtype=np.uint8)
+    boxes, masks, class_ids, scores = two_instances()
+    output = render_instances(image, boxes, masks, class_ids, CLASS_NAMES, scores,
+                              show_bbox=False, show_caption=False,
+                              colors=[(1, 0, 0), (0, 0, 1)])
+    assert output.shape == image.shape and output.dtype == np.uint8
+    assert (image == 200).all()
+    # Colors are RGB, the image is BGR
+    np.testing.assert_array_equal(output[15, 15], [100, 100, 227])
+    np.testing.assert_array_equal(output[45, 50], [227, 100, 100])
+    np.testing.assert_array_equal(output[0, 0], [200, 200, 200])
+
+
+def test_render_instances_options():
+    """Nothing is drawn when all options are off"""
+    image = np.full((64, 64, 3), 200, dtype=np.uint8)
+    boxes, masks, class_ids, scores = two_instances()
+    output = render_instances(image, boxes, masks, class_ids, CLASS_NAMES, scores,
+                              show_mask=False, show_bbox=False, show_caption=False)
+    np.testing.assert_array_equal(output, image)
+    empty = render_instances(image, np.zeros((0, 4)), [], np.zeros(0, int), CLASS_NAMES)
+    np.testing.assert_array_equal(empty, image)
+
+
+def test_render_instances_array_options():
+    """Colors and captions can be NumPy arrays"""
+    image = np.full((64, 64, 3), 200, dtype=np.uint8)
+    boxes, masks, class_ids, scores = two_instances()
+    colors = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+    output = render_instances(image, boxes, masks, class_ids, CLASS_NAMES, scores,
+                              colors=colors, captions=np.array(["a", "b"]))
+    expected = render_instances(image, boxes, masks, class_ids, CLASS_NAMES, scores,
+                                colors=colors.tolist(), captions=["a", "b"])
+    np.testing.assert_array_equal(output, expected)
+
+
+def test_concurrent_overlay_renders(tmp_path):
+    """Concurrent first renders of an overlay don't share a temporary file"""
+    import cv2
+    from concurrent.futures import ThreadPoolExecutor
+    from app.floorplan.results import render_overlay, save_detections
+
+    image_path = str(tmp_path / "plan.png")
+    cv2.imwrite(image_path, np.full((64, 64, 3), 200, dtype=np.uint8))
+    boxes, masks, class_ids, scores = two_instances()
+    r = {'rois': boxes, 'masks': masks, 'class_ids': class_ids, 'scores': scores}
+    detections_path = str(tmp_path / "plan_detections.npz")
+    save_detections(detections_path, r, image_path)
+    output_path = str(tmp_path / "plan_detected.jpg")
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: render_overlay(detections_path, output_path), range(16)))
+    assert cv2.imread(output_path).shape == (64, 64, 3)
+    assert sorted(os.listdir(str(tmp_path))) == \
+        ["plan.png", "plan_detected.jpg", "plan_detections.npz"]
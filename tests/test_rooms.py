@@ -0,0 +1,40 @@
+import numpy as np
+
+from app.floorplan.rooms import segment_rooms
+
+
+def two_room_plan(door_class=3):
+    """A square plan split in two by an inner wall with a doorway"""
+    rects = [(100, 100, 112, 900), (100, 100, 900, 112), (100, 888, 900, 900),
+             (888, 100, 900, 900), (100, 500, 400, 510), (440, 500, 900, 510),
+             (400, 495, 440, 515)]
+    return {
+        'rois': np.array(rects),
+        'class_ids': np.array([1] * 6 + [door_class]),
+        'scores': np.ones(len(rects)),
+        'masks': [np.ones((y2 - y1, x2 - x1), dtype=bool) for y1, x1, y2, x2 in rects],
+    }
+
+
+def test_doors_separate_rooms():
+    """Doors close the doorway, so the plan has two rooms"""
+    rooms = segment_rooms(two_room_plan(), shape=(1024, 1024), scale=0.01)
+    assert len(rooms) == 2
+    assert rooms[0]["area"] >= rooms[1]["area"]
+    left = min(rooms, key=lambda room: room["centroid"][0])
+    assert left["bbox"] == [112, 112, 500, 888]
+    np.testing.assert_allclose(left["centroid"], [305.5, 499.5], atol=1)
+    assert left["area_m2"] == round(left["area"] * 0.0001, 2)
+    xs, ys = np.array(left["polygon"]).T
+    assert xs.min() == 112 and ys.min() == 112
+
+
+def test_wide_gaps_join_rooms():
+    """Without the door, the 40 px doorway connects the two halves"""
+    r = two_room_plan()
+    r['class_ids'][-1] = 0
+    assert len(segment_rooms(r, shape=(1024, 1024), gap=15)) == 1
+    assert len(segment_rooms(r, shape=(1024, 1024), gap=45)) == 2
+    # The outside is never a room
+    assert segment_rooms({'rois': np.zeros((0, 4)), 'class_ids': [], 'masks': []},
+                         shape=(64, 64)) == []
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.floorplan.spatial import ElementIndex, RTree, box_distance, intersects
+
+
+def random_boxes(count, seed=0):
+    """Random (x1, y1, x2, y2) boxes on a 4000x4000 plan"""
+    rng = np.random.default_rng(seed)
+    corners = rng.uniform(0, 4000, (count, 2))
+    return np.concatenate([corners, corners + rng.uniform(1, 80, (count, 2))], axis=1)
+
+
+def test_rtree_matches_brute_force():
+    """Window and nearest queries agree with a linear scan"""
+    rng = np.random.default_rng(1)
+    for count in [0, 1, 7, 33, 2000]:
+        boxes = random_boxes(count)
+        tree = RTree(boxes, node_size=8)
+        for _ in range(20):
+            x1, x2 = np.sort(rng.uniform(0, 4000, 2))
+            y1, y2 = np.sort(rng.uniform(0, 4000, 2))
+            expected = np.nonzero(intersects(boxes, (x1, y1, x2, y2)))[0]
+            np.testing.assert_array_equal(tree.search((x1, y1, x2, y2)), expected)
+
+            x, y = rng.uniform(0, 4000, 2)
+            found = tree.nearest((x, y), k=5)
+            distances = np.sort(box_distance(boxes, (x, y, x, y)))[:5]
+            np.testing.assert_allclose([d for _, d in found], distances)
+
+
+def test_element_index_adjacency():
+    """Doors and windows are matched to the walls they touch"""
+    wall = {"type": "Wall", "confidence": 0.9, "contour": []}
+    elements = {
+        "walls": [dict(wall, bbox=[0, 0, 100, 10]), dict(wall, bbox=[0, 0, 10, 100])],
+        "windows": [{"type": "Window", "confidence": 0.9, "bbox": [40, 8, 60, 12], "contour": []}],
+        "doors": [{"type": "Door", "confidence": 0.9, "bbox": [13, 50, 20, 70], "contour": []}],
+    }
+    index = ElementIndex(elements)
+    assert index.adjacency() == [
+        {"group": "windows", "index": 0, "walls": [0]},
+        {"group": "doors", "index": 0, "walls": []},
+    ]
+    assert index.adjacency(max_distance=3)[1]["walls"] == [1]
+    assert [o["group"] for o in index.adjacency(max_distance=3, wall=1)] == ["doors"]
+
+    hits = index.query((45, 0, 50, 5))
+    assert [(e["group"], e["index"]) for e in hits] == [("walls", 0)]
+    nearest = index.nearest((30, 60), k=1, groups=["walls", "windows"])
+    assert (nearest[0]["group"], nearest[0]["index"], nearest[0]["distance"]) == ("walls", 1, 20)
@@ -0,0 +1,59 @@
+import numpy as np
+
+from app.floorplan.vectorize import junction_graph, merge_collinear, vectorize_walls
+
+
+def walls_result(rects):
+    """A detection result with one solid wall per (y1, x1, y2, x2) rect"""
+    return {
+        'rois': np.array(rects),
+        'class_ids': np.ones(len(rects), dtype=np.int32),
+        'scores': np.ones(len(rects)),
+        'masks': [np.ones((y2 - y1, x2 - x1), dtype=bool) for y1, x1, y2, x2 in rects],
+    }
+
+
+def test_merge_collinear():
+    """Overlapping and nearly touching pieces of one line become one segment"""
+    segments = np.array([[0, 0, 50, 0], [40, 1, 100, 1], [103, 0, 150, 0],
+                         [0, 10, 0, 60]], dtype=np.float64)
+    merged = merge_collinear(segments, np.deg2rad(5), 3, 5)
+    assert len(merged) == 2
+    horizontal = merged[np.abs(merged[:, 2] - merged[:, 0]).argmax()]
+    assert sorted([horizontal[0], horizontal[2]]) == [0, 150]
+
+
+def test_junction_graph_splits_t_junctions():
+    """Corners share nodes and a wall ending on another one splits it"""
+    segments = np.array([[0, 0, 100, 0], [1, 1, 1, 100], [50, 2, 50, 100]], dtype=np.float64)
+    nodes, edges = junction_graph(segments, 4)
+    assert len(nodes) == 5
+    assert len(edges) == 4
+    # One corner, one T-junction and three free ends
+    degree = np.bincount(edges.ravel(), minlength=len(nodes))
+    assert sorted(degree.tolist()) == [1, 1, 1, 2, 3]
+    np.testing.assert_allclose(nodes[degree == 3][0], [50, 0], atol=1e-6)
+    np.testing.assert_allclose(nodes[degree == 2][0], [1, 0], atol=1e-6)
+
+
+def test_vectorize_walls_room():
+    """A rectangular room split by an inner wall gives a closed graph"""
+    r = walls_result([(100, 100, 112, 900), (100, 100, 900, 112), (100, 888, 900, 900),
+                      (888, 100, 900, 900), (100, 500, 900, 510)])
+    graph = vectorize_walls(r, shape=(1024, 1024))
+    nodes = np.array(graph["nodes"])
+    assert len(nodes) == 6
+    assert len(graph["segments"]) == 7
+    # Nodes lie on the wall centerlines
+    for x, y in nodes:
+        assert min(abs(x - c) for c in (106, 505, 894)) <= 2
+        assert min(abs(y - c) for c in (106, 894)) <= 2
+    for segment in graph["segments"]:
+        assert 9 <= segment["thickness"] <= 13
+
+
+def test_vectorize_walls_without_walls():
+    """Results without walls give an empty graph"""
+    r = walls_result([(0, 0, 10, 10)])
+    r['class_ids'] = np.array([3])
+    assert vectorize_walls(r) == {"nodes": [], "segments": []}
@@ -99,27 +99,33 @@ def generate_json(masks, class_ids, scores, rois, class_names):
     
     return output
 
-# Process all images in the val folder
-for image_name in os.listdir(val_folder_path):
-    image_path = os.path.join(val_folder_path, image_name)
-
-    # Check if it's an image
-    if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-        print(f"Skipping non-image file: {image_name}")
-        continue
-
-    # Load the image
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Failed to load image at path: {image_path}")
-        continue
-
-    # Convert to RGB for processing
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-    # Perform detection
-    results = model.detect([image_rgb], verbose=1)
-    r = results[0]
+# Load all images in the val folder. Images are loaded lazily, as
+# detect_many() asks for them, and kept until their results come back.
+loaded_images = []
+
+def load_val_images():
+    for image_name in os.listdir(val_folder_path):
+        image_path = os.path.join(val_folder_path, image_name)
+
+        # Check if it's an image
+        if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            print(f"Skipping non-image file: {image_name}")
+            continue
+
+        # Load the image
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Failed to load image at path: {image_path}")
+            continue
+
+        # Convert to RGB for processing
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        loaded_images.append((image_name, image_rgb))
+        yield image_rgb
+
+# Perform detection in batches, results come back in the same order
+for r in model.detect_many(load_val_images(), verbose=1):
+    image_name, image_rgb = loaded_images.pop(0)
 
     # Generate the fabric-like JSON for detection results
     json_data = generate_json(r['masks'], r['class_ids'], r['scores'], r['rois'], class_names)